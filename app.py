@@ -1,25 +1,53 @@
 import base64
+import hashlib
 import json
 import mimetypes
 import os
 import re
 import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from urllib.parse import parse_qs, urlparse
 
-import google.generativeai as genai
 import markdown
 from dotenv import load_dotenv
-from flask import Flask, flash, redirect, render_template, request, url_for
+from flask import Flask, Response, flash, jsonify, redirect, render_template, request, url_for
 from google.cloud import texttospeech
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from utils.admission import (BULK, INTERACTIVE, LANES, AdmissionController,
+                             AdmissionRejected, PriorityGate)
+from utils.backend import SUMMARY_QUEUE, get_backend, single_flight
+from utils.batch_api import (SUCCEEDED, BatchClient, batch_model, batch_state, load_manifest, manifest_path,
+                             pack_requests, reconcile, result_keys, save_manifest)
+from utils.context_cache import API_BASE, ContextCache, GeminiRestClient
+from utils.digest import build_digest_prompt, cluster_videos, compact_summary, digest_period, link_video_refs
+from utils.entity_index import EntityIndex, default_extractor, entity_prompt_block, summarize_mentions
+from utils.jobs import Job, JobCancelled, cancel_job, create_job, finish_job, get_job
+from utils.live import LiveSession, format_offset
+from utils.model_router import estimate_tokens, record_route, route
+from utils.near_dup import NearDuplicateIndex
+from utils.search_index import SearchIndex
+from utils.text_normalize import TextNormalizer, parse_steps
+from utils.transcript import Transcript, chapter_index_md, deep_link, link_timestamps
+from utils.transcript_store import TranscriptArchive
+from utils.tsukkomi import (TSUKKOMI_GENRE, TSUKKOMI_LABEL, TSUKKOMI_PREFILTER, TSUKKOMI_PREFILTER_MIN_LINES,
+                            TSUKKOMI_ROUTING, build_tsukkomi_prompt, prefilter_lines)
+from utils.usage_ledger import (GROUP_COLUMNS, UsageLedger, cached_token_count, gemini_cost, gemini_usage,
+                                tts_cost)
+from utils.video_meta import (CAPTION_LANGS, PENDING_LIVE_STATUSES, build_metadata_cmd, caption_track_args,
+                              choose_caption_track, format_upload_date, info_json_path, summarize_info)
 
 # --- 設定 ---
 TTS_VOICE_NAME = "ja-JP-Standard-B"
@@ -50,6 +78,107 @@ if not (GEMINI_API_KEY_PRIMARY or GEMINI_API_KEY):
 CAPTIONS_DIR = Path.home() / "YouTubeInsightGen_venv" / "captions"
 CAPTIONS_DIR.mkdir(exist_ok=True)
 
+# 共有バックエンド（ジョブキュー・字幕/要約キャッシュ・重複防止ロック）
+# 複数ノードで動かす場合は SUMMARY_BACKEND=redis://... を全ノードに設定する
+BACKEND = get_backend()
+TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", 7 * 24 * 3600))
+LIVE_TRANSCRIPT_CACHE_TTL = int(os.getenv("LIVE_TRANSCRIPT_CACHE_TTL", 300))  # 配信中など字幕が未確定の間
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", 24 * 3600))  # 再生中の配信状態などが変わるため短め
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+DELIVERY_DEDUP_TTL = int(os.getenv("DELIVERY_DEDUP_TTL", 600))  # 同じ動画のメールを重複送信しない期間（秒）
+
+# 字幕・要約の全文検索インデックス（処理した動画を順次登録）
+SEARCH_INDEX = SearchIndex(Path(os.getenv("SEARCH_DB", Path.home() / "YouTubeInsightGen_venv" / "search.db")))
+
+# 取得した字幕を .ytt（圧縮ブロック + 時刻索引）で保存し、キャッシュ切れ後も yt-dlp を呼ばずに再利用する
+TRANSCRIPT_ARCHIVE = TranscriptArchive(
+    Path(os.getenv("TRANSCRIPT_ARCHIVE_DIR", Path.home() / "YouTubeInsightGen_venv" / "transcripts"))
+) if os.getenv("TRANSCRIPT_ARCHIVE", "1") == "1" else None
+
+# Gemini に渡す前の字幕の正規化（フィラー・[音楽] などの除去、全角英数の半角化、空白の整理）
+# TEXT_NORMALIZE で工程を選ぶ（fillers,noise,width,spaces / all / 空で無効）。EXTRA_FILLERS で消す語を追加できる
+TEXT_NORMALIZE_STEPS = parse_steps(os.getenv("TEXT_NORMALIZE", "all"))
+TEXT_NORMALIZER = TextNormalizer(
+    TEXT_NORMALIZE_STEPS, extra_fillers=[w.strip() for w in os.getenv("EXTRA_FILLERS", "").split(",") if w.strip()]
+) if TEXT_NORMALIZE_STEPS else None
+
+# 再アップロード・切り抜き動画の検出（字幕の推定 Jaccard 類似度がしきい値以上なら既存の要約を再利用）
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "1") == "1"
+NEAR_DUP = NearDuplicateIndex(
+    Path(os.getenv("NEAR_DUP_DB", Path.home() / "YouTubeInsightGen_venv" / "near_dup.db")),
+    threshold=float(os.getenv("NEAR_DUP_THRESHOLD", 0.8)),
+)
+
+# 字幕中の銘柄・企業名を辞書照合で拾い、言及（時刻付き）を保存する。ENTITY_GENRES のプロンプトには銘柄の一覧を付ける
+# ENTITY_DICT は scripts/build_ticker_dict.py で作った CSV（複数ならパス区切り文字で連結。なければ主要銘柄のみ）
+ENTITY_DICT_PATHS = [Path(p) for p in os.getenv("ENTITY_DICT", "").split(os.pathsep) if p] or [
+    p for p in [Path.home() / "YouTubeInsightGen_venv" / "tickers.csv"] if p.exists()
+]
+ENTITY_EXTRACTOR = default_extractor(ENTITY_DICT_PATHS)
+ENTITY_INDEX = EntityIndex(Path(os.getenv("ENTITY_DB", Path.home() / "YouTubeInsightGen_venv" / "entities.db")))
+ENTITY_GENRES = {g.strip() for g in os.getenv("ENTITY_GENRES", "stock_analyst").split(",") if g.strip()}
+
+# 流入制御: 同時実行数・待機列の長さ・クライアントごとの同時リクエスト数の上限
+ADMISSION = AdmissionController(
+    max_running=int(os.getenv("MAX_RUNNING_JOBS", 2)),
+    max_queued=int(os.getenv("MAX_QUEUED_JOBS", 8)),
+    per_client=int(os.getenv("MAX_JOBS_PER_CLIENT", 2)),
+    max_wait=float(os.getenv("MAX_QUEUE_WAIT", 600)),
+)
+MAX_SHARED_QUEUE_DEPTH = int(os.getenv("MAX_SHARED_QUEUE_DEPTH", 500))
+# リバースプロキシ配下での接続元の判定: 信頼するプロキシの段数（0 なら X-Forwarded-For を無視する）
+# クライアントごとの上限と再送信の検知は接続元アドレスで区別するため、プロキシ経由だと全員が同じクライアントになる
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+# Gemini の同時呼び出し枠。bulk は interactive の待ちがないときだけ枠を使う（重み0）
+GEMINI_GATE = PriorityGate(int(os.getenv("GEMINI_MAX_CONCURRENCY", 4)), {INTERACTIVE: 1, BULK: 0})
+
+# ライブ配信・プレミア公開の逐次要約
+LIVE_POLL_INTERVAL = int(os.getenv("LIVE_POLL_INTERVAL", 120))  # 字幕を取り直す間隔（秒）
+LIVE_MIN_DELTA_CHARS = int(os.getenv("LIVE_MIN_DELTA_CHARS", 400))  # これより短い差分は次回にまとめて要約する
+LIVE_MILESTONE_MINUTES = int(os.getenv("LIVE_MILESTONE_MINUTES", 0))  # 途中経過メールの間隔（配信時間・分、0で無効）
+LIVE_IDLE_POLLS = int(os.getenv("LIVE_IDLE_POLLS", 5))  # 配信状態が取れず新しい字幕もない状態がこの回数続いたら終了
+LIVE_ACTIVE_STATUSES = ("is_live", "is_upcoming")
+LIVE_SESSIONS = threading.BoundedSemaphore(int(os.getenv("MAX_LIVE_SESSIONS", 3)))
+
+# チャプター付きの長い動画はチャプターごとに並列で要約してからまとめる
+CHAPTER_SPLIT_CHARS = int(os.getenv("CHAPTER_SPLIT_CHARS", 30000))
+CHAPTER_CONCURRENCY = int(os.getenv("CHAPTER_CONCURRENCY", 4))
+CHAPTER_OUTPUT_TOKENS = 500  # チャプター単体の要約の出力見込み（モデル選択の見積もり用）
+
+# モデルの自動選択結果（モデル・推定トークン数・推定費用）を実行ごとに記録する
+ROUTING_LOG = Path(os.getenv("ROUTING_LOG", Path.home() / "YouTubeInsightGen_venv" / "model_runs.jsonl"))
+
+# Gemini / TTS の呼び出しごとのトークン数・費用の記録（/usage で集計）
+USAGE_LEDGER = UsageLedger(Path(os.getenv("USAGE_DB", Path.home() / "YouTubeInsightGen_venv" / "usage.db")))
+
+# 同じ動画の字幕を繰り返し送る処理（複数ジャンル・要約のやり直し）では、字幕を Gemini のコンテキストキャッシュに
+# 載せてキャッシュ名で参照する（キャッシュは最初のAPIキーで作るため、その呼び出しもそのキーで行う）
+CONTEXT_CACHE = ContextCache(
+    GeminiRestClient(GEMINI_API_KEY_PRIMARY or GEMINI_API_KEY, os.getenv("GEMINI_API_BASE", API_BASE)),
+    Path(os.getenv("CONTEXT_CACHE_DB", Path.home() / "YouTubeInsightGen_venv" / "context_cache.db")),
+    ttl=int(os.getenv("CONTEXT_CACHE_TTL", 3600)),
+    max_entries=int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", 50)),
+) if os.getenv("CONTEXT_CACHE", "1") == "1" else None
+REST_API_KEY_NAME = "PRIMARY" if GEMINI_API_KEY_PRIMARY else "DEFAULT"
+CACHED_TRANSCRIPT_NOTE = "（文字起こしは、この指示の前に渡したコンテキストにあります）"
+
+# 急がない要約（過去動画のバックフィル）は Gemini Batch API でまとめて投入する（backfill.py）
+BATCH_CLIENT = BatchClient(GEMINI_API_KEY_PRIMARY or GEMINI_API_KEY, os.getenv("GEMINI_API_BASE", API_BASE))
+BATCH_POLL_INTERVAL = int(os.getenv("BATCH_POLL_INTERVAL", 60))  # バッチの状態を確認する間隔（秒）
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 200))  # 1バッチに詰める要求数
+BATCH_TIMEOUT = int(os.getenv("BATCH_TIMEOUT", 26 * 3600))  # API 側の処理期限（24時間）に余裕を持たせる
+# 投入したバッチごとの要求キー一覧（--resume で失敗・期限切れのバッチの動画も復元するため）
+BATCH_DIR = Path(os.getenv("BATCH_DIR", Path.home() / "YouTubeInsightGen_venv" / "batches"))
+
+# 期間内の要約（検索インデックスに保存済みのもの）を1回の Gemini 呼び出しで統合するダイジェスト
+DIGEST_GENRE = os.getenv("DIGEST_GENRE", "stock_analyst")
+DIGEST_MAX_VIDEOS = int(os.getenv("DIGEST_MAX_VIDEOS", 60))
+DIGEST_CACHE_TTL = int(os.getenv("DIGEST_CACHE_TTL", 7 * 24 * 3600))  # 同じ要約の組み合わせなら作り直さない
+DIGEST_OUTPUT_TOKENS = 4000
+
 PROMPTS_FILE = "prompts.json"
 PROMPTS = {}
 
@@ -85,87 +214,92 @@ def clean_youtube_url(url: str) -> str:
     return url
 
 
-def download_captions(youtube_url: str) -> Path:
-    # 新しい字幕ダウンロード前に、既存のVTTファイルをすべて削除
-    import datetime
-    import subprocess
-    log_msg = f"\n[{datetime.datetime.now()}] download_captions: クリーンアップ開始\n"
-    print("🧹 [ダウンロード前] captionsフォルダをクリーンアップ中...")
-    
-    try:
-        # globで明示的にVTTファイルのリストを取得
-        vtt_files = [f for f in CAPTIONS_DIR.glob("*.vtt") if not f.name.startswith("._")]
-        log_msg += f"  対象ファイル数: {len(vtt_files)}\n"
-        print(f"  対象ファイル数: {len(vtt_files)}")
-        
-        # 各ファイルを個別に削除（外部HDDでPythonのunlink()が動作しないため、rmコマンドを使用）
-        deleted_count = 0
-        for vtt_file in vtt_files:
-            result = subprocess.run(["rm", "-f", str(vtt_file)], capture_output=True, text=True)
-            if result.returncode == 0:
-                deleted_count += 1
-                log_msg += f"  削除成功: {vtt_file.name}\n"
-            else:
-                log_msg += f"  削除失敗: {vtt_file.name} - {result.stderr}\n"
-        
-        log_msg += f"  削除完了: {deleted_count}/{len(vtt_files)}\n"
-        print(f"  ✅ 削除完了: {deleted_count}/{len(vtt_files)}")
-        
-    except Exception as e:
-        log_msg += f"クリーンアップエラー: {e}\n"
-        print(f"⚠️ クリーンアップエラー: {e}")
-    
-    print("✅ [ダウンロード前] クリーンアップ完了")
-    
-    # デバッグログをファイルに出力
-    with open(CAPTIONS_DIR.parent / "cleanup_debug.log", "a", encoding="utf-8") as f:
-        f.write(log_msg)
-    
-    clean_url = clean_youtube_url(youtube_url)
+def extract_video_id(url: str) -> str:
+    """動画IDを取り出す（取り出せない場合はURLそのものをキーとして使う）"""
+    qs = parse_qs(urlparse(clean_youtube_url(url)).query)
+    return qs.get("v", [url])[0]
+
+
+def build_caption_cmd(clean_url: str, out_dir: Path, info_json: Optional[Path] = None,
+                      track: Optional[Tuple[str, bool]] = None) -> List[str]:
+    """
+    字幕ダウンロード用の yt-dlp コマンドを組み立てる
+    info_json（メタデータ取得時に保存したもの）を渡すと、動画の解析をやり直さずにそれを読み込む
+    track（choose_caption_track の結果）を渡すと、その1トラックだけを取得する
+    """
     cmd = [
             "yt-dlp",
             "--extractor-args", "youtube:player_client=web_creator,ios,android",
-            "--write-auto-sub",
-            "--sub-lang",
-            "ja,en",
+            *caption_track_args(track),
             "--skip-download",
             "--output",
-            str(CAPTIONS_DIR / "%(title)s [%(id)s].%(ext)s"),
+            str(out_dir / "%(title)s [%(id)s].%(ext)s"),
             clean_url,
     ]
+    if info_json:
+        cmd[-1:] = ["--load-info-json", str(info_json)]
 
     # cookies.txtがあればそれを使う
     if os.path.exists("cookies.txt"):
         cmd.insert(1, "--cookies")
         cmd.insert(2, "cookies.txt")
+    return cmd
+
+
+def download_captions(youtube_url: str, job: Optional[Job] = None,
+                      metadata: Optional[dict] = None) -> Optional[Path]:
+    # ジョブごとの作業フォルダに字幕を保存する（同時実行時に他リクエストのVTTと混ざらないように）
+    out_dir = job.workspace if job else CAPTIONS_DIR
+    clean_url = clean_youtube_url(youtube_url)
+    # 同じジョブでメタデータを取得済みなら、その info JSON を使って動画の解析を省く
+    info_json = info_json_path(job.workspace) if job else None
+    if info_json and not info_json.exists():
+        info_json = None
+    # メタデータの字幕一覧から1トラックだけを選んで取得する
+    track = None
+    if metadata:
+        track = choose_caption_track(metadata)
+        if track is None:
+            print(f"⚠️ 優先言語 {CAPTION_LANGS} の字幕がありません")
+            return None
+        print(f"🎯 字幕トラック: {track[0]} ({'自動' if track[1] else '手動'})")
+    cmd = build_caption_cmd(clean_url, out_dir, info_json, track)
 
     # yt-dlpは一部の字幕取得に失敗してもエラー1を返すことがあるため、
     # 実行後にファイルが存在するかどうかで判定する。
     try:
-        subprocess.run(
-            cmd,
-            check=False,
-            # capture_output=True, # ログ出力のために追加しても良い
-        )
+        if job:
+            # キャンセル時に子プロセスをkillできるようにジョブ経由で起動
+            job.run_process(cmd)
+        else:
+            subprocess.run(cmd, check=False)
+    except JobCancelled:
+        raise
     except Exception as e:
         print(f"⚠️ yt-dlp 実行中に致命的なエラーが発生しました: {e}")
         return None
 
-    # 優先順位: ja > en > 他
+    vtt_path = pick_caption_file(out_dir)
+    if vtt_path is None and info_json:
+        # info JSON 内の字幕URLが期限切れなどで失敗した場合は、URLから取り直す
+        print("⚠️ 保存済みの info JSON で字幕を取得できませんでした。URLから再取得します")
+        info_json.unlink()
+        return download_captions(youtube_url, job, metadata)
+    return vtt_path
+
+
+def pick_caption_file(out_dir: Path) -> Optional[Path]:
+    # 優先順位: CAPTION_LANGS の順（既定 ja > en）> 他
     # 隠しファイル (._*) を除外
-    candidates = [p for p in CAPTIONS_DIR.glob("*.vtt") if not p.name.startswith("._")]
+    candidates = [p for p in out_dir.glob("*.vtt") if not p.name.startswith("._")]
     if not candidates:
         return None
 
-    # .ja.を含むファイルがあればそれを返す
-    for p in candidates:
-        if ".ja." in p.name:
-            return p
-            
-    # なければ .en. を探す
-    for p in candidates:
-        if ".en." in p.name:
-            return p
+    # 優先言語（自動字幕の元言語トラック xx-orig を含む）のファイルがあればそれを返す
+    for lang in CAPTION_LANGS:
+        for p in candidates:
+            if f".{lang}." in p.name or f".{lang}-orig." in p.name:
+                return p
 
     # それもなければ最初に見つかったもの
     return candidates[0]
@@ -212,13 +346,75 @@ def create_prompt(cleaned_text: str, video_title: str, video_url: str, genre: st
     return template.replace("{cleaned_text}", cleaned_text).replace("{video_title}", video_title).replace("{video_url}", video_url)
 
 
-def call_gemini(prompt: str) -> str:
-    """
-    Gemini APIを呼び出し、エラー時に自動的にフォールバックAPIに切り替える
-    """
-    model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-    
-    # APIキーのリストを作成（優先順位順）
+def parse_genres(spec: str) -> List[str]:
+    """"stock_analyst,general,tsukkomi" のようなカンマ区切りのジャンル指定を重複なしのリストにする"""
+    genres = list(dict.fromkeys(g.strip() for g in (spec or "").split(",") if g.strip()))
+    return genres or ["auto"]
+
+
+def genre_label(genre: str) -> str:
+    if genre == TSUKKOMI_GENRE:
+        return TSUKKOMI_LABEL
+    return PROMPTS.get(genre, {}).get("label", genre)
+
+
+TIMESTAMP_INSTRUCTION = """
+
+【タイムスタンプ】
+文字起こし中の [t=H:MM:SS] はその直後の発言の位置です。
+要約の各箇条書きの末尾に、根拠となる発言の位置を [t=H:MM:SS] の形式で1つ付けてください。"""
+
+
+def create_chapter_prompt(chapter_text: str, chapter_title: str, video_title: str) -> str:
+    """チャプター単体の要約用プロンプト"""
+    return f"""以下はYouTube動画「{video_title}」のチャプター「{chapter_title}」の文字起こしです。
+このチャプターの要点を3〜6個の箇条書き（Markdown）で簡潔にまとめてください。前置きや見出しは不要です。
+{TIMESTAMP_INSTRUCTION}
+
+【文字起こし】
+{chapter_text}"""
+
+
+def summarize_chapters(job: Job, transcript: Transcript, video_title: str, genre: str = "general",
+                       video_id: str = "") -> str:
+    """チャプターごとに並列で要約し、チャプター見出し付きの Markdown にまとめる"""
+    chapters = [c for c in transcript.chapters if transcript.slice(c["start"], c["end"]).lines]
+    job.progress(f"▶ チャプター別要約開始 ({len(chapters)}チャプター, 並列 {CHAPTER_CONCURRENCY})")
+
+    def summarize_one(chapter: dict) -> str:
+        part = transcript.slice(chapter["start"], chapter["end"])
+        prompt = create_chapter_prompt(part.timestamped_text(), chapter["title"], video_title)
+        decision = choose_model(prompt, genre, job, "chapter", video_id, output_tokens=CHAPTER_OUTPUT_TOKENS)
+        return call_gemini(prompt, job, decision["model"], stage="chapter", genre=genre)
+
+    with ThreadPoolExecutor(max_workers=CHAPTER_CONCURRENCY) as pool:
+        summaries = list(pool.map(summarize_one, chapters))
+    sections = [
+        f"### {c['title']} [t={format_offset(c['start'])}]\n\n{summary or '（このチャプターの要約に失敗しました）'}"
+        for c, summary in zip(chapters, summaries)
+    ]
+    return "\n\n".join(sections)
+
+
+def create_live_prompt(running_summary: str, delta_text: str, video_title: str, video_url: str,
+                       genre: str, covered_until: str) -> str:
+    """ライブ配信の差分要約用プロンプト（これまでの要約 + 新しい発言だけを渡す）"""
+    base = create_prompt(delta_text, video_title, video_url, genre)
+    if not running_summary:
+        return base
+    return f"""これは配信中のライブ動画の逐次要約です。{covered_until} までの内容は以下のように要約済みです。
+
+【これまでの要約】
+{running_summary}
+
+この要約に、続く発言（以下の指示に含まれるテキスト）の内容を統合し、同じ形式で更新版の要約全体を出力してください。
+既出の内容は繰り返さず、新しい情報の追加や、状況が変わった点の更新を行ってください。
+
+{base}"""
+
+
+def get_gemini_api_keys() -> List[Tuple[str, str]]:
+    """APIキーのリストを作成（優先順位順）"""
     api_keys = []
     if GEMINI_API_KEY_PRIMARY:
         api_keys.append(("PRIMARY (無料枠)", GEMINI_API_KEY_PRIMARY))
@@ -228,25 +424,99 @@ def call_gemini(prompt: str) -> str:
     # 後方互換性: 新しいキーが設定されていない場合は従来のキーを使用
     if not api_keys and GEMINI_API_KEY:
         api_keys.append(("DEFAULT", GEMINI_API_KEY))
-    
+    return api_keys
+
+
+# APIキーごとのクライアント（優先順位順）
+# genai.configure はプロセス全体のキーを書き換えるため、並列の呼び出し中にフォールバックすると
+# 他のスレッドの呼び出しまでキーが切り替わる。キーごとに別のクライアントを持ち、呼び出し側で選ぶ
+GEMINI_CLIENTS = [(key_name, GeminiRestClient(api_key, os.getenv("GEMINI_API_BASE", API_BASE)))
+                  for key_name, api_key in get_gemini_api_keys()]
+
+
+def routing_policy(genre: str) -> Tuple[dict, Optional[str]]:
+    """ジャンルのモデル選択方針と、環境変数で固定されたモデル（なければ None）"""
+    if genre == TSUKKOMI_GENRE:
+        return dict(TSUKKOMI_ROUTING), os.getenv("TSUKKOMI_MODEL")
+    return dict(PROMPTS.get(genre, {}).get("routing") or {}), os.getenv("GEMINI_MODEL")
+
+
+def choose_model(prompt: str, genre: str, job: Optional[Job], stage: str, video_id: str = "",
+                 output_tokens: Optional[int] = None) -> dict:
+    """
+    プロンプトのトークン数とジャンルの方針（prompts.json の "routing"）からモデルを選び、結果を記録する
+    GEMINI_MODEL（ツッコミ分析は TSUKKOMI_MODEL）が設定されていればそのモデルに固定する
+    """
+    routing, forced = routing_policy(genre)
+    if output_tokens is not None:
+        routing["output_tokens"] = output_tokens
+    decision = route(estimate_tokens(prompt), routing, forced=forced)
+    message = (f"🧭 モデル選択 ({stage}): {decision['model']} "
+               f"(入力 約{decision['input_tokens']}トークン, 推定 ${decision['est_cost_usd']}, "
+               f"約{decision['est_latency_s']}秒) {decision['reason']}")
+    if job:
+        job.progress(message)
+    else:
+        print(message)
+    try:
+        record_route(ROUTING_LOG, {"video_id": video_id, "genre": genre, "stage": stage,
+                                   "job_id": job.id if job else None, **decision})
+    except OSError as e:
+        print(f"⚠️ モデル選択の記録に失敗: {e}")
+    return decision
+
+
+def record_usage(job: Optional[Job], kind: str, model: str, **fields):
+    """利用記録を追記する（記録に失敗しても処理は止めない）"""
+    tags = dict(job.usage_tags) if job else {}
+    tags.update({k: v for k, v in fields.items() if v is not None})
+    try:
+        USAGE_LEDGER.record(kind, model, job_id=job.id if job else "", **tags)
+    except Exception as e:
+        print(f"⚠️ 利用記録の保存に失敗: {e}")
+
+
+def call_gemini(prompt: str, job: Optional[Job] = None, model_name: Optional[str] = None,
+                stage: str = "summary", genre: Optional[str] = None) -> str:
+    """
+    Gemini APIを呼び出し、エラー時に自動的にフォールバックAPIに切り替える
+    model_name を省略した場合は GEMINI_MODEL（未設定なら gemini-2.5-flash）を使う
+    stage / genre は利用記録の集計用（genre を省略した場合はジョブの usage_tags の値）
+    """
+    model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
     # 各APIキーで順番に試行
     last_error = None
-    for key_name, api_key in api_keys:
+    for i, (key_name, client) in enumerate(GEMINI_CLIENTS):
         try:
             print(f"🤖 Gemini API呼び出し中 ({key_name}, Model: {model_name})")
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
+            # bulk ジョブは対話リクエストが待っている間は枠を譲る
+            with GEMINI_GATE.slot(job.lane if job else INTERACTIVE, check=job.check if job else None):
+                started = time.perf_counter()
+                if job:
+                    # キャンセルされたら応答を待たずに放棄する
+                    response = job.run_cancellable(client.generate, model_name, prompt)
+                else:
+                    response = client.generate(model_name, prompt)
+            latency_ms = (time.perf_counter() - started) * 1000
+            prompt_tokens, output_tokens = gemini_usage(response)
+            record_usage(job, "gemini", model_name, key_name=key_name.split()[0], stage=stage, genre=genre,
+                         prompt_tokens=prompt_tokens, output_tokens=output_tokens, latency_ms=latency_ms,
+                         cost_usd=gemini_cost(model_name, prompt_tokens, output_tokens))
             print(f"✅ Gemini要約取得完了 ({key_name})")
             return response.text
         
+        except JobCancelled:
+            raise
         except Exception as e:
             error_msg = str(e)
             print(f"⚠️ {key_name} でエラー発生: {error_msg}")
+            record_usage(job, "gemini", model_name, key_name=key_name.split()[0], stage=stage, genre=genre,
+                         ok=False, error=error_msg)
             last_error = e
             
             # 次のAPIキーがある場合は続行、なければエラーを投げる
-            if api_keys.index((key_name, api_key)) < len(api_keys) - 1:
+            if i < len(GEMINI_CLIENTS) - 1:
                 print(f"🔄 次のAPIキーでリトライします...")
                 continue
             else:
@@ -258,20 +528,78 @@ def call_gemini(prompt: str) -> str:
     raise RuntimeError("Gemini API呼び出しに失敗しました")
 
 
-def format_as_html(title: str, md_text: str, video_url: str) -> str:
+def call_gemini_cached(prompt: str, cached_content: str, job: Optional[Job], model_name: str,
+                       stage: str = "summary", genre: Optional[str] = None) -> str:
+    """コンテキストキャッシュを参照して Gemini を呼ぶ（キャッシュを作ったキーで呼ぶため、キーの切り替えはしない）"""
+    print(f"🤖 Gemini API呼び出し中 ({REST_API_KEY_NAME}, Model: {model_name}, キャッシュ: {cached_content})")
+    try:
+        with GEMINI_GATE.slot(job.lane if job else INTERACTIVE, check=job.check if job else None):
+            started = time.perf_counter()
+            if job:
+                response = job.run_cancellable(CONTEXT_CACHE.client.generate, model_name, prompt, cached_content)
+            else:
+                response = CONTEXT_CACHE.client.generate(model_name, prompt, cached_content)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        record_usage(job, "gemini", model_name, key_name=REST_API_KEY_NAME, stage=stage, genre=genre,
+                     ok=False, error=str(e))
+        raise
+    prompt_tokens, output_tokens = gemini_usage(response)
+    cached_tokens = cached_token_count(response)
+    record_usage(job, "gemini", model_name, key_name=REST_API_KEY_NAME, stage=stage, genre=genre,
+                 prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, output_tokens=output_tokens,
+                 latency_ms=(time.perf_counter() - started) * 1000,
+                 cost_usd=gemini_cost(model_name, prompt_tokens, output_tokens, cached_tokens))
+    print(f"✅ Gemini要約取得完了 ({REST_API_KEY_NAME}, キャッシュ {cached_tokens}トークン)")
+    return response.text
+
+
+def call_gemini_on_transcript(job: Job, source: dict, build_prompt: Callable[[str], str], model_name: str,
+                              stage: str = "summary", genre: Optional[str] = None) -> str:
+    """
+    字幕全体を入力にして Gemini を呼ぶ
+    字幕をコンテキストキャッシュに載せられる場合は、字幕の代わりに CACHED_TRANSCRIPT_NOTE を埋め込んだ
+    プロンプトとキャッシュ名で呼ぶ（キャッシュが使えなければ字幕を含む通常のプロンプトで呼ぶ）
+    """
+    text = source["prompt_text"]
+    handle = None
+    if CONTEXT_CACHE:
+        handle = CONTEXT_CACHE.get_or_create(
+            source["video_id"], model_name, text, estimate_tokens(text),
+            expected_uses=source.get("planned_models", {}).get(model_name, 1), display_name=source["title"],
+        )
+    if handle:
+        try:
+            return call_gemini_cached(build_prompt(CACHED_TRANSCRIPT_NOTE), handle, job, model_name, stage, genre)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"⚠️ コンテキストキャッシュ経由の呼び出しに失敗したため通常の呼び出しに切り替えます: {e}")
+            CONTEXT_CACHE.invalidate(handle)
+    return call_gemini(build_prompt(text), job, model_name, stage=stage, genre=genre)
+
+
+def format_as_html(title: str, md_text: str, video_url: str, duplicate_of: Optional[dict] = None) -> str:
     body_html = markdown.markdown(md_text, extensions=["tables", "fenced_code"])
-    return f"""<html><body><h2>{title}</h2><p><a href="{video_url}" target="_blank">🔗 YouTubeで見る</a></p><div>{body_html}</div></body></html>"""
+    note = f"<p>{duplicate_note_html(duplicate_of)}</p>" if duplicate_of else ""
+    return f"""<html><body><h2>{title}</h2><p><a href="{video_url}" target="_blank">🔗 YouTubeで見る</a></p>{note}<div>{body_html}</div></body></html>"""
 
 
-def detect_genre(cleaned_text: str, video_title: str) -> str:
-    """Geminiを使って動画のジャンルを判定する"""
-    print("▶ ジャンル自動判定開始")
-    
+def duplicate_note_html(duplicate_of: dict) -> str:
+    """既存要約を再利用したことを示す注記（元動画へのリンク付き）"""
+    return (
+        f"♻️ この動画は <a href=\"{duplicate_of['url']}\" target=\"_blank\">{duplicate_of['title']}</a> "
+        f"とほぼ同じ内容（類似度 {duplicate_of['similarity']:.2f}）のため、元動画の要約を再利用しています。"
+    )
+
+
+def build_genre_prompt(cleaned_text: str, video_title: str) -> str:
+    """ジャンル判定用のプロンプトを作成する"""
     # 候補リスト作成
-    candidates = list(PROMPTS.keys()) # ['stock_analyst', 'general']
-    candidates_str = ", ".join(candidates)
+    candidates_str = ", ".join(PROMPTS.keys()) # ['stock_analyst', 'general']
     
-    prompt = f"""
+    return f"""
     以下のYouTube動画のタイトルと冒頭のテキストから、最も適切なカテゴリを判定してください。
     
     カテゴリ候補: {candidates_str}
@@ -285,35 +613,61 @@ def detect_genre(cleaned_text: str, video_title: str) -> str:
     回答はカテゴリ名のみを出力してください（余計な説明は不要）。
     もし判断がつかない場合は 'general' と出力してください。
     """
+
+
+def match_genre(response_text: str) -> str:
+    """Geminiの判定結果をジャンル候補に突き合わせる"""
+    candidates = list(PROMPTS.keys())
+    detected = response_text.strip().lower()
+    
+    # 候補に含まれているかチェック
+    if detected in candidates:
+        print(f"✅ 自動判定結果: {detected}")
+        return detected
+    
+    # 候補にない場合やご判定の場合はgeneral
+    for cand in candidates:
+        if cand in detected:
+            print(f"✅ 自動判定結果(部分一致): {cand}")
+            return cand
+            
+    print(f"⚠️ 自動判定不明確 ({detected}) -> default: general")
+    return "general"
+
+
+def detect_genre(cleaned_text: str, video_title: str, job: Optional[Job] = None) -> str:
+    """Geminiを使って動画のジャンルを判定する"""
+    print("▶ ジャンル自動判定開始")
+    prompt = build_genre_prompt(cleaned_text, video_title)
     
     try:
+        # キーのフォールバックと利用記録（キー名・失敗も含む）は call_gemini に任せる
         model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        detected = response.text.strip().lower()
-        
-        # 候補に含まれているかチェック
-        if detected in candidates:
-            print(f"✅ 自動判定結果: {detected}")
-            return detected
-        
-        # 候補にない場合やご判定の場合はgeneral
-        for cand in candidates:
-            if cand in detected:
-                print(f"✅ 自動判定結果(部分一致): {cand}")
-                return cand
-                
-        print(f"⚠️ 自動判定不明確 ({detected}) -> default: general")
-        return "general"
-            
+        return match_genre(call_gemini(prompt, job, model_name, stage="genre"))
+
+    except JobCancelled:
+        raise
     except Exception as e:
         print(f"❌ 自動判定エラー: {e} -> default: general")
         return "general"
 
 
 
+def ensure_gmail_token() -> bool:
+    """token.json がなければ共有バックエンドから復元する（他ノードで認証済みの場合）"""
+    if os.path.exists(TOKEN_FILE):
+        return True
+    token = BACKEND.cache_get("secrets", "gmail_token")
+    if not token:
+        return False
+    with open(TOKEN_FILE, "w") as f:
+        f.write(token)
+    print("✅ 共有バックエンドから token.json を復元しました")
+    return True
+
+
 def send_gmail(subject: str, html_body: str, to_email: str, attachment_path: Optional[str] = None):
-    if not os.path.exists(TOKEN_FILE):
+    if not ensure_gmail_token():
         print("⚠️ token.json が見つかりません。メール送信をスキップします。")
         return
 
@@ -356,10 +710,854 @@ def send_gmail(subject: str, html_body: str, to_email: str, attachment_path: Opt
 
 
 
+class CaptionsNotFound(Exception):
+    """字幕ファイルが取得できなかった場合の例外"""
+
+
+class MetadataUnavailable(Exception):
+    """動画メタデータを取得できなかったことを示す例外（要約処理は続行する）"""
+
+
+class EmptySummary(Exception):
+    """Geminiから要約が返らなかった場合の例外"""
+
+
+CAPTIONS_ERROR_HTML = """<h2>❌ 字幕の取得に失敗しました</h2>
+            <p>以下の理由が考えられます：</p>
+            <ul>
+                <li>動画に字幕が設定されていない</li>
+                <li>動画が非公開または削除されている</li>
+                <li>yt-dlpによる字幕取得に失敗した</li>
+            </ul>
+            <p><a href="/">戻る</a></p>"""
+
+
+def fetch_video_metadata(clean_url: str, job: Job) -> Optional[dict]:
+    """
+    yt-dlp で動画メタデータを取得して要約した dict を返す（失敗時は None）
+    生の info JSON は作業フォルダに残し、字幕取得で再利用する
+    """
+    path = info_json_path(job.workspace)
+    try:
+        with path.open("w", encoding="utf-8") as f:
+            job.run_process(build_metadata_cmd(clean_url), stdout=f)
+        with path.open("r", encoding="utf-8") as f:
+            info = json.load(f)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        print(f"⚠️ 動画メタデータの取得に失敗しました: {e}")
+        path.unlink(missing_ok=True)
+        return None
+    return summarize_info(info)
+
+
+def deliver_summary(job: Job, title: str, summary_md: str, cleaned_url: str, subject: str,
+                    duplicate_of: Optional[dict] = None, with_audio: bool = True) -> bool:
+    """TTS → メール送信（音声を添付できたら True）"""
+    # TTS処理（一時MP3もジョブの作業フォルダに置く）
+    mp3_path = job.workspace / TEMP_MP3_FILE
+    mp3_generated = False
+    summary_for_tts = extract_summary_ssml(summary_md) if with_audio else None
+    if summary_for_tts:
+        job.progress("▶ 音声生成開始")
+        mp3_generated = generate_gcp_tts_mp3(summary_for_tts, str(mp3_path), job)
+    job.check()
+
+    # メール送信
+    html_body = format_as_html(title, summary_md, cleaned_url, duplicate_of)
+    attachment_to_send = str(mp3_path) if mp3_generated and mp3_path.exists() else None
+    job.progress("▶ メール送信開始")
+    send_gmail(subject, html_body, GMAIL_TO, attachment_to_send)
+    return bool(attachment_to_send)
+
+
+def prepare_transcript(job: Job, youtube_url: str) -> dict:
+    """
+    メタデータ取得 → 字幕取得（キャッシュ・保存済みの字幕を優先）→ 字幕保存 → 類似動画の検索 までを行い、
+    ジャンル別の要約に渡す情報をまとめて返す
+    """
+    job.progress(f"✅ 受信URL: {youtube_url} (job={job.id})")
+    cleaned_url = clean_youtube_url(youtube_url)
+    video_id = extract_video_id(cleaned_url)
+    job.usage_tags["video_id"] = video_id
+
+    # メタデータ（タイトル・長さ・チャプター・字幕の言語など）を先に取得し、後段の判断に使う
+    def fetch_metadata() -> str:
+        job.progress("▶ 動画メタデータ取得")
+        metadata = fetch_video_metadata(cleaned_url, job)
+        if metadata is None:
+            raise MetadataUnavailable(cleaned_url)
+        return json.dumps(metadata, ensure_ascii=False)
+
+    try:
+        metadata = json.loads(single_flight(
+            BACKEND, "metadata", video_id, fetch_metadata, ttl=METADATA_CACHE_TTL, check=job.check
+        ))
+        job.progress(f"✅ メタデータ: {metadata['title']} / {metadata['channel']} / {metadata['duration']}秒 / "
+                     f"字幕 手動{metadata['manual_captions'] or 'なし'} 自動{len(metadata['auto_captions'])}言語")
+        job.usage_tags["channel"] = metadata["channel"]
+    except MetadataUnavailable:
+        metadata = None
+
+    def transcript_entry(title: str, transcript: Transcript) -> str:
+        # 類似動画検出の署名（MinHash）も字幕と一緒にキャッシュし、要求のたびに計算し直さない
+        entry = {"title": title, **transcript.to_dict()}
+        if NEAR_DUP_ENABLED:
+            entry["signature"] = NEAR_DUP.signature(transcript.text)
+        return json.dumps(entry, ensure_ascii=False)
+
+    live_status = metadata["live_status"] if metadata else ""
+    live_pending = live_status in PENDING_LIVE_STATUSES
+
+    def fetch_transcript() -> str:
+        archived = None
+        if TRANSCRIPT_ARCHIVE:
+            try:
+                archived = TRANSCRIPT_ARCHIVE.load(video_id)
+            except Exception as e:
+                # 壊れた .ytt があっても、字幕を取り直して上書きする
+                print(f"⚠️ 保存済みの字幕を読み込めませんでした（再取得します）: {e}")
+        if archived:
+            job.progress("📦 保存済みの字幕を使用します")
+            return transcript_entry(*archived)
+        job.progress("▶ 字幕ダウンロード開始")
+        vtt_path = download_captions(cleaned_url, job, metadata)
+        if vtt_path is None:
+            raise CaptionsNotFound(cleaned_url)
+        # 各行の開始時刻も一緒にキャッシュする
+        transcript = Transcript.from_vtt(vtt_path.read_text(encoding="utf-8"))
+        title = metadata["title"] if metadata else vtt_path.stem
+
+        # 字幕保存（圧縮形式。作業フォルダと違いジョブ終了後も残す）
+        # 新しく取得したときだけ保存する（キャッシュ・保存済みの字幕を使った要求では書き直さない）
+        # 配信前・配信中・配信直後の字幕は後から変わるため保存しない
+        if TRANSCRIPT_ARCHIVE and not live_pending:
+            if metadata:
+                transcript.chapters = metadata["chapters"]
+            try:
+                ytt_path = TRANSCRIPT_ARCHIVE.save(video_id, title, transcript, live_status=live_status)
+                job.progress(f"✅ 字幕保存: {ytt_path}")
+            except Exception as e:
+                print(f"⚠️ 字幕の保存に失敗: {e}")
+        return transcript_entry(title, transcript)
+
+    cached = json.loads(single_flight(
+        BACKEND, "transcript", video_id, fetch_transcript,
+        ttl=LIVE_TRANSCRIPT_CACHE_TTL if live_pending else TRANSCRIPT_CACHE_TTL, check=job.check
+    ))
+    transcript = Transcript.from_dict(cached)
+    if metadata:
+        transcript.chapters = metadata["chapters"]
+    title = metadata["title"] if metadata else cached["title"]
+
+    # 再アップロード・切り抜き検出: ほぼ同じ字幕の動画（要約の再利用候補）を探しておく
+    # （登録済みの署名と比べられるよう、正規化前の字幕で計算する。署名のない古いキャッシュはここで計算する）
+    signature, match = None, None
+    if NEAR_DUP_ENABLED:
+        signature = cached["signature"] if "signature" in cached else NEAR_DUP.signature(transcript.text)
+        match = NEAR_DUP.find(signature, exclude=video_id) if signature else None
+
+    # フィラー・雑音タグを除いてから後段（検索インデックス・ジャンル判定・要約）に渡す
+    # （ツッコミ分析の候補抽出は笑いタグを手がかりにするため、正規化前の字幕も残す）
+    raw_transcript, normalization = transcript, None
+    if TEXT_NORMALIZER:
+        transcript, normalization = TEXT_NORMALIZER.transcript(transcript)
+        job.progress(f"✂️ 字幕の正規化: 約{normalization['tokens_before']}→{normalization['tokens_after']}トークン"
+                     f"（-{normalization['saved_pct']}%、フィラー{normalization['fillers']}件・"
+                     f"雑音タグ{normalization['noise']}件）")
+
+    # 銘柄・企業名の言及を拾い、「この銘柄に触れた動画」を後から引けるよう保存する（公開日で期間を絞れるようにする）
+    mentions = ENTITY_EXTRACTOR.mentions(transcript)
+    entities = summarize_mentions(mentions)
+    if entities:
+        job.progress("🏷️ 銘柄の言及: " + ", ".join(f"{e['name']}({e['code']})×{e['count']}" for e in entities[:8])
+                     + (f" ほか{len(entities) - 8}銘柄" if len(entities) > 8 else ""))
+    upload_date = format_upload_date(metadata["upload_date"]) if metadata and metadata["upload_date"] else None
+    try:
+        ENTITY_INDEX.add(video_id, title, cleaned_url, mentions, date=upload_date)
+    except Exception as e:
+        print(f"⚠️ 銘柄インデックス登録失敗: {e}")
+
+    return {
+        "url": youtube_url,
+        "cleaned_url": cleaned_url,
+        "video_id": video_id,
+        "metadata": metadata,
+        "title": title,
+        "transcript": transcript,
+        "raw_transcript": raw_transcript,
+        "cleaned": transcript.text,
+        # Gemini に渡す字幕（30秒ごとに [t=H:MM:SS] を挟む。コンテキストキャッシュにもこれを載せる）
+        "prompt_text": transcript.timestamped_text(),
+        "signature": signature,
+        "match": match,
+        "normalization": normalization,
+        "entities": entities,
+    }
+
+
+def genre_match(source: dict, genre: str) -> Optional[dict]:
+    """そのジャンルで要約済みの類似動画（source["match"] はジャンルを問わず最も近い動画）"""
+    if not source["signature"]:
+        return None
+    return NEAR_DUP.find(source["signature"], exclude=source["video_id"], genre=genre)
+
+
+def duplicate_summary(match: dict, genre: str) -> Optional[str]:
+    """類似動画のそのジャンルの要約（キャッシュ切れなら検索インデックスから）"""
+    return (BACKEND.cache_get("summary", f"{match['video_id']}:{genre}")
+            or SEARCH_INDEX.get_summary(match["video_id"], genre))
+
+
+def is_chaptered(source: dict) -> bool:
+    """チャプターごとに要約してからまとめる長さの動画か"""
+    return len(source["transcript"].chapters) >= 2 and len(source["cleaned"]) > CHAPTER_SPLIT_CHARS
+
+
+def genre_prompt_builder(source: dict, genre: str) -> Callable[[str], str]:
+    """入力テキストを受け取り、そのジャンルのプロンプトを返す関数"""
+    if genre == TSUKKOMI_GENRE:
+        return lambda text: build_tsukkomi_prompt(text, source["title"])
+    suffix = TIMESTAMP_INSTRUCTION if source["transcript"].has_timestamps else ""
+    if genre in ENTITY_GENRES:
+        suffix += entity_prompt_block(source["entities"])
+    return lambda text: create_prompt(text, source["title"], source["url"], genre) + suffix
+
+
+def tsukkomi_excerpt(source: dict) -> Optional[Tuple[str, dict]]:
+    """
+    ツッコミ分析に送る候補箇所の抜粋と報告（短い動画・TSUKKOMI_PREFILTER=0 のときは None で字幕全体を送る）
+    1つの動画で1回だけ計算して source に保持する
+    """
+    if "tsukkomi_excerpt" not in source:
+        raw = source["raw_transcript"]
+        source["tsukkomi_excerpt"] = prefilter_lines(
+            raw.lines, raw.starts if raw.has_timestamps else None,
+            clean=TEXT_NORMALIZER.normalize if TEXT_NORMALIZER else None,
+        ) if TSUKKOMI_PREFILTER and len(raw.lines) >= TSUKKOMI_PREFILTER_MIN_LINES else None
+    return source["tsukkomi_excerpt"]
+
+
+def plan_models(source: dict, genres: List[str]) -> Counter:
+    """
+    各ジャンルが字幕全体を送るモデルを事前に見積もり、モデルごとの利用回数を数える
+    （同じモデルで2回以上使うと分かっていれば、1回目からコンテキストキャッシュを作る）
+    """
+    planned = Counter()
+    for genre in genres:
+        if (genre != TSUKKOMI_GENRE and is_chaptered(source)) or (genre == TSUKKOMI_GENRE and tsukkomi_excerpt(source)):
+            continue
+        routing, forced = routing_policy(genre)
+        prompt = genre_prompt_builder(source, genre)(source["prompt_text"])
+        planned[route(estimate_tokens(prompt), routing, forced=forced)["model"]] += 1
+    return planned
+
+
+def finish_summary(source: dict, genre: str, summary: str, chapter_md: Optional[str] = None) -> str:
+    """Gemini の要約にチャプターの一覧（長い動画はチャプター別の要点）を付け、時刻をリンクにする"""
+    if not summary:
+        raise EmptySummary(source["title"])
+    chapters, cleaned_url = source["transcript"].chapters, source["cleaned_url"]
+    if chapter_md:
+        summary += "\n\n## 📑 チャプター別の要点\n\n" + chapter_md
+    elif chapters and genre != TSUKKOMI_GENRE:
+        summary += "\n\n## 📑 チャプター\n\n" + chapter_index_md(chapters, cleaned_url)
+    # [t=H:MM:SS] を動画の該当位置（&t=秒s）へのリンクにする
+    return link_timestamps(summary, cleaned_url)
+
+
+def summarize_for_genre(job: Job, source: dict, genre: str) -> dict:
+    """
+    1ジャンル分の要約を作る（類似動画の要約があれば再利用し、なければ Gemini で要約してキャッシュする）
+    genre に TSUKKOMI_GENRE を指定するとツッコミ分析を行う
+    """
+    video_id, title = source["video_id"], source["title"]
+    transcript, match = source["transcript"], genre_match(source, genre)
+    decisions = []
+
+    def summarize() -> str:
+        build_prompt = genre_prompt_builder(source, genre)
+        if genre == TSUKKOMI_GENRE:
+            job.progress("▶ ツッコミ分析開始")
+            excerpt = tsukkomi_excerpt(source)
+            if excerpt:
+                # 長い動画は候補の箇所だけを送る（字幕全体のコンテキストキャッシュは使わない）
+                text, report = excerpt
+                job.progress(f"🎯 候補の抜粋: {report['lines_sent']}/{report['lines_total']}行, {report['windows']}箇所 "
+                             f"(約{report['tokens_before']}→{report['tokens_after']}トークン)")
+                prompt = build_tsukkomi_prompt(text, title, excerpt=True)
+                decisions.append(choose_model(prompt, genre, job, TSUKKOMI_GENRE, video_id))
+                summary = call_gemini(prompt, job, decisions[-1]["model"], stage=TSUKKOMI_GENRE, genre=genre)
+            else:
+                decisions.append(choose_model(build_prompt(source["prompt_text"]), genre, job, TSUKKOMI_GENRE,
+                                              video_id))
+                summary = call_gemini_on_transcript(job, source, build_prompt, decisions[-1]["model"],
+                                                    stage=TSUKKOMI_GENRE, genre=genre)
+            return finish_summary(source, genre, summary)
+
+        # 長い動画はチャプターごとの要約（並列）を入力にしてジャンル別の要約を作る
+        chapter_md = None
+        if is_chaptered(source):
+            chapter_md = summarize_chapters(job, transcript, title, genre, video_id)
+            job.progress(f"▶ Gemini要約開始 (genre={genre})")
+            prompt = build_prompt("（長時間の動画のため、チャプターごとの要点を入力とします）\n\n" + chapter_md)
+            decisions.append(choose_model(prompt, genre, job, "summary", video_id))
+            summary = call_gemini(prompt, job, decisions[-1]["model"], genre=genre)
+        else:
+            job.progress(f"▶ Gemini要約開始 (genre={genre})")
+            decisions.append(choose_model(build_prompt(source["prompt_text"]), genre, job, "summary", video_id))
+            summary = call_gemini_on_transcript(job, source, build_prompt, decisions[-1]["model"], genre=genre)
+        return finish_summary(source, genre, summary, chapter_md)
+
+    # ほぼ同じ字幕の動画が要約済みなら、その要約を再利用して Gemini を呼ばない
+    duplicate_of = None
+    summary_md = duplicate_summary(match, genre) if match else None
+    if summary_md:
+        duplicate_of = match
+        BACKEND.cache_set("summary", f"{video_id}:{genre}", summary_md, ttl=SUMMARY_CACHE_TTL)
+        job.progress(f"♻️ 類似動画の要約を再利用: {match['title']} (類似度 {match['similarity']}, genre={genre})")
+    else:
+        summary_md = single_flight(
+            BACKEND, "summary", f"{video_id}:{genre}", summarize, ttl=SUMMARY_CACHE_TTL, check=job.check
+        )
+    summary_html = markdown.markdown(summary_md, extensions=["fenced_code", "tables"])
+    if duplicate_of:
+        summary_html = f"<p>{duplicate_note_html(duplicate_of)}</p>" + summary_html
+
+    return {
+        "genre": genre,
+        "label": genre_label(genre),
+        "summary_md": summary_md,
+        "summary_html": summary_html,
+        "duplicate_of": duplicate_of,
+        # キャッシュ済みの要約を返した場合は None
+        "routing": decisions[-1] if decisions else None,
+    }
+
+
+def index_summary(source: dict, genre: str, summary_md: str):
+    """類似動画インデックスと検索インデックスに登録する（失敗しても要約処理は続行）"""
+    if source["signature"] and genre != TSUKKOMI_GENRE:
+        try:
+            NEAR_DUP.add(source["video_id"], source["title"], source["cleaned_url"], genre, source["signature"])
+        except Exception as e:
+            print(f"⚠️ 類似動画インデックス登録失敗: {e}")
+
+    # 後から横断検索できるよう字幕と要約を検索インデックスに登録
+    try:
+        SEARCH_INDEX.add(source["video_id"], genre, source["title"], source["cleaned_url"], source["cleaned"], summary_md)
+    except Exception as e:
+        print(f"⚠️ 検索インデックス登録失敗: {e}")
+
+
+def deliver_once(job: Job, delivery_key: str, title: str, summary_md: str, cleaned_url: str, subject: str,
+                 duplicate_of: Optional[dict] = None) -> bool:
+    """
+    同じ動画・ジャンルのメールを複数ノードから重複送信しないよう、配信権を1ノードだけが取得して配信する
+    配信した場合は音声を添付できたかを返す
+    """
+    # 配信直前にキャンセルを確認（キャンセル済みならメールは送らない）
+    job.check()
+    if not BACKEND.cache_add("delivered", delivery_key, job.id, ttl=DELIVERY_DEDUP_TTL):
+        job.progress("⏭️ 直近で配信済みのため音声生成・メール送信をスキップ")
+        return False
+    try:
+        return deliver_summary(job, title, summary_md, cleaned_url, subject, duplicate_of)
+    except BaseException:
+        # 送信前に中断した場合は配信権を返す
+        BACKEND.cache_delete("delivered", delivery_key)
+        raise
+
+
+def run_summary_pipeline(job: Job, youtube_url: str, genre: str = "auto") -> dict:
+    """
+    字幕取得 → ジャンル判定 → Gemini要約 → TTS → メール送信 を1ジョブとして実行する
+    各ステージはジョブ経由で実行し、キャンセルされた時点で JobCancelled を送出する
+    字幕・要約は共有バックエンドにキャッシュし、複数ノードで同じ動画を重複処理しない
+    genre にカンマ区切りで複数ジャンル（ツッコミ分析を含む）を指定した場合は run_multi_genre_pipeline で処理する
+    """
+    genres = parse_genres(genre)
+    if len(genres) > 1 or genres == [TSUKKOMI_GENRE]:
+        return run_multi_genre_pipeline(job, youtube_url, genres)
+    genre = genres[0]
+
+    source = prepare_transcript(job, youtube_url)
+    title, cleaned_url, match = source["title"], source["cleaned_url"], source["match"]
+
+    # 自動判定で類似動画が要約済みなら、そのジャンルの要約を再利用する
+    if genre == "auto" and match and duplicate_summary(match, match["genre"]):
+        genre = match["genre"]
+    if genre == "auto":
+        genre = detect_genre(source["cleaned"], title, job)
+    job.usage_tags["genre"] = genre
+
+    outcome = summarize_for_genre(job, source, genre)
+    index_summary(source, genre, outcome["summary_md"])
+    has_audio = deliver_once(job, f"{source['video_id']}:{genre}", title, outcome["summary_md"], cleaned_url,
+                             f"【要約・音声完了】{title}", outcome["duplicate_of"])
+    job.progress("✅ 処理完了")
+
+    return {
+        "title": title,
+        "video_url": cleaned_url,
+        "genre": genre,
+        "text": source["cleaned"],
+        "summary_md": outcome["summary_md"],
+        "summary_html": outcome["summary_html"],
+        "has_audio": has_audio,
+        "duplicate_of": outcome["duplicate_of"],
+        "metadata": source["metadata"],
+        "routing": outcome["routing"],
+        "normalization": source["normalization"],
+        "entities": source["entities"],
+    }
+
+
+def run_multi_genre_pipeline(job: Job, youtube_url: str, genres: List[str]) -> dict:
+    """
+    1回の字幕取得で複数ジャンル（ツッコミ分析を含む）の要約を作り、まとめて1通のメールで配信する
+    ジャンルごとの Gemini 呼び出しは並列に行う（同時数は GEMINI_GATE で制限）
+    1ジャンルが失敗しても他のジャンルの結果は返す
+    """
+    source = prepare_transcript(job, youtube_url)
+    title, cleaned_url = source["title"], source["cleaned_url"]
+    if "auto" in genres:
+        detected = detect_genre(source["cleaned"], title, job)
+        genres = list(dict.fromkeys(detected if g == "auto" else g for g in genres))
+    job.usage_tags["genre"] = ",".join(genres)
+    source["planned_models"] = plan_models(source, genres)
+    job.progress(f"▶ 複数ジャンルを並列で要約 ({', '.join(genres)})")
+
+    with ThreadPoolExecutor(max_workers=len(genres)) as pool:
+        futures = [(g, pool.submit(summarize_for_genre, job, source, g)) for g in genres]
+        outcomes = []
+        for g, future in futures:
+            try:
+                outcomes.append(future.result())
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"❌ {g} の要約に失敗: {e}")
+                job.progress(f"⚠️ {genre_label(g)} の要約に失敗しました: {e}")
+                outcomes.append({"genre": g, "label": genre_label(g), "error": str(e)})
+
+    done = [o for o in outcomes if "error" not in o]
+    if not done:
+        raise EmptySummary(title)
+    for o in done:
+        index_summary(source, o["genre"], o["summary_md"])
+
+    summary_md = "\n\n".join(f"# {o['label']}\n\n{o['summary_md']}" for o in done)
+    summary_html = "".join(f"<h2>{o['label']}</h2>{o['summary_html']}" for o in done)
+    labels = "・".join(o["label"] for o in done)
+    has_audio = deliver_once(job, f"{source['video_id']}:{','.join(sorted(o['genre'] for o in done))}", title,
+                             summary_md, cleaned_url, f"【要約・音声完了】{title}（{labels}）")
+    job.progress("✅ 処理完了")
+
+    return {
+        "title": title,
+        "video_url": cleaned_url,
+        "genre": ",".join(o["genre"] for o in done),
+        "text": source["cleaned"],
+        "summary_md": summary_md,
+        "summary_html": summary_html,
+        "has_audio": has_audio,
+        "duplicate_of": None,
+        "metadata": source["metadata"],
+        "routing": None,
+        "normalization": source["normalization"],
+        "entities": source["entities"],
+        "genres": [{k: v for k, v in o.items() if k != "summary_html"} for o in outcomes],
+    }
+
+
+def prepare_backfill_item(youtube_url: str, genre: str = "auto") -> dict:
+    """
+    バックフィル1件分の字幕取得・ジャンル決定・モデル選択を行い、バッチに入れる要求（request）を作る
+    要約済み・類似動画の要約を再利用できる動画や、長い動画（チャプター要約が先に必要）は request を None にし、
+    complete_backfill_item で通常の処理に回す
+    """
+    job = create_job(CAPTIONS_DIR, lane=BULK)
+    try:
+        source = prepare_transcript(job, youtube_url)
+        match = source["match"]
+        if genre == "auto" and match and duplicate_summary(match, match["genre"]):
+            genre = match["genre"]
+        if genre == "auto":
+            genre = detect_genre(source["cleaned"], source["title"], job)
+        job.usage_tags["genre"] = genre
+        match = genre_match(source, genre)
+        key = f"{source['video_id']}:{genre}"
+        entry = {"url": youtube_url, "key": key, "job": job, "source": source, "genre": genre, "request": None}
+        if (BACKEND.cache_get("summary", key) or (match and duplicate_summary(match, genre))
+                or (genre != TSUKKOMI_GENRE and is_chaptered(source))):
+            return entry
+        prompt = genre_prompt_builder(source, genre)(source["prompt_text"])
+        decision = choose_model(prompt, genre, job, "batch", source["video_id"])
+        entry["request"] = {"key": key, "model": decision["model"], "prompt": prompt}
+        return entry
+    except BaseException:
+        finish_job(job, "failed")
+        raise
+
+
+def complete_backfill_item(entry: dict, response=None, error: Optional[str] = None, elapsed_s: float = 0.0,
+                           fallback_sync: bool = True) -> dict:
+    """
+    バッチの応答で要約を確定し（応答がなければ通常の処理で要約し）、
+    キャッシュ・インデックス登録・TTS・メール送信まで行って結果の概要を返す
+    """
+    job, source, genre, request = entry["job"], entry["source"], entry["genre"], entry["request"]
+    summary = {"url": entry["url"], "video_id": source["video_id"], "genre": genre, "title": source["title"]}
+    status = "failed"
+    try:
+        if response is not None:
+            prompt_tokens, output_tokens = gemini_usage(response)
+            record_usage(job, "gemini", request["model"], key_name=REST_API_KEY_NAME, stage="batch", genre=genre,
+                         prompt_tokens=prompt_tokens, output_tokens=output_tokens, latency_ms=elapsed_s * 1000,
+                         cost_usd=gemini_cost(request["model"], prompt_tokens, output_tokens, batch=True))
+            summary_md, duplicate_of = finish_summary(source, genre, response.text), None
+            BACKEND.cache_set("summary", entry["key"], summary_md, ttl=SUMMARY_CACHE_TTL)
+            summary["via"] = "batch"
+        else:
+            if request is not None:
+                record_usage(job, "gemini", request["model"], key_name=REST_API_KEY_NAME, stage="batch",
+                             genre=genre, ok=False, error=error or "")
+                if not fallback_sync:
+                    raise RuntimeError(error)
+                job.progress(f"⚠️ バッチで要約できなかったため通常の呼び出しで要約します: {error}")
+            outcome = summarize_for_genre(job, source, genre)
+            summary_md, duplicate_of = outcome["summary_md"], outcome["duplicate_of"]
+            summary["via"] = "sync"
+        index_summary(source, genre, summary_md)
+        summary["has_audio"] = deliver_once(job, entry["key"], source["title"], summary_md, source["cleaned_url"],
+                                            f"【要約・音声完了】{source['title']}", duplicate_of)
+        status = "done"
+    except Exception as e:
+        print(f"❌ バックフィル失敗 ({entry['url']}, genre={genre}): {e}")
+        summary["error"] = str(e)
+    finally:
+        finish_job(job, status)
+    summary["status"] = status
+    return summary
+
+
+def collect_backfill(names: List[str], entries: Dict[str, dict], fallback_sync: bool = True,
+                     submitted_at: Optional[float] = None) -> List[dict]:
+    """投入済みのバッチの完了を待ち、結果を entries（キーごと）に突き合わせて配信する"""
+    print(f"⏳ バッチの完了を待っています: {', '.join(names)}（--resume {' '.join(names)} で再開できます）")
+    finished = BATCH_CLIENT.wait(names, interval=BATCH_POLL_INTERVAL, timeout=BATCH_TIMEOUT,
+                                 on_poll=lambda name, state: print(f"  {name}: {state}"))
+    elapsed_s = time.time() - submitted_at if submitted_at else 0.0
+    results = []
+    for name, batch in finished.items():
+        items = [entries[key]["request"] for key, entry in entries.items() if entry.get("batch") == name]
+        responses, errors = reconcile(items, batch)
+        state = batch_state(batch)
+        print(f"📦 {name}: {state}（成功 {len(responses)}件 / 失敗 {len(errors)}件）")
+        for item in items:
+            entry = entries[item["key"]]
+            response = responses.get(item["key"]) if state == SUCCEEDED else None
+            results.append(complete_backfill_item(entry, response, errors.get(item["key"], state), elapsed_s,
+                                                  fallback_sync))
+        manifest_path(BATCH_DIR, name).unlink(missing_ok=True)
+    return results
+
+
+def run_batch_backfill(urls: List[str], genre: str = "auto", concurrency: int = 2,
+                       max_requests: int = BATCH_MAX_REQUESTS, fallback_sync: bool = True) -> List[dict]:
+    """
+    複数の動画を Gemini Batch API でまとめて要約し、通常の処理と同じくキャッシュ・検索インデックス・TTS・
+    メール送信まで行う
+    1. 字幕取得・ジャンル決定・モデル選択（同時 concurrency 件。ジャンルの自動判定は通常の呼び出し）
+    2. 要求をモデルごとのバッチに詰めて投入し、完了まで BATCH_POLL_INTERVAL 秒ごとに確認する
+    3. 結果をキーで突き合わせて配信する（バッチで失敗した要求は fallback_sync なら通常の呼び出しで要約）
+    """
+    results, entries, direct = [], {}, []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [(url, pool.submit(prepare_backfill_item, url, genre)) for url in urls]
+        for url, future in futures:
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"❌ バックフィルの準備に失敗 ({url}): {e}")
+                results.append({"url": url, "genre": genre, "status": "failed", "error": str(e)})
+                continue
+            if entry["key"] in entries:
+                finish_job(entry["job"], "done")  # 同じ動画・ジャンルの重複指定
+            elif entry["request"] is None:
+                direct.append(entry)
+            else:
+                entries[entry["key"]] = entry
+
+    # バッチに入れない動画（要約済み・長い動画）は通常の処理で配信する
+    results.extend(complete_backfill_item(entry, fallback_sync=fallback_sync) for entry in direct)
+    if not entries:
+        return results
+
+    names = []
+    submitted_at = time.time()
+    for n, batch in enumerate(pack_requests([e["request"] for e in entries.values()], max_requests)):
+        label = f"backfill-{time.strftime('%Y%m%d-%H%M%S')}-{n}"
+        try:
+            name = BATCH_CLIENT.create_batch(batch["model"], batch["items"], label)["name"]
+        except Exception as e:
+            print(f"❌ バッチ投入失敗 ({batch['model']}, {len(batch['items'])}件): {e}")
+            for item in batch["items"]:
+                results.append(complete_backfill_item(entries.pop(item["key"]), error=str(e),
+                                                      fallback_sync=fallback_sync))
+            continue
+        print(f"📤 バッチ投入: {name} ({batch['model']}, {len(batch['items'])}件)")
+        for item in batch["items"]:
+            entries[item["key"]]["batch"] = name
+        names.append(name)
+        try:
+            save_manifest(BATCH_DIR, name, {
+                "name": name, "model": batch["model"], "submitted_at": submitted_at,
+                "items": [{"key": item["key"], "url": entries[item["key"]]["url"]} for item in batch["items"]],
+            })
+        except OSError as e:
+            print(f"⚠️ バッチの要求一覧を保存できませんでした（再開時は結果に残ったキーだけを回収します）: {e}")
+    if names:
+        results.extend(collect_backfill(names, entries, fallback_sync, submitted_at))
+    return results
+
+
+def resume_batch_backfill(names: List[str], fallback_sync: bool = True) -> List[dict]:
+    """
+    中断した run_batch_backfill の続き: 投入済みのバッチの完了を待って結果を配信する
+    投入時に保存した要求キー（動画ID:ジャンル）の一覧から字幕を取り直し（キャッシュ・保存済みの字幕を使う）、
+    配信に必要な情報を作る。失敗・期限切れ・キャンセルされたバッチの動画も fallback_sync なら通常の呼び出しで要約する
+    一覧がないバッチ（別の環境で投入したものなど）は結果に付いているキーだけを回収する
+    """
+    finished = BATCH_CLIENT.wait(names, interval=BATCH_POLL_INTERVAL, timeout=BATCH_TIMEOUT)
+    entries, results, submitted = {}, [], []
+    for name, batch in finished.items():
+        manifest = load_manifest(BATCH_DIR, name)
+        if manifest:
+            items, model = manifest["items"], manifest["model"]
+            submitted.append(manifest["submitted_at"])
+        else:
+            print(f"⚠️ {name} の要求一覧がないため、結果に含まれる動画だけを回収します")
+            items = [{"key": key, "url": f"https://www.youtube.com/watch?v={key.split(':', 1)[0]}"}
+                     for key in result_keys(batch)]
+            model = batch_model(batch)
+        for item in items:
+            key, url = item["key"], item["url"]
+            video_id, genre = key.split(":", 1)
+            try:
+                entry = prepare_backfill_item(url, genre)
+            except Exception as e:
+                print(f"❌ バックフィルの準備に失敗 ({url}): {e}")
+                results.append({"url": url, "video_id": video_id, "genre": genre, "status": "failed", "error": str(e)})
+                continue
+            entry.update(key=key, batch=name, request={"key": key, "model": model, "prompt": ""})
+            entries[key] = entry
+    return results + collect_backfill(list(finished), entries, fallback_sync, min(submitted, default=None))
+
+
+def build_market_digest(since: str, until: Optional[str] = None, genre: str = DIGEST_GENRE,
+                        job: Optional[Job] = None) -> Optional[dict]:
+    """
+    期間内（処理日）に作った genre の要約を銘柄・テーマでまとめ、1回の Gemini 呼び出しでダイジェストにする
+    字幕は使わず保存済みの要約だけを入力にする。対象の要約の組み合わせが同じならキャッシュを返す（呼び出しなし）
+    対象の要約がなければ None
+    """
+    docs = SEARCH_INDEX.summaries(genre, since, until, limit=DIGEST_MAX_VIDEOS)
+    if not docs:
+        return None
+    period = digest_period(since, until)
+    tickers = ENTITY_INDEX.tickers_for([d["video_id"] for d in docs])
+    for d in docs:
+        d["compact"] = compact_summary(d["summary"])
+    clusters = cluster_videos(docs, tickers)
+    prompt = build_digest_prompt(clusters, period, tickers)
+    print(f"📰 ダイジェスト対象: {period} の {len(docs)} 本 → {len(clusters)} グループ "
+          f"(要約 約{estimate_tokens(''.join(d['summary'] for d in docs))}トークン → プロンプト 約{estimate_tokens(prompt)}トークン)")
+
+    def digest() -> str:
+        decision = choose_model(prompt, genre, job, "digest", output_tokens=DIGEST_OUTPUT_TOKENS)
+        text = call_gemini(prompt, job, decision["model"], stage="digest", genre=genre)
+        if not text:
+            raise EmptySummary(f"ダイジェスト {period}")
+        return link_video_refs(text, docs)
+
+    # 要約の中身まで含めたキーにし、要約が増えた・作り直された場合だけ Gemini を呼ぶ
+    fingerprint = hashlib.sha1("\n".join(sorted(
+        f"{d['video_id']}:{hashlib.sha1(d['summary'].encode('utf-8')).hexdigest()}" for d in docs
+    )).encode("utf-8")).hexdigest()[:16]
+    summary_md = single_flight(BACKEND, "digest", f"{genre}:{fingerprint}", digest, ttl=DIGEST_CACHE_TTL,
+                               check=job.check if job else None)
+    return {
+        "title": f"マーケットダイジェスト {period}（{len(docs)}本）",
+        "period": period,
+        "genre": genre,
+        "summary_md": summary_md,
+        "summary_html": markdown.markdown(summary_md, extensions=["fenced_code", "tables"]),
+        "clusters": [{"label": c["label"], "codes": c["codes"],
+                      "videos": [{k: v[k] for k in ("video_id", "title", "url", "date")} for v in c["videos"]]}
+                     for c in clusters],
+    }
+
+
+def send_digest(digest: dict):
+    """ダイジェストをメールで送る（グループごとの動画一覧を付ける）"""
+    groups = "".join(
+        f"<h4>{c['label']}</h4><ul>" + "".join(
+            f"<li><a href=\"{v['url']}\" target=\"_blank\">{v['title']}</a> ({v['date']})</li>" for v in c["videos"]
+        ) + "</ul>"
+        for c in digest["clusters"]
+    )
+    html_body = (f"<html><body><h2>{digest['title']}</h2><div>{digest['summary_html']}</div>"
+                 f"<h3>📚 対象の動画</h3>{groups}</body></html>")
+    send_gmail(f"【ダイジェスト】{digest['title']}", html_body, GMAIL_TO)
+
+
+def fetch_live_captions(clean_url: str, job: Job,
+                        track: Optional[Tuple[str, bool]] = None) -> Tuple[Optional[Path], str]:
+    """配信中の字幕（track を選んでいればその1トラック）を取り直し、(VTTのパス, 配信状態 live_status) を返す"""
+    for p in job.workspace.glob("*.vtt"):
+        p.unlink()
+    status_file = job.workspace / "live_status.txt"
+    status_file.unlink(missing_ok=True)
+    cmd = build_caption_cmd(clean_url, job.workspace, track=track)
+    # 字幕と同じ yt-dlp 呼び出しで配信状態（is_live / was_live など）も書き出す
+    cmd[-1:-1] = ["--no-simulate", "--print-to-file", "live_status", str(status_file)]
+    try:
+        job.run_process(cmd)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        print(f"⚠️ yt-dlp 実行中に致命的なエラーが発生しました: {e}")
+        return None, "unknown"
+    status = status_file.read_text(encoding="utf-8").strip().splitlines() if status_file.exists() else []
+    return pick_caption_file(job.workspace), (status[-1] if status else "unknown")
+
+
+def _live_result(session: LiveSession, title: str, cleaned_url: str, genre: str, live_status: str) -> dict:
+    return {
+        "title": title,
+        "video_url": cleaned_url,
+        "genre": genre,
+        "live_status": live_status,
+        "revision": session.revision,
+        "covered_until": format_offset(session.covered_until),
+        "summary_md": session.summary,
+        "summary_html": markdown.markdown(session.summary, extensions=["fenced_code", "tables"]),
+        "has_audio": False,
+    }
+
+
+def run_live_pipeline(job: Job, youtube_url: str, genre: str = "auto", interval: int = LIVE_POLL_INTERVAL,
+                      milestone_minutes: int = LIVE_MILESTONE_MINUTES) -> dict:
+    """
+    ライブ配信の字幕を interval 秒ごとに取り直し、新しいキューだけを要約して累積の要約に統合する
+    Gemini に渡すのは「これまでの要約 + 前回以降の発言」だけで、配信が長くなっても入力は増えない
+    配信終了（または yt-dlp が状態を返さず字幕も増えない状態が続く）で最終版を配信する
+    """
+    job.progress(f"🔴 ライブ逐次要約を開始: {youtube_url} (job={job.id}, 間隔 {interval}秒)")
+    cleaned_url = clean_youtube_url(youtube_url)
+    video_id = extract_video_id(cleaned_url)
+    job.usage_tags["video_id"] = video_id
+    session = LiveSession(job.workspace / "live_transcript.txt")
+    title = video_id
+    milestone_step = milestone_minutes * 60
+    next_milestone = milestone_step if milestone_step else None
+    idle_polls = 0
+    metadata, track = None, None
+
+    while True:
+        # 取得する字幕トラックはメタデータの字幕一覧から1つ選ぶ（配信前・開始直後は字幕がまだないため、選べるまで毎回取り直す）
+        if track is None:
+            metadata = fetch_video_metadata(cleaned_url, job)
+            if metadata:
+                track = choose_caption_track(metadata)
+                if track:
+                    job.progress(f"🎯 字幕トラック: {track[0]} ({'自動' if track[1] else '手動'})")
+        if metadata and track is None:
+            # 字幕がまだない: 配信状態だけメタデータから取る
+            vtt_path, live_status = None, metadata["live_status"] or "unknown"
+        else:
+            vtt_path, live_status = fetch_live_captions(cleaned_url, job, track)
+        ended = live_status not in LIVE_ACTIVE_STATUSES and live_status != "unknown"
+        added = 0
+        if vtt_path:
+            title = vtt_path.stem
+            added = session.feed(vtt_path.read_text(encoding="utf-8"), final=ended)
+        idle_polls = 0 if added or live_status in LIVE_ACTIVE_STATUSES else idle_polls + 1
+        finished = ended or idle_polls >= LIVE_IDLE_POLLS
+        job.progress(f"🔄 字幕を確認 (status={live_status}, 新規 {added}行, 未要約 {len(session.pending)}行)")
+
+        if session.pending and (len(session.pending_text) >= LIVE_MIN_DELTA_CHARS or finished):
+            if genre == "auto":
+                genre = detect_genre(session.pending_text, title, job)
+                job.usage_tags["genre"] = genre
+            job.progress(f"▶ 差分を要約 ({len(session.pending)}行, genre={genre})")
+            prompt = create_live_prompt(session.summary, session.pending_text, title, cleaned_url, genre,
+                                        format_offset(session.covered_until))
+            decision = choose_model(prompt, genre, job, "live", video_id)
+            try:
+                summary = call_gemini(prompt, job, decision["model"], stage="live", genre=genre)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                # 一時的な 429 / 5xx で長時間の配信の要約全体を止めない（未要約の行は残して次回に回す）
+                print(f"⚠️ ライブ差分の要約でエラー: {e}")
+                job.progress(f"⚠️ 差分の要約でエラーが発生しました: {e}")
+                summary = None
+            if summary:
+                session.commit(summary)
+                job.result = _live_result(session, title, cleaned_url, genre, live_status)
+                job.progress(f"📝 要約を更新しました（第{session.revision}版・{format_offset(session.covered_until)}まで）")
+                if next_milestone is not None and not finished and session.covered_until >= next_milestone:
+                    deliver_summary(job, title, session.summary, cleaned_url,
+                                    f"【ライブ要約・{format_offset(session.covered_until)}時点】{title}", with_audio=False)
+                    while next_milestone <= session.covered_until:
+                        next_milestone += milestone_step
+            else:
+                job.progress("⚠️ 差分の要約に失敗しました。次回の確認時に再試行します")
+
+        if finished:
+            break
+        job.wait(interval)
+
+    if not session.summary:
+        raise CaptionsNotFound(cleaned_url)
+
+    transcript = session.transcript_path.read_text(encoding="utf-8")
+    BACKEND.cache_set("summary", f"{video_id}:{genre}", session.summary, ttl=SUMMARY_CACHE_TTL)
+    try:
+        SEARCH_INDEX.add(video_id, genre, title, cleaned_url, transcript, session.summary)
+    except Exception as e:
+        print(f"⚠️ 検索インデックス登録失敗: {e}")
+
+    job.check()
+    result = _live_result(session, title, cleaned_url, genre, live_status)
+    result["has_audio"] = deliver_summary(job, title, session.summary, cleaned_url, f"【ライブ要約・最終版】{title}")
+    job.result = result
+    job.progress("✅ ライブ逐次要約が完了しました")
+    return result
+
+
+def _rejected_response(e: AdmissionRejected, as_json: bool = False):
+    """429/503 応答（Retry-After 付き）"""
+    print(f"🚦 受付拒否 ({e.status}): {e.reason} / Retry-After={e.retry_after}s")
+    headers = {"Retry-After": str(e.retry_after)}
+    if as_json:
+        return jsonify({"error": e.reason, "retry_after": e.retry_after}), e.status, headers
+    html = f"<h2>🚦 {e.reason}</h2><p>約{e.retry_after}秒後に再度お試しください。</p><p><a href=\"/\">戻る</a></p>"
+    return html, e.status, headers
+
+
+def _client_key(youtube_url: str) -> str:
+    """再送信検知用のキー（同じクライアントから同じ動画が再送信されたら旧ジョブをキャンセル）"""
+    return f"{request.remote_addr}|{clean_youtube_url(youtube_url)}"
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     youtube_url = None
-    mp3_generated = False
     genre = "auto" # default
 
     # テンプレートに渡すジャンルリスト (プルダウン用)
@@ -367,26 +1565,17 @@ def index():
 
     if request.method == "POST":
         youtube_url = request.form.get("youtube_url")
-        genre = request.form.get("genre", "auto")
+        genre = _requested_genres() or request.form.get("genre", "auto")
     elif request.method == "GET":
         # ブックマークレット対応: URLパラメータから動画URLを取得
         youtube_url = request.args.get("url")
+        genre = request.args.get("genre", "auto")
 
     # Gmail認証チェック
-    needs_gmail_auth = not os.path.exists(TOKEN_FILE)
+    needs_gmail_auth = not ensure_gmail_token()
 
     if not youtube_url:
-        return render_template("index.html", error_message="URLが指定されていません" if request.method == "POST" else None, genres=genres_for_template, needs_gmail_auth=needs_gmail_auth)
-
-    # 重複処理防止: セッションで最後に処理したURLを追跡
-    # from flask import session
-    # last_processed_url = session.get('last_processed_url')
-    
-    # GETリクエスト（ブックマークレット）の場合、同じURLを繰り返し処理しない
-    # FIXME: 一旦無効化 - デバッグ中
-    # if request.method == "GET" and youtube_url == last_processed_url:
-    #     print(f"⚠️ このURLは既に処理済みです: {youtube_url}")
-    #     return render_template("index.html", error_message="このURLは既に処理済みです。新しい動画を選択してください。", genres=genres_for_template, needs_gmail_auth=needs_gmail_auth)
+        return render_template("index.html", error_message="URLが指定されていません" if request.method == "POST" else None, genres=genres_for_template, needs_gmail_auth=needs_gmail_auth, admission=ADMISSION.snapshot(), tsukkomi=(TSUKKOMI_GENRE, TSUKKOMI_LABEL))
 
     # デバッグ: 受信したURLを確認
     print(f"\n{'='*50}")
@@ -396,140 +1585,363 @@ def index():
     print(f"   ジャンル: {genre}")
     print(f"{'='*50}\n")
 
+    # 受け付けられない場合は処理を始める前に即座に 429/503 を返す
     try:
-        print("\n==============================")
-        print(f"✅ 受信URL: {youtube_url}")
-        print("==============================")
+        ADMISSION.reserve(request.remote_addr)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
 
-        cleaned_url = clean_youtube_url(youtube_url)
+    try:
+        job = create_job(CAPTIONS_DIR, client_key=_client_key(youtube_url))
+    except BaseException:
+        # slot に入る前に失敗したら予約を戻す（戻さないとこのクライアントは 429 のままになる）
+        ADMISSION.cancel_reservation(request.remote_addr)
+        raise
+    status = "failed"
+    try:
+        with ADMISSION.slot(request.remote_addr, check=job.check):
+            result = run_summary_pipeline(job, youtube_url, genre)
+        status = "done"
 
+        # 結果表示
+        escaped_text = result["text"].replace("<", "&lt;").replace(">", "&gt;")
 
+        return render_template(
+            "result.html",
+            title=result["title"],
+            video_url=result["video_url"],
+            text=escaped_text,
+            summary_html=result["summary_html"],
+            has_audio=result["has_audio"],
+            metadata=result["metadata"],
+            routing=result["routing"],
+            normalization=result["normalization"],
+            upload_date=format_upload_date(result["metadata"]["upload_date"]) if result["metadata"] else "",
+        )
 
-        vtt_path = download_captions(cleaned_url)
-        
-        if vtt_path is None:
-            return """<h2>❌ 字幕の取得に失敗しました</h2>
-            <p>以下の理由が考えられます：</p>
-            <ul>
-                <li>動画に字幕が設定されていない</li>
-                <li>動画が非公開または削除されている</li>
-                <li>yt-dlpによる字幕取得に失敗した</li>
-            </ul>
-            <p><a href="/">戻る</a></p>""", 500
-        
-        title = vtt_path.stem
-        cleaned = clean_text(parse_vtt(vtt_path))
+    except AdmissionRejected as e:
+        return _rejected_response(e)
+    except JobCancelled:
+        print(f"🛑 ジョブ {job.id} はキャンセルされました（配信をスキップ）")
+        return "<h2>🛑 処理はキャンセルされました</h2><p><a href=\"/\">戻る</a></p>", 409
+    except CaptionsNotFound:
+        return CAPTIONS_ERROR_HTML, 500
+    except EmptySummary:
+        return "<h2>❌ Gemini要約取得に失敗しました。</h2>", 500
+    except FileNotFoundError as e:
+        return f"<h2>❌ エラー発生</h2><p>字幕ダウンロードに失敗しました。</p><pre>{str(e)}</pre>", 500
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return f"<h2>❌ エラー発生</h2><pre>{str(e)}</pre>", 500
+    finally:
+        # 処理が成功しても失敗しても、必ずジョブの作業フォルダをクリーンアップ
+        finish_job(job, status)
 
-        # テキスト保存
-        txt_path = CAPTIONS_DIR / f"{title}.txt"
-        with txt_path.open("w", encoding="utf-8") as f:
-            f.write(cleaned)
-        print(f"✅ 字幕テキスト保存: {txt_path}")
 
-        if genre == "auto":
-            genre = detect_genre(cleaned, title)
+def _requested_genres() -> str:
+    """複数ジャンルの同時実行: チェックボックス（genres）で選ばれたジャンルをカンマ区切りにする"""
+    return ",".join(request.form.getlist("genres") or request.args.getlist("genres"))
 
-        # Gemini
-        prompt = create_prompt(cleaned, title, youtube_url, genre)
-        summary_md = call_gemini(prompt)
 
-        if not summary_md:
-            return "<h2>❌ Gemini要約取得に失敗しました。</h2>", 500
+def _request_lane(default: str) -> str:
+    """リクエストの優先度レーン（interactive / bulk）"""
+    lane = request.form.get("lane") or request.args.get("lane") or default
+    return lane if lane in LANES else default
 
-        # TTS処理
-        summary_for_tts = extract_summary_ssml(summary_md)
-        if summary_for_tts:
-            mp3_generated = generate_gcp_tts_mp3(summary_for_tts, TEMP_MP3_FILE)
 
-        # メール送信
-        summary_html = markdown.markdown(summary_md, extensions=["fenced_code", "tables"])
-        html_body = format_as_html(title, summary_md, cleaned_url)
-        subject = f"【要約・音声完了】{title}"
+def _run_job_in_background(job: Job, youtube_url: str, genre: str, client: str):
+    status = "failed"
+    try:
+        job.progress(f"⏳ 実行枠を待機中 (lane={job.lane})")
+        with ADMISSION.slot(client, lane=job.lane, check=job.check):
+            job.result = run_summary_pipeline(job, youtube_url, genre)
+        status = "done"
+    except AdmissionRejected as e:
+        job.progress(f"🚦 {e.reason}")
+    except JobCancelled:
+        job.progress("🛑 処理はキャンセルされました")
+    except CaptionsNotFound:
+        job.progress("❌ 字幕の取得に失敗しました")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        job.progress(f"❌ エラー発生: {e}")
+    finally:
+        finish_job(job, status)
 
-        attachment_to_send = TEMP_MP3_FILE if mp3_generated and os.path.exists(TEMP_MP3_FILE) else None
-        send_gmail(subject, html_body, GMAIL_TO, attachment_to_send)
 
-        # メール送信完了後にクリーンアップ
-        print("🧹 [メール送信後] captionsフォルダをクリーンアップ中...")
+@app.route("/jobs", methods=["POST"])
+def start_job():
+    """ジョブをバックグラウンドで開始し、進捗ストリームとキャンセル用のURLを返す"""
+    youtube_url = request.form.get("youtube_url") or request.args.get("url")
+    genre = _requested_genres() or request.form.get("genre") or request.args.get("genre", "auto")
+    if not youtube_url:
+        return jsonify({"error": "URLが指定されていません"}), 400
+
+    lane = _request_lane(INTERACTIVE)
+    try:
+        ADMISSION.reserve(request.remote_addr, lane)
+    except AdmissionRejected as e:
+        return _rejected_response(e, as_json=True)
+
+    job = None
+    try:
+        job = create_job(CAPTIONS_DIR, client_key=_client_key(youtube_url), lane=lane)
+        threading.Thread(target=_run_job_in_background, args=(job, youtube_url, genre, request.remote_addr), daemon=True).start()
+    except BaseException:
+        # スレッドが始まらなければ予約を戻す（戻さないとこのクライアントは 429 のままになる）
+        ADMISSION.cancel_reservation(request.remote_addr)
+        if job:
+            finish_job(job, "failed")
+        raise
+    return jsonify({
+        "job_id": job.id,
+        "events_url": url_for("job_events", job_id=job.id),
+        "cancel_url": url_for("job_cancel", job_id=job.id),
+    }), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    return jsonify({"job_id": job.id, "status": job.status, "events": job.events, "result": job.result})
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    進捗を Server-Sent Events で配信する
+    ストリームの途中でクライアントが切断した場合はジョブをキャンセルする（keep=1 のときは継続）
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    cancel_on_disconnect = request.args.get("keep") != "1"
+
+    def generate():
+        sent = 0
         try:
-            for file in CAPTIONS_DIR.iterdir():
-                if file.is_file():
-                    try:
-                        file.unlink()
-                        print(f"  🗑️ 削除: {file.name}")
-                    except Exception as e:
-                        # ._*ファイルの削除エラーは無視（次回処理で上書きされる）
-                        print(f"  ⚠️ 削除失敗（無視）: {file.name}")
-        except Exception as e:
-            print(f"⚠️ クリーンアップエラー: {e}")
-        print("✅ [メール送信後] クリーンアップ完了")
+            while True:
+                while sent < len(job.events):
+                    yield f"data: {job.events[sent]}\n\n"
+                    sent += 1
+                if job.status != "running":
+                    yield f"event: {job.status}\ndata: {job.status}\n\n"
+                    return
+                # 切断検知のため定期的に書き込む（書き込み失敗でGeneratorExitになる）
+                yield ": keep-alive\n\n"
+                time.sleep(0.5)
+        except GeneratorExit:
+            if job.status == "running" and cancel_on_disconnect:
+                print(f"🔌 クライアント切断を検知: ジョブ {job.id} をキャンセルします")
+                job.cancel()
+            raise
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    if cancel_job(job_id):
+        return jsonify({"job_id": job_id, "status": "cancelled"})
+    return jsonify({"error": "実行中のジョブが見つかりません"}), 404
+
+
+def _run_live_job(job: Job, youtube_url: str, genre: str, interval: int, milestone_minutes: int):
+    status = "failed"
+    try:
+        run_live_pipeline(job, youtube_url, genre, interval, milestone_minutes)
+        status = "done"
+    except JobCancelled:
+        job.progress("🛑 ライブ逐次要約はキャンセルされました")
+    except CaptionsNotFound:
+        job.progress("❌ 字幕を取得できませんでした")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        job.progress(f"❌ エラー発生: {e}")
+    finally:
+        finish_job(job, status)
+        LIVE_SESSIONS.release()
 
-        # 一時TTSファイル削除
-        if os.path.exists(TEMP_MP3_FILE):
-            os.remove(TEMP_MP3_FILE)
-            print(f"🗑️ 一時TTSファイル削除: {TEMP_MP3_FILE}")
 
-        # 結果表示
-        escaped_text = cleaned.replace("<", "&lt;").replace(">", "&gt;")
-        
-        # 処理完了したURLをセッションに記録（重複処理防止用）
-        # FIXME: 一旦無効化 - デバッグ中
-        # session['last_processed_url'] = youtube_url
-        
-        return render_template(
-            "result.html",
-            title=title,
-            video_url=cleaned_url,
-            text=escaped_text,
-            summary_html=summary_html,
-            has_audio=bool(attachment_to_send)
-        )
+@app.route("/live", methods=["GET", "POST"])
+def live():
+    """ライブ配信の逐次要約を開始し、更新を受け取るページを返す"""
+    youtube_url = request.form.get("youtube_url") or request.args.get("url")
+    if not youtube_url:
+        return redirect(url_for("index"))
+    genre = request.values.get("genre", "auto")
+    interval = max(30, request.values.get("interval", LIVE_POLL_INTERVAL, type=int))
+    milestone_minutes = max(0, request.values.get("milestone_minutes", LIVE_MILESTONE_MINUTES, type=int))
 
-    except FileNotFoundError as e:
-        return f"<h2>❌ エラー発生</h2><p>字幕ダウンロードに失敗しました。</p><pre>{str(e)}</pre>", 500
+    if not LIVE_SESSIONS.acquire(blocking=False):
+        return _rejected_response(AdmissionRejected(503, interval, "同時に追跡できるライブ配信の数が上限に達しています"))
+    job = None
+    try:
+        job = create_job(CAPTIONS_DIR, client_key=f"live|{_client_key(youtube_url)}")
+        threading.Thread(
+            target=_run_live_job, args=(job, youtube_url, genre, interval, milestone_minutes), daemon=True
+        ).start()
+    except BaseException:
+        # スレッドが始まらなければ追跡枠を返す（返さないと枠が埋まったまま 503 を返し続ける）
+        LIVE_SESSIONS.release()
+        if job:
+            finish_job(job, "failed")
+        raise
+    return render_template(
+        "live.html",
+        video_url=clean_youtube_url(youtube_url),
+        interval=interval,
+        milestone_minutes=milestone_minutes,
+        status_url=url_for("job_status", job_id=job.id),
+        # ページを閉じても配信終了まで追跡を続ける（停止はキャンセルボタンで行う）
+        events_url=url_for("job_events", job_id=job.id, keep=1),
+        cancel_url=url_for("job_cancel", job_id=job.id),
+    )
+
+
+@app.route("/search")
+def search():
+    """字幕・要約の全文検索"""
+    query = request.args.get("q", "").strip()
+    genre = request.args.get("genre") or None
+    since = request.args.get("since") or None
+    page = max(1, request.args.get("page", 1, type=int))
+    result = SEARCH_INDEX.search(query, genre=genre, since=since, page=page) if query else None
+    if request.args.get("format") == "json":
+        return jsonify(result or {"results": []})
+    genres_for_template = {k: v["label"] for k, v in PROMPTS.items()}
+    return render_template("search.html", query=query, genre=genre, since=since, result=result, genres=genres_for_template)
+
+
+@app.route("/digest", methods=["GET", "POST"])
+def digest():
+    """期間内の要約を統合したマーケットダイジェスト（POST でメール送信も行う）"""
+    since = request.values.get("since") or time.strftime("%Y-%m-%d")
+    until = request.values.get("until") or None
+    genre = request.values.get("genre") or DIGEST_GENRE
+    try:
+        result = build_market_digest(since, until, genre)
+    except Exception as e:
+        print(f"❌ ダイジェストの作成に失敗: {e}")
+        return f"<h2>❌ ダイジェストの作成に失敗しました</h2><p>{e}</p><p><a href=\"/\">戻る</a></p>", 500
+    sent = False
+    if result and request.method == "POST":
+        send_digest(result)
+        sent = True
+    if request.values.get("format") == "json":
+        return jsonify({**(result or {}), "since": since, "until": until, "sent": sent})
+    return render_template("digest.html", since=since, until=until, genre=genre, result=result, sent=sent,
+                           genres={k: v["label"] for k, v in PROMPTS.items()})
+
+
+@app.route("/entities")
+def entities():
+    """銘柄から、その銘柄に言及した動画と言及位置を引く（q なしなら期間内に言及の多かった銘柄の一覧）"""
+    query = request.args.get("q", "").strip()
+    since = request.args.get("since") or time.strftime("%Y-%m-%d", time.localtime(time.time() - 30 * 86400))
+    until = request.args.get("until") or None
+    code = ENTITY_EXTRACTOR.resolve(query) if query else None
+    entity = ENTITY_EXTRACTOR.entities.get(code) if code else None
+    videos = ENTITY_INDEX.videos(code, since, until) if code else []
+    for v in videos:
+        v["positions"] = [{"label": format_offset(ms / 1000), "url": deep_link(v["url"], ms / 1000)}
+                          for ms in v["positions_ms"]]
+    top = None if query else ENTITY_INDEX.top(since, until)
+    if request.args.get("format") == "json":
+        return jsonify({"query": query, "code": code, "entity": entity, "since": since, "until": until,
+                        "videos": videos, "top": top})
+    return render_template("entities.html", query=query, code=code, entity=entity, since=since, until=until,
+                           videos=videos, top=top)
+
+
+USAGE_LABELS = {"day": "日付", "genre": "ジャンル", "channel": "チャンネル", "key_name": "APIキー",
+                "model": "モデル", "stage": "工程", "kind": "種別"}
+
+
+@app.route("/usage")
+def usage():
+    """Gemini / TTS の利用量・推定費用の集計（by=genre,stage のようにカンマ区切りで集計単位を指定）"""
+    group_by = [c for c in request.args.get("by", "day").split(",") if c in GROUP_COLUMNS] or ["day"]
+    since = request.args.get("since") or time.strftime("%Y-%m-%d", time.localtime(time.time() - 30 * 86400))
+    until = request.args.get("until") or None
+    rows = USAGE_LEDGER.aggregate(group_by, since, until)
+    totals = USAGE_LEDGER.totals(since, until)
+    if request.args.get("format") == "json":
+        return jsonify({"group_by": group_by, "since": since, "until": until, "totals": totals, "rows": rows})
+    return render_template("usage.html", group_by=group_by, since=since, until=until, rows=rows, totals=totals,
+                           labels=USAGE_LABELS, genres={k: v["label"] for k, v in PROMPTS.items()})
+
+
+@app.route("/admission")
+def admission_status():
+    """流入制御の現在の状態（実行中・待機中の件数と待ち時間の見積もり）"""
+    snapshot = ADMISSION.snapshot()
+    snapshot["shared_queue_depth"] = BACKEND.queue_length(SUMMARY_QUEUE)
+    return jsonify(snapshot)
+
+
+@app.route("/queue", methods=["POST"])
+def enqueue_job():
+    """共有キューにジョブを登録する（いずれかのノードの worker.py が処理する）"""
+    youtube_url = request.form.get("youtube_url") or request.args.get("url")
+    genre = _requested_genres() or request.form.get("genre") or request.args.get("genre", "auto")
+    if not youtube_url:
+        return jsonify({"error": "URLが指定されていません"}), 400
+    # 共有キューにも上限を設け、溢れた分はワーカーの処理時間から Retry-After を見積もって返す
+    depth = BACKEND.queue_length(SUMMARY_QUEUE)
+    if depth >= MAX_SHARED_QUEUE_DEPTH:
+        retry_after = int(ADMISSION.snapshot()["avg_service_s"] * depth / max(1, ADMISSION.max_running))
+        return _rejected_response(AdmissionRejected(503, max(1, retry_after), "キューが満杯です"), as_json=True)
+    # 共有キューはバックフィル用途が主なので既定は bulk レーン
+    queue_id = BACKEND.enqueue(SUMMARY_QUEUE, {"url": youtube_url, "genre": genre, "lane": _request_lane(BULK)})
+    return jsonify({"queue_id": queue_id, "status_url": url_for("queued_job_status", queue_id=queue_id)}), 202
+
+
+@app.route("/queue/<queue_id>")
+def queued_job_status(queue_id):
+    info = BACKEND.job_info(queue_id)
+    if info is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    return jsonify(info)
+
+
+def process_queued_job(queue_id: str, payload: dict):
+    """共有キューから取り出したジョブを1件処理し、結果をバックエンドに記録する"""
+    lane = payload.get("lane", BULK)
+    job = create_job(CAPTIONS_DIR, lane=lane)
+    status = "failed"
+    try:
+        # キュー経由のジョブも同じ実行枠を使い、対話リクエストとの公平性を保つ
+        with ADMISSION.gate.slot(lane, check=job.check):
+            result = run_summary_pipeline(job, payload["url"], payload.get("genre", "auto"))
+        status = "done"
+        BACKEND.complete(queue_id, "done", {k: result.get(k) for k in ("title", "video_url", "genre", "summary_md", "has_audio", "duplicate_of", "metadata", "routing", "normalization", "entities", "genres")})
+    except JobCancelled:
+        BACKEND.complete(queue_id, "cancelled")
+    except CaptionsNotFound:
+        BACKEND.complete(queue_id, "failed", {"error": "字幕の取得に失敗しました"})
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return f"<h2>❌ エラー発生</h2><pre>{str(e)}</pre>", 500
+        BACKEND.complete(queue_id, "failed", {"error": str(e)})
     finally:
-        # 処理が成功しても失敗しても、必ずcaptionsフォルダーをクリーンアップ
-        import datetime
-        import subprocess
-        log_msg = f"\n[{datetime.datetime.now()}] FINALLY: クリーンアップ開始\n"
-        print("\n🧹 [FINALLY] 字幕ファイルをクリーンアップ中...")
-        
-        try:
-            # globで明示的にファイルのリストを取得
-            all_files = [f for f in CAPTIONS_DIR.glob("*") if f.is_file() and not f.name.startswith("._")]
-            log_msg += f"  対象ファイル数: {len(all_files)}\n"
-            print(f"  対象ファイル数: {len(all_files)}")
-            
-            # 各ファイルを個別に削除（外部HDDでPythonのunlink()が動作しないため、rmコマンドを使用）
-            deleted_count = 0
-            for file in all_files:
-                result = subprocess.run(["rm", "-f", str(file)], capture_output=True, text=True)
-                if result.returncode == 0:
-                    deleted_count += 1
-                else:
-                    log_msg += f"  削除失敗: {file.name} - {result.stderr}\n"
-            
-            # 削除後のファイル数を確認
-            after_files = [f for f in CAPTIONS_DIR.glob("*") if f.is_file() and not f.name.startswith("._")]
-            deleted_count = len(before_files) - len(after_files)
-            
-            log_msg += f"クリーンアップ完了: 削除={deleted_count}, 残り={len(after_files)}\n"
-            print(f"✅ [FINALLY] クリーンアップ完了: 削除={deleted_count}, 残り={len(after_files)}\n")
-            
-        except Exception as e:
-            log_msg += f"クリーンアップ処理でエラー: {e}\n"
-            print(f"❌ [FINALLY] クリーンアップ処理でエラー: {e}\n")
-        
-        # デバッグログをファイルに出力
-        try:
-            with open(CAPTIONS_DIR.parent / "cleanup_debug.log", "a", encoding="utf-8") as f:
-                f.write(log_msg)
-        except Exception as log_error:
-            print(f"⚠️ ログファイル書き込みエラー: {log_error}")
+        finish_job(job, status)
+
+
+def queue_worker_loop(worker_no: int):
+    print(f"👷 ワーカー{worker_no} 起動: キュー '{SUMMARY_QUEUE}' を監視中...")
+    while True:
+        item = BACKEND.dequeue(SUMMARY_QUEUE, timeout=5)
+        if item is None:
+            continue
+        queue_id, payload = item
+        print(f"📥 ワーカー{worker_no}: ジョブ {queue_id} を取得 ({payload.get('url')}, lane={payload.get('lane', BULK)})")
+        process_queued_job(queue_id, payload)
 
 
 @app.route("/auth")
@@ -539,6 +1951,8 @@ def auth():
         creds = flow.run_local_server(port=0)
         with open("token.json", "w") as token:
             token.write(creds.to_json())
+        # 他のノードでもメール送信できるよう共有バックエンドにも保存
+        BACKEND.cache_set("secrets", "gmail_token", creds.to_json())
         flash("✅ Gmail認証が完了しました", "success")
         return redirect(url_for("index"))
     except Exception as e:
@@ -554,8 +1968,11 @@ def extract_summary_ssml(output: str) -> Optional[str]:
         return None
 
     # フォールバック: 先頭1500文字程度を利用
+    # タイムスタンプのリンクは読み上げない（他のリンクは表示テキストだけ残す）
+    text = re.sub(r"\[\d+:\d\d:\d\d\]\([^)]*\)", "", output)
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
     # Markdown記号 (#, *) を削除
-    text = re.sub(r"[#*]", "", output)     
+    text = re.sub(r"[#*]", "", text)     
     text = re.sub(r"`+", "", text)
     text = text.strip()[:1500]
     
@@ -573,7 +1990,22 @@ def extract_summary_ssml(output: str) -> Optional[str]:
     return ssml
 
 
-def generate_gcp_tts_mp3(text_to_read: str, output_filepath: str) -> bool:
+def build_tts_request(ssml: str) -> dict:
+    """synthesize_speech に渡す引数（入力・音声・出力設定）を組み立てる"""
+    return {
+        "input": texttospeech.SynthesisInput(ssml=ssml),
+        "voice": texttospeech.VoiceSelectionParams(
+            language_code="ja-JP",
+            name=TTS_VOICE_NAME
+        ),
+        "audio_config": texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.MP3,
+            speaking_rate=TTS_SPEAKING_RATE
+        ),
+    }
+
+
+def generate_gcp_tts_mp3(text_to_read: str, output_filepath: str, job: Optional[Job] = None) -> bool:
     if not text_to_read:
         print("⚠️ TTS用テキストが空のためスキップ")
         return False
@@ -582,19 +2014,16 @@ def generate_gcp_tts_mp3(text_to_read: str, output_filepath: str) -> bool:
 
     try:
         client = texttospeech.TextToSpeechClient()
-        synthesis_input = texttospeech.SynthesisInput(ssml=text_to_read)
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="ja-JP",
-            name=TTS_VOICE_NAME
-        )
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=TTS_SPEAKING_RATE
-        )
+        tts_request = build_tts_request(text_to_read)
 
-        response = client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+        started = time.perf_counter()
+        if job:
+            response = job.run_cancellable(client.synthesize_speech, **tts_request)
+        else:
+            response = client.synthesize_speech(**tts_request)
+        record_usage(job, "tts", TTS_VOICE_NAME, stage="tts", characters=len(text_to_read),
+                     latency_ms=(time.perf_counter() - started) * 1000,
+                     cost_usd=tts_cost(TTS_VOICE_NAME, len(text_to_read)))
 
         with open(output_filepath, "wb") as out:
             out.write(response.audio_content)
@@ -603,8 +2032,11 @@ def generate_gcp_tts_mp3(text_to_read: str, output_filepath: str) -> bool:
         print(f"✅ TTS音声ファイル生成: {output_filepath} ({size} bytes)")
         return True
 
+    except JobCancelled:
+        raise
     except Exception as e:
         print(f"❌ Google Cloud TTS エラー: {e}")
+        record_usage(job, "tts", TTS_VOICE_NAME, stage="tts", characters=len(text_to_read), ok=False, error=str(e))
         return False
 
 
@@ -622,6 +2054,10 @@ def shutdown():
 if __name__ == "__main__":
     import os
     port = int(os.environ.get("PORT", 8080))
+    # EMBEDDED_WORKERS を指定すると共有キューのワーカーを同じプロセスで動かす
+    # （対話リクエストと実行枠・Gemini枠を共有するため、バックフィル中も対話リクエストが優先される）
+    for i in range(int(os.environ.get("EMBEDDED_WORKERS", 0))):
+        threading.Thread(target=queue_worker_loop, args=(i,), daemon=True).start()
     # debug=True はファイル変更時に自動リロードされ、リクエストが重複実行される可能性があるため無効化
     app.run(host="0.0.0.0", port=port, debug=False)
 
@@ -0,0 +1,237 @@
+"""
+YouTube Insight Gen の ASGI フロントエンド（uvicorn で起動）
+
+- `/` に動画URL付きで届いた要約リクエストは、同期版と同じ run_summary_pipeline をスレッドプールで実行する
+  (受付制御・Gemini の優先度・キャッシュ・配信の重複防止・索引登録などは同期版と共通)
+- パイプライン自体は asyncio ネイティブではない（yt-dlp・Gemini・TTS はスレッド内で同期的に待つ）。
+  同時に処理できる数は PIPELINE_EXECUTOR のスレッド数と受付制御の上限で決まる
+- 処理を待つ間はイベントループを解放し、クライアントが切断したらジョブをキャンセルする
+- フォーム表示、/auth、/jobs などそれ以外のルートは既存の Flask アプリへそのまま委譲する
+- /tsukkomi/ 以下はツッコミ分析アプリ (app_tsukkomi.py) へ委譲する
+
+起動: python app_asgi.py  (uvicorn で PORT=8080 を待ち受け)
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template
+
+from app import (ADMISSION, CAPTIONS_DIR, CAPTIONS_ERROR_HTML, TRUSTED_PROXY_HOPS, CaptionsNotFound, EmptySummary,
+                 _rejected_response, clean_youtube_url, run_summary_pipeline)
+from app import app as flask_app
+from app_tsukkomi import app as tsukkomi_flask_app
+from utils.admission import AdmissionRejected, forwarded_client
+from utils.jobs import JobCancelled, create_job, finish_job
+from utils.video_meta import format_upload_date
+
+TSUKKOMI_PREFIX = "/tsukkomi"
+# パイプラインを実行するスレッド（実行枠の待機中もスレッドを使うため、実行中＋待機列の上限まで用意する）
+# asyncio.to_thread の既定のスレッド数は CPU 数から決まり、受付制御の上限より先に頭打ちになることがある
+PIPELINE_EXECUTOR = ThreadPoolExecutor(max_workers=ADMISSION.max_running + ADMISSION.max_queued,
+                                       thread_name_prefix="pipeline")
+
+
+# ===============================
+# 要約パイプライン（同期版と共通）
+# ===============================
+async def run_summary_in_thread(client: str, youtube_url: str, genre: str = "auto") -> dict:
+    """
+    run_summary_pipeline をジョブとして PIPELINE_EXECUTOR のスレッドで実行する
+    待っている間にタスクがキャンセルされたらジョブもキャンセルし、yt-dlp の子プロセスや Gemini の待ちを打ち切る
+    スレッドが始まった後の片付け（実行枠・ジョブ）はスレッド側で行う（キャンセル後もスレッドが抜けるまで作業フォルダを
+    使うため）。スレッドが始まる前に終わった場合（ジョブ作成の失敗・待機中のキャンセル）はここで予約とジョブを戻す
+    """
+    ADMISSION.reserve(client)
+    job, future = None, None
+
+    def run() -> dict:
+        status = "failed"
+        try:
+            with ADMISSION.slot(client, check=job.check):
+                result = run_summary_pipeline(job, youtube_url, genre)
+            status = "done"
+            return result
+        finally:
+            finish_job(job, status)
+
+    try:
+        job = create_job(CAPTIONS_DIR, client_key=f"{client}|{clean_youtube_url(youtube_url)}")
+        future = PIPELINE_EXECUTOR.submit(run)
+        return await asyncio.wrap_future(future)
+    finally:
+        # cancel() は開始前なら取り消して True、実行中・終了済みなら False を返す
+        if future is None or future.cancel():
+            ADMISSION.cancel_reservation(client)
+            if job:
+                job.cancel()
+                finish_job(job, "cancelled")
+        elif not future.done():
+            job.cancel()
+
+
+# ===============================
+# ASGI アプリケーション
+# ===============================
+flask_asgi = WsgiToAsgi(flask_app)
+tsukkomi_asgi = WsgiToAsgi(tsukkomi_flask_app)
+
+
+async def _send_html(send, status: int, html: str, headers: Optional[list] = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/html; charset=utf-8")] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": html.encode("utf-8")})
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return body
+
+
+def _replay(body: bytes, receive):
+    """読み取り済みのボディを委譲先のアプリへ再送するための receive ラッパー"""
+    replayed = False
+
+    async def _receive():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return _receive
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _handle_summarize(receive, send, client: str, youtube_url: str, genre: str):
+    started = time.perf_counter()
+    task = asyncio.create_task(run_summary_in_thread(client, youtube_url, genre))
+    disconnect = asyncio.create_task(_wait_disconnect(receive))
+    await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+
+    if not task.done():
+        # 応答を待つクライアントがいないので処理を打ち切る
+        print("🔌 クライアント切断を検知: 要約処理をキャンセルします")
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        return
+    disconnect.cancel()
+
+    try:
+        result = task.result()
+    except AdmissionRejected as e:
+        html, status, headers = _rejected_response(e)
+        return await _send_html(send, status, html, [(k.lower().encode(), v.encode()) for k, v in headers.items()])
+    except JobCancelled:
+        return await _send_html(send, 409, "<h2>🛑 処理はキャンセルされました</h2><p><a href=\"/\">戻る</a></p>")
+    except CaptionsNotFound:
+        return await _send_html(send, 500, CAPTIONS_ERROR_HTML)
+    except EmptySummary:
+        return await _send_html(send, 500, "<h2>❌ Gemini要約取得に失敗しました。</h2>")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return await _send_html(send, 500, f"<h2>❌ エラー発生</h2><pre>{str(e)}</pre>")
+
+    print(f"⏱️ 要約完了 ({time.perf_counter() - started:.1f}s): {result['title']}")
+    with flask_app.app_context():
+        html = render_template(
+            "result.html",
+            title=result["title"],
+            video_url=result["video_url"],
+            text=result["text"].replace("<", "&lt;").replace(">", "&gt;"),
+            summary_html=result["summary_html"],
+            has_audio=result["has_audio"],
+            metadata=result["metadata"],
+            routing=result["routing"],
+            normalization=result["normalization"],
+            upload_date=format_upload_date(result["metadata"]["upload_date"]) if result["metadata"] else "",
+        )
+    await _send_html(send, 200, html)
+
+
+def _client_addr(scope) -> str:
+    """接続元のアドレス（TRUSTED_PROXY_HOPS が設定されていれば Flask 側と同じく X-Forwarded-For を使う）"""
+    remote_addr = (scope.get("client") or ("unknown",))[0]
+    forwarded_for = ",".join(v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"x-forwarded-for")
+    return forwarded_client(remote_addr, forwarded_for, TRUSTED_PROXY_HOPS)
+
+
+def _requested_genres(form: dict, query: dict) -> str:
+    """app._requested_genres と同じ: チェックボックス（genres）で選ばれたジャンルをカンマ区切りにする"""
+    return ",".join(form.get("genres") or query.get("genres") or [])
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"]
+    if path == TSUKKOMI_PREFIX:
+        return await _send_html(send, 308, "", [(b"location", f"{TSUKKOMI_PREFIX}/".encode())])
+    if path.startswith(TSUKKOMI_PREFIX + "/"):
+        tsukkomi_scope = dict(scope, root_path=scope.get("root_path", "") + TSUKKOMI_PREFIX)
+        return await tsukkomi_asgi(tsukkomi_scope, receive, send)
+
+    if path == "/" and scope["method"] in ("GET", "POST"):
+        body = b""
+        query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+        if scope["method"] == "POST":
+            body = await _read_body(receive)
+            form = parse_qs(body.decode("utf-8"))
+            youtube_url = form.get("youtube_url", [None])[0]
+            genre = _requested_genres(form, query) or form.get("genre", ["auto"])[0]
+        else:
+            # ブックマークレット対応: URLパラメータから動画URLを取得
+            youtube_url = query.get("url", [None])[0]
+            genre = query.get("genre", ["auto"])[0]
+        if youtube_url:
+            client = _client_addr(scope)
+            return await _handle_summarize(receive, send, client, youtube_url, genre)
+        # URLなし（フォーム表示・エラー表示）は Flask 側で従来どおり処理
+        return await flask_asgi(scope, _replay(body, receive), send)
+
+    return await flask_asgi(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 8080))
+    uvicorn.run(application, host="0.0.0.0", port=port)
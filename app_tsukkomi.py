@@ -1,19 +1,37 @@
 import os
 import re
+import shutil
 import subprocess
 import json
+import tempfile
+import time
 from pathlib import Path
 from typing import List, Optional
 from urllib.parse import parse_qs, urlparse
 
-import google.generativeai as genai
 import markdown
 from dotenv import load_dotenv
 from flask import Flask, render_template, request
 
+from utils.context_cache import API_BASE, GeminiRestClient
+from utils.model_router import estimate_tokens, record_route, route
+from utils.text_normalize import TextNormalizer, parse_steps
+from utils.tsukkomi import (TSUKKOMI_GENRE, TSUKKOMI_PREFILTER, TSUKKOMI_PREFILTER_MIN_LINES, TSUKKOMI_ROUTING,
+                            build_tsukkomi_prompt, prefilter_lines)
+from utils.usage_ledger import UsageLedger, gemini_cost, gemini_usage
+from utils.video_meta import (CAPTION_LANGS, build_metadata_cmd, caption_track_args, choose_caption_track,
+                              info_json_path, summarize_info)
+
 # --- 設定 ---
 PORT = int(os.environ.get("PORT", 8081))
-MODEL_NAME = "gemini-2.5-flash-lite"
+ROUTING_LOG = Path(os.getenv("ROUTING_LOG", Path.home() / "YouTubeInsightGen_venv" / "model_runs.jsonl"))
+# 利用記録は要約アプリ（app.py）と同じDBに書き、/usage でまとめて集計する
+USAGE_LEDGER = UsageLedger(Path(os.getenv("USAGE_DB", Path.home() / "YouTubeInsightGen_venv" / "usage.db")))
+# 字幕の正規化（フィラー・[音楽] などの除去。設定は app.py と同じ TEXT_NORMALIZE / EXTRA_FILLERS）
+TEXT_NORMALIZE_STEPS = parse_steps(os.getenv("TEXT_NORMALIZE", "all"))
+TEXT_NORMALIZER = TextNormalizer(
+    TEXT_NORMALIZE_STEPS, extra_fillers=[w.strip() for w in os.getenv("EXTRA_FILLERS", "").split(",") if w.strip()]
+) if TEXT_NORMALIZE_STEPS else None
 CAPTIONS_DIR = Path("captions")
 CAPTIONS_DIR.mkdir(exist_ok=True)
 
@@ -21,7 +39,10 @@ CAPTIONS_DIR.mkdir(exist_ok=True)
 print("🧹 [起動時] captionsフォルダをクリーンアップ中...")
 for file in CAPTIONS_DIR.glob("*"):
     try:
-        file.unlink()
+        if file.is_dir():
+            shutil.rmtree(file)
+        else:
+            file.unlink()
         print(f"  🗑️ 削除: {file.name}")
     except Exception as e:
         print(f"  ⚠️ 削除失敗: {file.name} - {e}")
@@ -32,16 +53,19 @@ app.secret_key = "tsukkomi_secret_key"
 
 load_dotenv()
 
-# Gemini APIキー設定
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY_PRIMARY") or os.getenv("GEMINI_API_KEY")
+# Gemini APIキー設定: キーごとの REST クライアントを優先順に持つ（app.py の GEMINI_CLIENTS と同じ順）
+# app_asgi では app.py と同じプロセスで動くため、プロセス全体のキーを書き換える genai.configure は使わない
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", API_BASE)
+GEMINI_CLIENTS = [(name, GeminiRestClient(key, GEMINI_API_BASE)) for name, key in (
+    ("PRIMARY", os.getenv("GEMINI_API_KEY_PRIMARY")), ("FALLBACK", os.getenv("GEMINI_API_KEY_FALLBACK"))) if key]
+if not GEMINI_CLIENTS and os.getenv("GEMINI_API_KEY"):
+    GEMINI_CLIENTS.append(("DEFAULT", GeminiRestClient(os.getenv("GEMINI_API_KEY"), GEMINI_API_BASE)))
 
-if not GEMINI_API_KEY:
+if not GEMINI_CLIENTS:
     print("❌ GEMINI_API_KEY が設定されていません")
     import sys
     sys.exit(1)
 
-genai.configure(api_key=GEMINI_API_KEY)
-
 def clean_youtube_url(url: str) -> str:
     parsed = urlparse(url)
     if "youtu.be" in parsed.netloc:
@@ -53,17 +77,44 @@ def clean_youtube_url(url: str) -> str:
             return f"https://www.youtube.com/watch?v={video_id}"
     return url
 
-def download_captions(youtube_url: str) -> Optional[Path]:
+def fetch_metadata(clean_url: str, out_dir: Path) -> Optional[dict]:
+    """yt-dlp で動画メタデータを取得する（生の info JSON は out_dir に残し、字幕取得で再利用する）"""
+    path = info_json_path(out_dir)
+    try:
+        with path.open("w", encoding="utf-8") as f:
+            subprocess.run(build_metadata_cmd(clean_url), stdout=f, check=True)
+        with path.open("r", encoding="utf-8") as f:
+            return summarize_info(json.load(f))
+    except Exception as e:
+        print(f"⚠️ 動画メタデータの取得に失敗しました: {e}")
+        path.unlink(missing_ok=True)
+        return None
+
+def download_captions(youtube_url: str, out_dir: Path, metadata: Optional[dict] = None) -> Optional[Path]:
+    """
+    字幕を out_dir（リクエストごとのフォルダ）に取得する
+    app.py の download_captions と同じく、メタデータの字幕一覧から1トラックだけを選んで取得する
+    """
     clean_url = clean_youtube_url(youtube_url)
+    track = None
+    if metadata:
+        track = choose_caption_track(metadata)
+        if track is None:
+            print(f"⚠️ 優先言語 {CAPTION_LANGS} の字幕がありません")
+            return None
+        print(f"🎯 字幕トラック: {track[0]} ({'自動' if track[1] else '手動'})")
+    info_json = info_json_path(out_dir)
     cmd = [
         "yt-dlp",
         "--extractor-args", "youtube:player_client=web_creator,ios,android",
-        "--write-auto-sub",
-        "--sub-lang", "ja,en",
+        *caption_track_args(track),
         "--skip-download",
-        "--output", str(CAPTIONS_DIR / "%(title)s [%(id)s].%(ext)s"),
+        "--output", str(out_dir / "%(title)s [%(id)s].%(ext)s"),
         clean_url,
     ]
+    if info_json.exists():
+        # メタデータ取得時の info JSON を使い、動画の解析をやり直さない
+        cmd[-1:] = ["--load-info-json", str(info_json)]
 
     if os.path.exists("cookies.txt"):
         cmd.insert(1, "--cookies")
@@ -76,8 +127,12 @@ def download_captions(youtube_url: str) -> Optional[Path]:
         return None
 
     # 隠しファイル (._*) を除外
-    candidates = [p for p in CAPTIONS_DIR.glob("*.vtt") if not p.name.startswith("._")]
+    candidates = [p for p in out_dir.glob("*.vtt") if not p.name.startswith("._")]
     if not candidates:
+        if info_json.exists():
+            # info JSON 内の字幕URLが期限切れなどで失敗した場合は、URLから取り直す
+            info_json.unlink()
+            return download_captions(youtube_url, out_dir, metadata)
         return None
 
     # 優先順位: ja > en > 他
@@ -115,28 +170,45 @@ def clean_text(text_lines: List[str]) -> str:
             cleaned.append(line)
     return "\n".join(cleaned)
 
-def analyze_tsukkomi(text: str, title: str) -> str:
-    prompt = f"""
-あなたはプロのお笑い評論家であり、言葉遊びの達人です。
-YouTube動画「{title}」の文字起こしから、独創的な表現やツッコミを抽出してください。
-
-【抽出・分析基準】
-1. 独特な言語センス（造語、比喩、パワーワード）
-2. 狂気を感じるほどの妄想トークやボケ
-3. 鋭いツッコミや、斜め上の視点からの感想
-
-【出力フォーマット】
-Markdown形式で出力してください。
-特に「フレーズ」「分類」「なぜ面白いのか（背景・言葉遊びの解説）」を明確にしてください。
-テーブル形式を活用すると見やすいです。
-
---- 文字起こし開始 ---
-{text}
---- 文字起こし終了 ---
-"""
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
-    return response.text
+def analyze_tsukkomi(text: str, title: str, excerpt: bool = False) -> str:
+    prompt = build_tsukkomi_prompt(text, title, excerpt)
+    decision = route(estimate_tokens(prompt), TSUKKOMI_ROUTING, forced=os.getenv("TSUKKOMI_MODEL"))
+    print(f"🧭 モデル選択: {decision['model']} (入力 約{decision['input_tokens']}トークン, "
+          f"推定 ${decision['est_cost_usd']}) {decision['reason']}")
+    try:
+        record_route(ROUTING_LOG, {"title": title, "genre": TSUKKOMI_GENRE, "stage": TSUKKOMI_GENRE, **decision})
+    except OSError as e:
+        print(f"⚠️ モデル選択の記録に失敗: {e}")
+    return call_gemini(prompt, decision["model"])
+
+
+def call_gemini(prompt: str, model_name: str) -> str:
+    """キーを優先順に試し、エラー時は次のキーに切り替える（利用記録は呼び出したキーの名前で残す）"""
+    for i, (key_name, client) in enumerate(GEMINI_CLIENTS):
+        started = time.perf_counter()
+        try:
+            response = client.generate(model_name, prompt)
+        except Exception as e:
+            print(f"⚠️ {key_name} でエラー発生: {e}")
+            _record_usage(model_name, key_name, ok=False, error=str(e))
+            if i < len(GEMINI_CLIENTS) - 1:
+                print("🔄 次のAPIキーでリトライします...")
+                continue
+            raise
+        prompt_tokens, output_tokens = gemini_usage(response)
+        _record_usage(model_name, key_name, prompt_tokens=prompt_tokens, output_tokens=output_tokens,
+                      latency_ms=(time.perf_counter() - started) * 1000,
+                      cost_usd=gemini_cost(model_name, prompt_tokens, output_tokens))
+        return response.text
+    raise RuntimeError("Gemini API呼び出しに失敗しました")
+
+
+def _record_usage(model_name: str, key_name: str, **fields):
+    try:
+        USAGE_LEDGER.record("gemini", model_name, key_name=key_name, stage=TSUKKOMI_GENRE,
+                            genre=TSUKKOMI_GENRE, **fields)
+    except Exception as e:
+        print(f"⚠️ 利用記録の保存に失敗: {e}")
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -145,36 +217,46 @@ def index():
         if not url:
             return render_template("tsukkomi_index.html", error="URLを入力してください")
 
-        # 既存ファイル削除
-        for f in CAPTIONS_DIR.glob("*"):
-            try: f.unlink()
-            except: pass
-
-        vtt_path = download_captions(url)
-        if not vtt_path:
-            return render_template("tsukkomi_index.html", error="字幕の取得に失敗しました（字幕設定がない、または非公開など）")
-
-        title = vtt_path.stem
-        cleaned = clean_text(parse_vtt(vtt_path))
-        
-        analysis_md = analyze_tsukkomi(cleaned, title)
-        analysis_html = markdown.markdown(analysis_md, extensions=["tables", "fenced_code"])
-        
-        # captionsフォルダーをクリーンアップ
-        for file in CAPTIONS_DIR.glob("*"):
-            try:
-                file.unlink()
-            except:
-                pass
-        
-        return render_template(
-            "tsukkomi_result.html",
-            title=title,
-            video_url=clean_youtube_url(url),
-            analysis_html=analysis_html
-        )
+        # リクエストごとの作業フォルダ（同時実行時に他リクエストの字幕と混ざらないように）
+        workspace = Path(tempfile.mkdtemp(dir=CAPTIONS_DIR))
+        try:
+            return analyze_request(url, workspace)
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
 
     return render_template("tsukkomi_index.html")
 
+
+def analyze_request(url: str, workspace: Path):
+    """字幕取得 → 候補の抜粋・正規化 → ツッコミ分析 を行い、結果ページを返す"""
+    metadata = fetch_metadata(clean_youtube_url(url), workspace)
+    vtt_path = download_captions(url, workspace, metadata)
+    if not vtt_path:
+        return render_template("tsukkomi_index.html", error="字幕の取得に失敗しました（字幕設定がない、または非公開など）")
+
+    title = vtt_path.stem
+    cleaned = clean_text(parse_vtt(vtt_path))
+    lines = cleaned.split("\n")
+    excerpt = TSUKKOMI_PREFILTER and len(lines) >= TSUKKOMI_PREFILTER_MIN_LINES
+    if excerpt:
+        # 長い動画は候補の箇所だけを送る（笑いタグを手がかりにするため、正規化は抜き出した行にだけ行う）
+        cleaned, report = prefilter_lines(lines, clean=TEXT_NORMALIZER.normalize if TEXT_NORMALIZER else None)
+        print(f"🎯 候補の抜粋: {report['lines_sent']}/{report['lines_total']}行, {report['windows']}箇所 "
+              f"(約{report['tokens_before']}→{report['tokens_after']}トークン)")
+    elif TEXT_NORMALIZER:
+        cleaned, normalization = TEXT_NORMALIZER.clean(cleaned)
+        print(f"✂️ 字幕の正規化: 約{normalization['tokens_before']}→{normalization['tokens_after']}トークン "
+              f"(-{normalization['saved_pct']}%)")
+    
+    analysis_md = analyze_tsukkomi(cleaned, title, excerpt)
+    analysis_html = markdown.markdown(analysis_md, extensions=["tables", "fenced_code"])
+    
+    return render_template(
+        "tsukkomi_result.html",
+        title=title,
+        video_url=clean_youtube_url(url),
+        analysis_html=analysis_html
+    )
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=PORT, debug=False)
@@ -0,0 +1,62 @@
+"""
+過去動画をまとめて要約するバックフィル（Gemini Batch API 経由）
+
+URL の一覧を読み、字幕取得・ジャンル決定のあと Gemini の要約要求を1つのバッチジョブとして投入する。
+完了を待って結果を通常の要約と同じくキャッシュ・検索インデックスに登録し、TTS・メール送信まで行う。
+料金は通常の呼び出しの半額で、Web からの対話リクエストの Gemini 実行枠も使わない（結果は最大24時間後）。
+待機中に停止しても、表示されたバッチ名を --resume に渡せば結果の回収から再開できる。
+
+起動: python backfill.py urls.txt --genre stock_analyst [--concurrency 2] [--max-requests 200]
+再開: python backfill.py --resume batches/xxxx [batches/yyyy ...]
+テスト: python scripts/fake_gemini_server.py --batch-delay 5 を起動し GEMINI_API_BASE=http://127.0.0.1:8766 を指定
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+from app import BATCH_MAX_REQUESTS, resume_batch_backfill, run_batch_backfill
+
+
+def read_urls(path: str) -> list:
+    """1行1URL（空行と # で始まる行は無視）。- は標準入力"""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini Batch API による過去動画のバックフィル")
+    parser.add_argument("urls", nargs="?", help="URL の一覧ファイル（- で標準入力）")
+    parser.add_argument("--genre", default="auto", help="要約ジャンル（auto は動画ごとに自動判定）")
+    parser.add_argument("--concurrency", type=int, default=2, help="同時に字幕を取得する動画数")
+    parser.add_argument("--max-requests", type=int, default=BATCH_MAX_REQUESTS, help="1バッチに詰める要求数")
+    parser.add_argument("--no-fallback", action="store_true", help="バッチで失敗した要求を通常の呼び出しでやり直さない")
+    parser.add_argument("--resume", nargs="+", metavar="BATCH", help="投入済みのバッチの結果を回収して配信する")
+    parser.add_argument("--report", help="動画ごとの結果を JSON Lines で書き出すファイル")
+    args = parser.parse_args()
+
+    if args.resume:
+        results = resume_batch_backfill(args.resume, fallback_sync=not args.no_fallback)
+    elif args.urls:
+        urls = list(dict.fromkeys(read_urls(args.urls)))
+        print(f"📚 {len(urls)} 件の動画をバッチで要約します（genre={args.genre}）")
+        results = run_batch_backfill(urls, args.genre, args.concurrency, args.max_requests,
+                                     fallback_sync=not args.no_fallback)
+    else:
+        parser.error("URL の一覧ファイルか --resume を指定してください")
+
+    counts = Counter((r["status"], r.get("via", "-")) for r in results)
+    print("📊 結果: " + ", ".join(f"{status}/{via} {n}件" for (status, via), n in sorted(counts.items())))
+    for r in results:
+        if r["status"] != "done":
+            print(f"  ❌ {r['url']} ({r['genre']}): {r.get('error')}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
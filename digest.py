@@ -0,0 +1,41 @@
+"""
+期間内の要約をまとめたマーケットダイジェストを作る（字幕ではなく保存済みの要約を入力に、Gemini 呼び出しは1回）
+
+起動: python digest.py [--since 2026-10-19] [--until 2026-10-19] [--genre stock_analyst] [--send] [--out digest.md]
+既定は今日処理した stock_analyst の要約。同じ要約の組み合わせで作り直す場合はキャッシュを返す。
+"""
+
+import argparse
+import sys
+import time
+
+from app import DIGEST_GENRE, build_market_digest, send_digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数動画の要約を統合したマーケットダイジェスト")
+    parser.add_argument("--since", default=time.strftime("%Y-%m-%d"), help="対象の処理日（YYYY-MM-DD）の開始")
+    parser.add_argument("--until", help="対象の処理日の終了（省略時は今日まで）")
+    parser.add_argument("--genre", default=DIGEST_GENRE)
+    parser.add_argument("--send", action="store_true", help="メールで送る")
+    parser.add_argument("--out", help="Markdown を書き出すファイル（省略時は標準出力）")
+    args = parser.parse_args()
+
+    digest = build_market_digest(args.since, args.until, args.genre)
+    if digest is None:
+        print(f"⚠️ {args.since} 以降に要約した動画がありません（genre={args.genre}）")
+        sys.exit(1)
+    for c in digest["clusters"]:
+        print(f"  📂 {c['label']}: {len(c['videos'])}本")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(f"# {digest['title']}\n\n{digest['summary_md']}\n")
+        print(f"✅ 書き出し: {args.out}")
+    else:
+        print(f"\n# {digest['title']}\n\n{digest['summary_md']}")
+    if args.send:
+        send_digest(digest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+共有バックエンドの動作確認スクリプト
+
+複数プロセスを「別ノード」に見立てて同じバックエンドに接続し、
+- 同じキーへの single_flight で compute が1回しか実行されないこと
+- キューの各ジョブがちょうど1回ずつ取り出されること
+- 配信権 (cache_add) が1プロセスにしか与えられないこと
+を確認する。既定は一時ディレクトリの SQLite、--backend redis://... で Redis も検証できる。
+
+使い方:
+    python scripts/backend_smoke.py --nodes 8
+"""
+
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.backend import get_backend, single_flight  # noqa: E402
+
+
+def node(url: str, node_no: int, counter_path: str, results):
+    backend = get_backend(url)
+
+    def expensive() -> str:
+        # Gemini 呼び出しの代わり。実行回数をファイルに記録する
+        with open(counter_path, "a") as f:
+            f.write(f"{node_no}\n")
+        time.sleep(1.0)
+        return f"summary-by-node-{node_no}"
+
+    value = single_flight(backend, "summary", "smoke-video:general", expensive, ttl=60, poll=0.1)
+    delivered = backend.cache_add("delivered", "smoke-video:general", str(node_no), ttl=60)
+
+    taken = []
+    while True:
+        item = backend.dequeue("smoke", timeout=0.5, lease=60)
+        if item is None:
+            break
+        queue_id, payload = item
+        taken.append(payload["n"])
+        backend.complete(queue_id, "done")
+    results.put((node_no, value, delivered, taken))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共有バックエンドの動作確認")
+    parser.add_argument("--backend", help="SUMMARY_BACKEND と同じ形式のURL（省略時は一時SQLite）")
+    parser.add_argument("--nodes", type=int, default=4, help="起動するプロセス数")
+    parser.add_argument("--jobs", type=int, default=50, help="キューに積むジョブ数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.backend or f"sqlite:///{tmp}/state.db"
+        counter_path = str(Path(tmp) / "calls.txt")
+        Path(counter_path).touch()
+
+        backend = get_backend(url)
+        for i in range(args.jobs):
+            backend.enqueue("smoke", {"n": i})
+
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=node, args=(url, i, counter_path, results)) for i in range(args.nodes)]
+        for p in procs:
+            p.start()
+        outcomes = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+        calls = Path(counter_path).read_text().split()
+        values = {value for _, value, _, _ in outcomes}
+        deliveries = sum(1 for _, _, delivered, _ in outcomes if delivered)
+        taken = sorted(n for *_, t in outcomes for n in t)
+
+        print(f"compute 実行回数: {len(calls)} (期待値 1)")
+        print(f"各ノードが得た要約: {values} (期待値 1種類)")
+        print(f"配信権を得たノード数: {deliveries} (期待値 1)")
+        print(f"取り出したジョブ: {len(taken)} 件 / 重複 {len(taken) - len(set(taken))} 件 (期待値 {args.jobs} 件 / 0 件)")
+
+        ok = len(calls) == 1 and len(values) == 1 and deliveries == 1 and taken == list(range(args.jobs))
+        print("✅ OK" if ok else "❌ NG")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+同期版 (Flask/Werkzeug) と ASGI 版 (app_asgi / uvicorn) の同時リクエスト処理性能を比較するベンチマーク
+
+yt-dlp / Gemini / TTS / Gmail は指定したレイテンシで待つだけの偽物に差し替えるため、
+APIキーやネットワークなしで「待ち時間が支配的な処理」の並行度の違いだけを計測できる。
+
+使い方:
+    python scripts/bench_async.py --concurrency 50 --requests 200
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.video_meta import summarize_info  # noqa: E402
+
+FAKE_VTT = """WEBVTT
+
+00:00:00.000 --> 00:00:02.000
+ベンチマーク用の字幕です
+
+00:00:02.000 --> 00:00:04.000
+これは偽の字幕です
+"""
+
+
+def prepare_environment(workdir: Path, concurrency: int):
+    """
+    アプリの保存先をすべて workdir に向け、受付制御の上限をベンチマークの同時数に合わせる（アプリを import する前に呼ぶ）
+    .env の値は load_dotenv が既存の環境変数を上書きしないため、ここで設定したものが優先される
+    """
+    state = workdir / "state"
+    state.mkdir()
+    (workdir / "YouTubeInsightGen_venv").mkdir()  # HOME を差し替えるため、アプリが前提とする venv のフォルダも作る
+    os.environ.update({
+        "HOME": str(workdir),
+        "SUMMARY_BACKEND": f"sqlite:///{state / 'state.db'}",
+        "SEARCH_DB": str(state / "search.db"),
+        "NEAR_DUP_DB": str(state / "near_dup.db"),
+        "ENTITY_DB": str(state / "entities.db"),
+        "USAGE_DB": str(state / "usage.db"),
+        "ROUTING_LOG": str(state / "model_runs.jsonl"),
+        "TRANSCRIPT_ARCHIVE_DIR": str(state / "transcripts"),
+        "CONTEXT_CACHE_DB": str(state / "context_cache.db"),
+        "CONTEXT_CACHE": "0",
+        # 全動画が同じ字幕なので、類似動画の要約の再利用で Gemini の待ちが省かれないようにする
+        "NEAR_DUP_ENABLED": "0",
+        "GMAIL_TO": "",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "bench-dummy")
+    # 全クライアントが 127.0.0.1 から来るため、受付制御で弾かれたり直列化されたりしないようにする
+    for name in ("MAX_RUNNING_JOBS", "MAX_QUEUED_JOBS", "MAX_JOBS_PER_CLIENT", "GEMINI_MAX_CONCURRENCY"):
+        os.environ.setdefault(name, str(concurrency))
+    (workdir / "app").mkdir()
+    shutil.copy(ROOT / "prompts.json", workdir / "app" / "prompts.json")
+    # app_tsukkomi（app_asgi が読み込む）は起動時にカレントディレクトリの captions を空にする
+    os.chdir(workdir / "app")
+
+
+def install_fakes(sync_app, caption_latency: float, gemini_latency: float, tts_latency: float):
+    """
+    ネットワークを伴う各ステージをレイテンシだけを再現する偽物に差し替える
+    ASGI 版も同じ app のパイプラインをスレッドで実行するため、差し替えは app 側だけでよい
+    """
+
+    def fake_metadata(clean_url, job):
+        # メタデータ取得も yt-dlp の子プロセス
+        job.run_process(["sleep", str(caption_latency)])
+        video_id = sync_app.extract_video_id(clean_url)
+        return summarize_info({"id": video_id, "title": f"bench {video_id}", "channel": "bench",
+                               "automatic_captions": {"ja": [{"ext": "vtt"}]}})
+
+    def fake_download(youtube_url, job=None, metadata=None):
+        job.run_process(["sleep", str(caption_latency)])
+        path = job.workspace / f"bench [{sync_app.extract_video_id(youtube_url)}].ja.vtt"
+        path.write_text(FAKE_VTT, encoding="utf-8")
+        return path
+
+    def fake_gemini(prompt, job=None, model_name=None, stage="summary", genre=None):
+        time.sleep(gemini_latency)
+        return "## 要約\n- ベンチマーク"
+
+    def fake_tts(text, output_filepath, job=None):
+        time.sleep(tts_latency)
+        return False
+
+    sync_app.fetch_video_metadata = fake_metadata
+    sync_app.download_captions = fake_download
+    sync_app.call_gemini = fake_gemini
+    sync_app.generate_gcp_tts_mp3 = fake_tts
+    sync_app.send_gmail = lambda *args, **kwargs: None
+
+
+def start_sync_server(sync_app, port: int):
+    # app.run() と同じ Werkzeug のスレッド型サーバー
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", port, sync_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_asgi_server(app_asgi, port: int):
+    import uvicorn
+
+    config = uvicorn.Config(app_asgi.application, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+
+    return stop
+
+
+def drive(base_url: str, total: int, concurrency: int, prefix: str) -> dict:
+    """
+    total 件の要約リクエストを concurrency 並列で送る
+    字幕・要約のキャッシュや配信の重複防止で処理が省かれないよう、リクエストごとに別の動画IDを使う
+    """
+
+    def one(i):
+        url = f"https://www.youtube.com/watch?v={prefix}{i:010d}"
+        body = urllib.parse.urlencode({"youtube_url": url, "genre": "general"}).encode()
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base_url + "/", data=body), timeout=600) as resp:
+                ok = resp.status == 200
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(lat for _, lat in results)
+    return {
+        "requests": total,
+        "errors": sum(1 for ok, _ in results if not ok),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同期版 / ASGI版 サーバーの同時処理性能比較")
+    parser.add_argument("--requests", type=int, default=100, help="総リクエスト数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時クライアント数")
+    parser.add_argument("--caption-latency", type=float, default=1.0, help="字幕取得の待ち時間（秒）")
+    parser.add_argument("--gemini-latency", type=float, default=3.0, help="Gemini応答の待ち時間（秒）")
+    parser.add_argument("--tts-latency", type=float, default=0.5, help="TTSの待ち時間（秒）")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_async_"))
+    prepare_environment(workdir, args.concurrency)
+    try:
+        import app as sync_app
+        import app_asgi
+
+        install_fakes(sync_app, args.caption_latency, args.gemini_latency, args.tts_latency)
+        servers = (("sync (Werkzeug)", start_sync_server, sync_app, 18080, "s"),
+                   ("asgi (uvicorn)", start_asgi_server, app_asgi, 18081, "a"))
+        for name, starter, module, port, prefix in servers:
+            stop = starter(module, port)
+            try:
+                print(f"▶ {name}: {args.requests} requests / concurrency {args.concurrency}")
+                print(f"   {drive(f'http://127.0.0.1:{port}', args.requests, args.concurrency, prefix)}")
+            finally:
+                stop()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
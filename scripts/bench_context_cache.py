@@ -0,0 +1,120 @@
+"""
+コンテキストキャッシュの効果と管理（期限・上限超過時の削除）を代替 Gemini サーバーで確認するベンチマーク
+
+動画 V 本 × ジャンル G 個の要約を、字幕を毎回送る場合とキャッシュを参照する場合で実行し、
+送信トークン数・推定費用・処理時間を比較する。続けて
+- 上限件数（--max-entries）を超えたときに最後に使った時刻が古いキャッシュから削除されること
+- 期限切れ・サーバー側で消えたキャッシュを使わずに作り直すこと
+を確認する。--base を指定しなければ代替サーバー（scripts/fake_gemini_server.py）を内部で起動する。
+
+使い方:
+    python scripts/bench_context_cache.py --videos 5 --genres 3 --chars 60000 --latency 0.2
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_gemini_server import make_server  # noqa: E402
+from utils.context_cache import ContextCache, GeminiRestClient  # noqa: E402
+from utils.model_router import estimate_tokens  # noqa: E402
+from utils.usage_ledger import cached_token_count, gemini_cost, gemini_usage  # noqa: E402
+
+MODEL = "gemini-2.5-flash"
+NOTE = "（文字起こしはコンテキストにあります）"
+TEMPLATE = "あなたは株式アナリストです。以下の文字起こしから銘柄と数値を整理してください。\n" * 20
+
+
+def make_transcript(i: int, chars: int) -> str:
+    line = f"[動画{i}] 今日は決算の話をします。売上高は前年比で増加し、ガイダンスも上方修正されました。\n"
+    return (line * (chars // len(line) + 1))[:chars]
+
+
+def run(client: GeminiRestClient, cache, videos: int, genres: int, chars: int) -> dict:
+    totals = {"prompt_tokens": 0, "cached_tokens": 0, "cost": 0.0}
+    lock = threading.Lock()
+
+    def one(video: int, genre: int):
+        text = make_transcript(video, chars)
+        prompt_tail = f"{TEMPLATE}ジャンル{genre}"
+        handle = cache.get_or_create(f"v{video}", MODEL, text, estimate_tokens(text), expected_uses=genres) if cache else None
+        if handle:
+            response = client.generate(MODEL, f"{prompt_tail}\n{NOTE}", handle)
+        else:
+            response = client.generate(MODEL, f"{prompt_tail}\n{text}")
+        prompt_tokens, output_tokens = gemini_usage(response)
+        cached = cached_token_count(response)
+        with lock:
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached
+            totals["cost"] += gemini_cost(MODEL, prompt_tokens, output_tokens, cached)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=genres) as pool:
+        for video in range(videos):
+            list(pool.map(lambda g: one(video, g), range(genres)))
+    totals["elapsed_s"] = round(time.perf_counter() - started, 2)
+    totals["cost"] = round(totals["cost"], 5)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コンテキストキャッシュのベンチマーク")
+    parser.add_argument("--base", default=None, help="Gemini API のURL（省略時は代替サーバーを起動）")
+    parser.add_argument("--videos", type=int, default=5)
+    parser.add_argument("--genres", type=int, default=3, help="1動画あたりの呼び出し回数（ジャンル数）")
+    parser.add_argument("--chars", type=int, default=60000, help="字幕の文字数")
+    parser.add_argument("--latency", type=float, default=0.0, help="代替サーバーの応答遅延（秒）")
+    parser.add_argument("--max-entries", type=int, default=3)
+    args = parser.parse_args()
+
+    store = None
+    if args.base is None:
+        server, store = make_server(port=0, latency=args.latency)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.base = f"http://127.0.0.1:{server.server_address[1]}"
+    client = GeminiRestClient("dummy-key", args.base)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ContextCache(client, Path(tmp) / "cache.db", ttl=600, max_entries=args.max_entries)
+        baseline = run(client, None, args.videos, args.genres, args.chars)
+        cached = run(client, cache, args.videos, args.genres, args.chars)
+        print(f"📊 動画 {args.videos}本 × {args.genres}ジャンル, 字幕 {args.chars}文字")
+        print(f"  キャッシュなし: 入力 {baseline['prompt_tokens']}トークン, 推定 ${baseline['cost']}, {baseline['elapsed_s']}秒")
+        print(f"  キャッシュあり: 入力 {cached['prompt_tokens']}トークン（うちキャッシュ {cached['cached_tokens']}）, "
+              f"推定 ${cached['cost']}, {cached['elapsed_s']}秒")
+        if baseline["cost"]:
+            print(f"  推定費用の削減: {100 * (1 - cached['cost'] / baseline['cost']):.1f}%（キャッシュの保存料金は含まない）")
+
+        stats = cache.stats()
+        print(f"🗃️ 手元の管理: 有効 {stats['active']}件（上限 {stats['max_entries']}）, 参照 {stats['hits']}回")
+        assert stats["active"] <= args.max_entries, "上限件数を超えてキャッシュが残っています"
+
+        # サーバー側で消えたキャッシュは作り直す（期限切れと同じ扱い）
+        text = make_transcript(0, args.chars)
+        handle = cache.get_or_create("v0", MODEL, text, estimate_tokens(text), expected_uses=2)
+        client.delete_cache(handle)
+        try:
+            client.generate(MODEL, NOTE, handle)
+            raise AssertionError("削除済みのキャッシュが使えてしまいました")
+        except Exception as e:
+            print(f"  削除済みキャッシュの参照はエラー: {e}")
+        cache.invalidate(handle)
+        renewed = cache.get_or_create("v0", MODEL, text, estimate_tokens(text), expected_uses=2)
+        assert renewed and renewed != handle
+        print(f"  作り直したキャッシュ: {renewed}")
+        cache.clear()
+
+    if store is not None:
+        print(f"📡 代替サーバーの統計: {store.stats} (残りのキャッシュ {len(store.caches)}件)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+類似動画インデックス（MinHash + LSH）の検索時間を計測するベンチマーク
+
+ランダムな署名で N 件（既定 10万件）のインデックスを一時フォルダに作り、
+「登録済み動画の切り抜き相当（署名の一部だけ異なる）」と「無関係な動画」の検索時間を計測する。
+あわせて1時間程度の字幕から署名を作る時間も計測する。
+
+使い方:
+    python scripts/bench_near_dup.py --videos 100000 --queries 200 --threshold 0.8
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.near_dup import NUM_PERM, NearDuplicateIndex, shingles  # noqa: E402
+
+BATCH = 5000
+
+
+def random_signature(rng: random.Random):
+    return [rng.getrandbits(32) for _ in range(NUM_PERM)]
+
+
+def perturb(sig, similarity: float, rng: random.Random):
+    """similarity の割合だけ元の値を残した署名（推定類似度 ≒ similarity）"""
+    return [v if rng.random() < similarity else rng.getrandbits(32) for v in sig]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(index: NearDuplicateIndex, queries):
+    times, hits = [], 0
+    for sig, expected in queries:
+        started = time.perf_counter()
+        match = index.find(sig)
+        times.append((time.perf_counter() - started) * 1000)
+        if match and match["video_id"] == expected:
+            hits += 1
+    return times, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="類似動画インデックスの検索時間ベンチマーク")
+    parser.add_argument("--videos", type=int, default=100_000, help="インデックスに登録する動画数")
+    parser.add_argument("--queries", type=int, default=200, help="検索回数（種類ごと）")
+    parser.add_argument("--threshold", type=float, default=0.8, help="類似度しきい値")
+    parser.add_argument("--dup-similarity", type=float, default=0.9, help="切り抜き相当の検索で残す署名の割合")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(Path(tmp) / "near_dup.db", threshold=args.threshold)
+        print(f"📦 {args.videos} 件を登録中（bands={index.bands}, rows={index.rows}）...")
+        started = time.perf_counter()
+        stored = []
+        for offset in range(0, args.videos, BATCH):
+            entries = []
+            for i in range(offset, min(args.videos, offset + BATCH)):
+                sig = random_signature(rng)
+                entries.append((f"vid{i:07d}", f"video {i}", f"https://www.youtube.com/watch?v=vid{i:07d}", "general", sig))
+            index.add_many(entries)
+            stored.extend((e[0], e[4]) for e in rng.sample(entries, min(len(entries), 50)))
+        build_s = time.perf_counter() - started
+        db_mb = sum(p.stat().st_size for p in Path(tmp).iterdir()) / 1024 / 1024
+        print(f"✅ 登録完了: {build_s:.1f}s / DB {db_mb:.1f} MB")
+
+        dup_queries = [(perturb(sig, args.dup_similarity, rng), vid)
+                       for vid, sig in rng.sample(stored, min(args.queries, len(stored)))]
+        miss_queries = [(random_signature(rng), None) for _ in range(args.queries)]
+
+        for label, queries in (("切り抜き相当", dup_queries), ("無関係", miss_queries)):
+            times, hits = measure(index, queries)
+            print(f"🔎 {label}: p50={statistics.median(times):.2f}ms p95={percentile(times, 0.95):.2f}ms "
+                  f"max={max(times):.2f}ms / 一致 {hits}/{len(queries)}")
+
+        # 1時間の字幕 ≒ 2万文字として署名作成時間を計測
+        text = "".join(rng.choice("あいうえおかきくけこさしすせそたちつてとなにぬねのABCDE0123") for _ in range(20_000))
+        started = time.perf_counter()
+        index.signature(text)
+        print(f"🧮 署名作成（{len(text)}文字, shingle {len(shingles(text))}個）: "
+              f"{(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
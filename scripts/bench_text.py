@@ -0,0 +1,345 @@
+"""
+テキスト処理の主要関数（app.py）のマイクロベンチマーク（ネットワーク・APIキー不要）
+
+YouTube の自動字幕と同じ形式（単語ごとの時刻タグ付き・2行ずつ流れる形）の VTT を
+10分〜6時間・日本語/英語で生成し、次の関数の実行時間（中央値・最小）とピークメモリ（tracemalloc）を測る。
+    parse_vtt / clean_text / create_prompt / extract_summary_ssml / format_as_html（markdown.markdown）/ clean_youtube_url
+    要約パイプラインの字幕処理: Transcript.from_vtt / TEXT_NORMALIZER.transcript / NEAR_DUP.signature /
+    ENTITY_EXTRACTOR.mentions
+アプリの保存先（HOME・各DB）は一時フォルダに向けるため、計測で実際の検索インデックスなどを汚さない。
+結果は JSON に保存し、2つの結果（またはコミット）を比べて遅くなった・メモリが増えた関数を報告する。
+
+使い方:
+    python scripts/bench_text.py                               # ~/YouTubeInsightGen_venv/bench/<コミット>.json に保存
+    python scripts/bench_text.py --durations 10m,1h --langs ja --repeat 3
+    python scripts/bench_text.py --compare base.json head.json # 2つの結果を比較（劣化があれば終了コード 1）
+    python scripts/bench_text.py --commits main HEAD           # 2つのコミットを git worktree に展開して計測・比較
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+PHRASES_EN = [
+    "so today", "we're going to", "look at", "the earnings report", "revenue came in", "at", "billion dollars",
+    "up", "percent", "year over year", "guidance was", "above expectations", "and the stock", "is moving",
+    "after hours", "data center", "demand", "remains strong", "on the other hand", "margins", "came down",
+    "a little bit", "the Fed", "interest rates", "NVIDIA", "Apple", "Tesla", "you know", "I think", "right",
+]
+NOISE = {"ja": ["[音楽]", "[拍手]", "[笑い]"], "en": ["[Music]", "[Applause]", "[Laughter]"]}
+DEFAULT_DURATIONS = "10m,1h,3h,6h"
+DEFAULT_OUT_DIR = Path.home() / "YouTubeInsightGen_venv" / "bench"
+REGRESSION_THRESHOLD = 0.10  # 中央値・ピークメモリがこの割合を超えて増えたら劣化とみなす
+MIN_DELTA_MS = 0.05  # これより小さい差は計測誤差として扱う
+MIN_DELTA_KB = 16
+URL_BATCH = 10000  # clean_youtube_url は1回の呼び出しが短いため、この本数をまとめて1回として測る
+
+
+def parse_duration(spec: str) -> int:
+    """10m / 1h / 90s / 1.5h を秒にする"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    spec = spec.strip()
+    if spec[-1] in units:
+        return int(float(spec[:-1]) * units[spec[-1]])
+    return int(float(spec))
+
+
+def _ts(ms: int) -> str:
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def _phrases(lang: str) -> tuple:
+    """(語句, 区切り)。bench_transcript_store は utils を読み込むため、計測対象の app.py を読み込んだ後に import する"""
+    from bench_transcript_store import PHRASES
+    return (PHRASES, "") if lang == "ja" else (PHRASES_EN, " ")
+
+
+def synthetic_vtt(seconds: int, lang: str, rng: random.Random) -> str:
+    """
+    YouTube 自動字幕（yt-dlp で取得した .vtt）と同じ構造の字幕
+    1つの発話ごとに、単語ごとの時刻タグが付いたキュー → 10ms の確定キュー（前の行を繰り返す）の2つを出す
+    """
+    phrases, sep = _phrases(lang)
+    out = ["WEBVTT", "Kind: captions", f"Language: {lang}", ""]
+    previous, t = " ", 0
+    end_ms = seconds * 1000
+    while t < end_ms:
+        duration = rng.randint(1500, 4500)
+        if rng.random() < 0.03:
+            words = [rng.choice(NOISE[lang])]
+        else:
+            words = [rng.choice(phrases) for _ in range(rng.randint(3, 8))]
+        step = duration // len(words)
+        tagged = words[0] + "".join(
+            f"<{_ts(t + step * i)}><c>{sep}{w}</c>" for i, w in enumerate(words[1:], 1)
+        )
+        out += [f"{_ts(t)} --> {_ts(t + duration)} align:start position:0%", previous, tagged, ""]
+        line = sep.join(words)
+        out += [f"{_ts(t + duration)} --> {_ts(t + duration + 10)} align:start position:0%", line, " ", ""]
+        previous, t = line, t + duration + 10
+    return "\n".join(out)
+
+
+def synthetic_summary(seconds: int, lang: str, rng: random.Random) -> str:
+    """stock_analyst 形式の要約（表・リスト・時刻リンク・チャプター一覧付き。長い動画ほどチャプターが増える）"""
+    phrases, sep = _phrases(lang)
+
+    def sentence() -> str:
+        return sep.join(rng.choice(phrases) for _ in range(rng.randint(5, 12)))
+
+    def link(ms: int) -> str:
+        return f"[{_ts(ms)[:8]}](https://www.youtube.com/watch?v=benchbench0&t={ms // 1000}s)"
+
+    parts = ["## ① 全体の要約", sentence() + "。" + sentence() + "。", "## ② 要点リスト"]
+    parts += [f"- **{rng.choice(phrases)}**: {sentence()} {link(rng.randrange(seconds * 1000))}" for _ in range(8)]
+    parts += ["## ③ 銘柄ごとの評価", "| 銘柄 | 論調 | 根拠 |", "|---|---|---|"]
+    parts += [f"| {rng.choice(phrases)} | 強気 | {sentence()} |" for _ in range(5)]
+    parts += ["## ⑥ 投資判断のための重要ポイント"] + [f"{i}. {sentence()}" for i in range(1, 6)]
+    parts += ["```", sentence(), "```", "## 📑 チャプター"]
+    parts += [f"- {link(ms)} {sentence()}" for ms in range(0, seconds * 1000, 5 * 60 * 1000)]
+    return "\n".join(parts)
+
+
+def synthetic_urls(count: int, rng: random.Random) -> list:
+    forms = [
+        "https://www.youtube.com/watch?v={id}",
+        "https://youtu.be/{id}?si=abcdefgh",
+        "https://www.youtube.com/watch?v={id}&list=PL0123456789&index=3&t=120s",
+        "https://m.youtube.com/watch?feature=share&v={id}",
+        "https://www.youtube.com/live/{id}",
+    ]
+    chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+    return [rng.choice(forms).format(id="".join(rng.choice(chars) for _ in range(11))) for _ in range(count)]
+
+
+def build_corpus(corpus_dir: Path, durations: list, langs: list) -> list:
+    """(ケース名, 秒数, 言語, VTT のパス, 要約) の一覧。VTT は同じ条件なら作り直さない（乱数は固定）"""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    cases = []
+    for lang in langs:
+        for spec in durations:
+            seconds = parse_duration(spec)
+            path = corpus_dir / f"bench_{lang}_{seconds}s.{lang}.vtt"
+            if not path.exists():
+                path.write_text(synthetic_vtt(seconds, lang, random.Random(f"{lang}-{seconds}")), encoding="utf-8")
+            summary = synthetic_summary(seconds, lang, random.Random(f"{lang}-{seconds}-summary"))
+            cases.append((f"{lang}-{spec}", seconds, lang, path, summary))
+    return cases
+
+
+def measure(func, repeat: int) -> dict:
+    """repeat 回の実行時間（中央値・最小, ミリ秒）と、別に1回実行したときのピークメモリ（KB）"""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):  # extract_summary_ssml などのログを計測に含めない
+        func()  # ウォームアップ（正規表現のコンパイルなど）
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - started) * 1000)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"median_ms": round(statistics.median(times), 3), "min_ms": round(min(times), 3),
+            "peak_kb": round(peak / 1024, 1)}
+
+
+def git_commit(cwd: Path) -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def isolate_state(workdir: Path):
+    """
+    アプリの保存先（HOME・各DB・字幕の保存先）をすべて workdir に向ける（アプリを import する前に呼ぶ）
+    .env の値は load_dotenv が既存の環境変数を上書きしないため、ここで設定したものが優先される
+    """
+    state = workdir / "state"
+    state.mkdir(parents=True)
+    (workdir / "YouTubeInsightGen_venv").mkdir()  # HOME を差し替えるため、アプリが前提とする venv のフォルダも作る
+    os.environ.update({
+        "HOME": str(workdir),
+        "SUMMARY_BACKEND": f"sqlite:///{state / 'state.db'}",
+        "SEARCH_DB": str(state / "search.db"),
+        "NEAR_DUP_DB": str(state / "near_dup.db"),
+        "ENTITY_DB": str(state / "entities.db"),
+        "USAGE_DB": str(state / "usage.db"),
+        "ROUTING_LOG": str(state / "model_runs.jsonl"),
+        "TRANSCRIPT_ARCHIVE_DIR": str(state / "transcripts"),
+        "CONTEXT_CACHE_DB": str(state / "context_cache.db"),
+        "BATCH_DIR": str(state / "batches"),
+        "CONTEXT_CACHE": "0",
+        "GMAIL_TO": "",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "bench-dummy")
+
+
+def run_benchmarks(app_dir: Path, corpus_dir: Path, durations: list, langs: list, repeat: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench_text_"))
+    isolate_state(workdir)
+    # app.py は prompts.json をカレントディレクトリから読む
+    os.chdir(app_dir)
+    sys.path.insert(0, str(app_dir))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+        return _run_benchmarks(app, app_dir, corpus_dir, durations, langs, repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_benchmarks(app, app_dir: Path, corpus_dir: Path, durations: list, langs: list, repeat: int) -> dict:
+    import markdown
+
+    cases = build_corpus(corpus_dir, durations, langs)
+    results = {}
+
+    def record(name: str, case: str, func, size: int):
+        # 古いコミットにない関数・無効になっているステージは比較の対象外
+        if name != "markdown.markdown" and getattr(app, name.split(".")[0], None) is None:
+            return
+        key = f"{name}/{case}"
+        results[key] = {"input_chars": size, **measure(func, repeat)}
+        r = results[key]
+        print(f"{key:<34}{size:>12,}{r['median_ms']:>12.2f}{r['min_ms']:>12.2f}{r['peak_kb']:>12,.0f}")
+
+    print(f"{'関数/ケース':<30}{'入力文字数':>10}{'中央値ms':>10}{'最小ms':>10}{'ピークKB':>10}")
+    for case, seconds, lang, path, summary in cases:
+        lines = app.parse_vtt(path)
+        text = app.clean_text(lines)
+        url = "https://www.youtube.com/watch?v=benchbench0"
+        record("parse_vtt", case, lambda: app.parse_vtt(path), path.stat().st_size)
+        record("clean_text", case, lambda: app.clean_text(lines), sum(len(line) for line in lines))
+        record("create_prompt", case, lambda: app.create_prompt(text, "ベンチマーク", url), len(text))
+        record("extract_summary_ssml", case, lambda: app.extract_summary_ssml(summary), len(summary))
+        record("markdown.markdown", case,
+               lambda: markdown.markdown(summary, extensions=["tables", "fenced_code"]), len(summary))
+        record("format_as_html", case, lambda: app.format_as_html("ベンチマーク", summary, url), len(summary))
+
+        # 要約パイプライン（prepare_transcript）で字幕ごとに実行するステージ
+        if getattr(app, "Transcript", None) is None:
+            continue
+        vtt = path.read_text(encoding="utf-8")
+        transcript = app.Transcript.from_vtt(vtt)
+        record("Transcript.from_vtt", case, lambda: app.Transcript.from_vtt(vtt), len(vtt))
+        record("TEXT_NORMALIZER.transcript", case, lambda: app.TEXT_NORMALIZER.transcript(transcript),
+               len(transcript.text))
+        record("NEAR_DUP.signature", case, lambda: app.NEAR_DUP.signature(transcript.text), len(transcript.text))
+        normalizer = getattr(app, "TEXT_NORMALIZER", None)
+        normalized = normalizer.transcript(transcript)[0] if normalizer else transcript
+        record("ENTITY_EXTRACTOR.mentions", case, lambda: app.ENTITY_EXTRACTOR.mentions(normalized),
+               len(normalized.text))
+    urls = synthetic_urls(URL_BATCH, random.Random(0))
+    record("clean_youtube_url", f"x{URL_BATCH}", lambda: [app.clean_youtube_url(u) for u in urls],
+           sum(len(u) for u in urls))
+
+    return {
+        "commit": git_commit(app_dir),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    """head で threshold を超えて遅く（またはメモリが多く）なったものを (キー, 指標, 基準, 今回, 比) で返す"""
+    print(f"🔍 {base.get('commit')} → {head.get('commit')}（しきい値 +{threshold:.0%}）")
+    print(f"{'関数/ケース':<30}{'基準ms':>10}{'今回ms':>10}{'比':>8}{'基準KB':>10}{'今回KB':>10}{'比':>8}")
+    regressions = []
+    for key in sorted(set(base["results"]) | set(head["results"])):
+        b, h = base["results"].get(key), head["results"].get(key)
+        if not b or not h:
+            print(f"{key:<34}{'（片方にのみ存在）':>40}")
+            continue
+        t_ratio = h["median_ms"] / b["median_ms"] if b["median_ms"] else 1.0
+        m_ratio = h["peak_kb"] / b["peak_kb"] if b["peak_kb"] else 1.0
+        flags = []
+        if t_ratio > 1 + threshold and h["median_ms"] - b["median_ms"] > MIN_DELTA_MS:
+            regressions.append((key, "median_ms", b["median_ms"], h["median_ms"], t_ratio))
+            flags.append("⏱️")
+        if m_ratio > 1 + threshold and h["peak_kb"] - b["peak_kb"] > MIN_DELTA_KB:
+            regressions.append((key, "peak_kb", b["peak_kb"], h["peak_kb"], m_ratio))
+            flags.append("🧠")
+        print(f"{key:<34}{b['median_ms']:>12.2f}{h['median_ms']:>12.2f}{t_ratio:>8.2f}"
+              f"{b['peak_kb']:>12,.0f}{h['peak_kb']:>12,.0f}{m_ratio:>8.2f} {''.join(flags)}")
+    if regressions:
+        print(f"⚠️ 劣化 {len(regressions)} 件（⏱️ 実行時間 / 🧠 ピークメモリ）")
+    else:
+        print("✅ 劣化はありません")
+    return regressions
+
+
+def bench_commit(commit: str, args, corpus_dir: Path, out_dir: Path) -> Path:
+    """commit を一時的な git worktree に展開し、このスクリプトでその app.py を計測する"""
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = Path(tmp) / "tree"
+        subprocess.run(["git", "worktree", "add", "--detach", str(worktree), commit], cwd=ROOT, check=True,
+                       capture_output=True)
+        try:
+            out = out_dir / f"{git_commit(worktree)}.json"
+            subprocess.run([sys.executable, __file__, "--app-dir", str(worktree), "--corpus", str(corpus_dir),
+                            "--durations", args.durations, "--langs", args.langs, "--repeat", str(args.repeat),
+                            "--out", str(out)], check=True)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT, check=False)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テキスト処理関数のマイクロベンチマーク")
+    parser.add_argument("--durations", default=DEFAULT_DURATIONS, help="合成字幕の長さ（カンマ区切り。例: 10m,1h,6h）")
+    parser.add_argument("--langs", default="ja,en", help="合成字幕の言語（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--corpus", default=str(Path(tempfile.gettempdir()) / "yig_bench_corpus"),
+                        help="合成字幕を置くフォルダ（作成済みなら使い回す）")
+    parser.add_argument("--app-dir", default=str(ROOT), help="計測する app.py のあるフォルダ")
+    parser.add_argument("--out", help="結果の JSON（省略時は ~/YouTubeInsightGen_venv/bench/<コミット>.json）")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="2つの結果 JSON を比較する")
+    parser.add_argument("--commits", nargs=2, metavar=("BASE", "HEAD"), help="2つのコミットを計測して比較する")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="劣化とみなす増加率")
+    args = parser.parse_args()
+
+    if args.compare:
+        base, head = (json.loads(Path(p).read_text(encoding="utf-8")) for p in args.compare)
+        sys.exit(1 if compare(base, head, args.threshold) else 0)
+
+    corpus_dir = Path(args.corpus).expanduser().resolve()
+    if args.commits:
+        DEFAULT_OUT_DIR.mkdir(parents=True, exist_ok=True)
+        paths = [bench_commit(c, args, corpus_dir, DEFAULT_OUT_DIR) for c in args.commits]
+        base, head = (json.loads(p.read_text(encoding="utf-8")) for p in paths)
+        sys.exit(1 if compare(base, head, args.threshold) else 0)
+
+    app_dir = Path(args.app_dir).expanduser().resolve()
+    out = Path(args.out).expanduser().resolve() if args.out else None  # 計測中は app_dir に移動するため先に解決
+    result = run_benchmarks(app_dir, corpus_dir, args.durations.split(","), args.langs.split(","), args.repeat)
+    out = out or DEFAULT_OUT_DIR / f"{result['commit']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"💾 結果を保存しました: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+字幕の保存形式（.ytt）とプレーンテキストのサイズ・読み込み時間を比較するベンチマーク
+
+既定では数時間のライブ配信を想定した合成字幕を使う。--vtt で実際の VTT を指定することもできる。
+比較対象:
+    txt       … 従来の字幕テキスト（時刻なし）
+    txt+時刻  … 1行ごとに「開始ミリ秒<TAB>テキスト」を書いたテキスト
+    ytt       … 圧縮ブロック + 時刻索引（utils/transcript_store.py）
+
+使い方:
+    python scripts/bench_transcript_store.py --hours 3 --repeat 20
+    python scripts/bench_transcript_store.py --vtt path/to/captions.ja.vtt
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.transcript import Transcript  # noqa: E402
+from utils.transcript_store import TranscriptFile, write_transcript, zstandard  # noqa: E402
+
+PHRASES = [
+    "今日は", "決算発表", "について", "見ていきます", "売上高は", "前年同期比で", "増加しました", "ガイダンスが",
+    "市場予想を", "上回って", "株価は", "時間外取引で", "上昇しています", "半導体", "データセンター向けの",
+    "需要が", "引き続き", "強い", "一方で", "利益率は", "やや低下", "為替の影響", "金利", "FRBの", "発言",
+    "注目ポイントは", "来期の", "見通しです", "NVIDIA", "Apple", "テスラ", "投資家の", "反応", "ですね", "と思います",
+]
+
+
+def synthetic_transcript(hours: float, rng: random.Random) -> Transcript:
+    lines, starts = [], array("I")
+    t = 0
+    while t < hours * 3600 * 1000:
+        lines.append("".join(rng.choice(PHRASES) for _ in range(rng.randint(3, 7))) + f"（{len(lines)}）")
+        starts.append(t)
+        t += rng.randint(1500, 4000)
+    return Transcript(lines, starts)
+
+
+def timed(func, repeat: int) -> float:
+    """repeat 回実行した中央値（ミリ秒）"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="字幕保存形式のサイズ・読み込み時間の比較")
+    parser.add_argument("--hours", type=float, default=3.0, help="合成字幕の長さ（時間）")
+    parser.add_argument("--vtt", help="実際の VTT ファイルを使う")
+    parser.add_argument("--range-minutes", type=float, default=10.0, help="時間範囲読み込みで取り出す長さ（分）")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--per-day", type=float, default=5.0, help="1年分の換算に使う1日あたりの本数")
+    args = parser.parse_args()
+
+    if args.vtt:
+        transcript = Transcript.from_vtt(Path(args.vtt).read_text(encoding="utf-8"))
+    else:
+        transcript = synthetic_transcript(args.hours, random.Random(42))
+    duration = transcript.starts[-1] / 1000
+    range_start = duration / 2
+    range_end = range_start + args.range_minutes * 60
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        txt_path = tmp / "plain.txt"
+        txt_path.write_text(transcript.text, encoding="utf-8")
+        timed_path = tmp / "timed.txt"
+        timed_path.write_text(
+            "\n".join(f"{s}\t{line}" for s, line in zip(transcript.starts, transcript.lines)), encoding="utf-8"
+        )
+        ytt_path = tmp / "transcript.ytt"
+        write_transcript(ytt_path, transcript, "bench")
+
+        def load_txt():
+            txt_path.read_text(encoding="utf-8").split("\n")
+
+        def load_timed():
+            rows = [line.split("\t", 1) for line in timed_path.read_text(encoding="utf-8").split("\n")]
+            return [(int(s), text) for s, text in rows]
+
+        def range_timed():
+            lo, hi = range_start * 1000, range_end * 1000
+            return [text for s, text in load_timed() if lo <= s < hi]
+
+        def load_ytt():
+            with TranscriptFile(ytt_path) as f:
+                return f.load()
+
+        def range_ytt():
+            with TranscriptFile(ytt_path) as f:
+                return f.time_range(range_start, range_end)
+
+        assert load_ytt().lines == transcript.lines
+        assert range_ytt().lines == range_timed()
+
+        sizes = {p: p.stat().st_size for p in (txt_path, timed_path, ytt_path)}
+        codec = "zstd" if zstandard is not None else "zlib（zstandard 未インストール）"
+        print(f"📄 {len(transcript.lines)}行 / {duration / 3600:.1f}時間 / 圧縮: {codec}")
+        print(f"{'形式':<10}{'サイズ':>12}{'全体読込':>12}{'範囲読込':>12}{'1年分換算':>12}")
+        rows = [
+            ("txt", txt_path, load_txt, None),
+            ("txt+時刻", timed_path, load_timed, range_timed),
+            ("ytt", ytt_path, load_ytt, range_ytt),
+        ]
+        for label, path, full, part in rows:
+            yearly_gb = sizes[path] * args.per_day * 365 / 1024 ** 3
+            full_ms = timed(full, args.repeat)
+            part_ms = f"{timed(part, args.repeat):.2f}ms" if part else "-"
+            print(f"{label:<10}{sizes[path] / 1024:>10.1f}KB{full_ms:>10.2f}ms{part_ms:>12}{yearly_gb:>10.2f}GB")
+        print(f"（範囲読込: {args.range_minutes:.0f}分間, 1年分換算: 1日{args.per_day:g}本）")
+
+
+if __name__ == "__main__":
+    main()
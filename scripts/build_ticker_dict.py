@@ -0,0 +1,120 @@
+"""
+銘柄辞書（utils/entity_index.load_dictionary が読む CSV: code,market,name,aliases）を作るスクリプト
+
+- 東証: JPX の「東証上場銘柄一覧」（data_j.xls。xlrd がなければ Excel で CSV 保存したもの）
+- 米国: NASDAQ Trader の銘柄一覧（nasdaqlisted.txt / otherlisted.txt、| 区切り）
+社名から「ホールディングス」「Inc.」などを除いた短い名前も別名に加える。
+作った CSV は ENTITY_DICT（複数なら OS のパス区切り文字で連結）で app.py に渡す。
+
+使い方:
+    python scripts/build_ticker_dict.py --jpx data_j.xls --us nasdaqlisted.txt otherlisted.txt \
+        --out ~/YouTubeInsightGen_venv/tickers.csv
+"""
+
+import argparse
+import csv
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.entity_index import TSE, US  # noqa: E402
+
+try:
+    import xlrd
+except ImportError:  # CSV に変換したものなら不要
+    xlrd = None
+
+JA_SUFFIX_RE = re.compile(r"(?:ホールディングス|ＨＤ|HD|グループ本社)$")
+US_SUFFIX_RE = re.compile(r"[,\s]+(?:Inc\.?|Incorporated|Corp\.?|Corporation|Co\.?|Company|Ltd\.?|Limited|plc|PLC|"
+                          r"N\.V\.|S\.A\.|AG|SE|Holdings?|Group|Class [A-C])$")
+US_SHARE_WORDS = ("Common Stock", "Ordinary Shares", "American Depositary Shares", "Common Shares")
+US_SHARE_RE = re.compile(r"\s+(?:%s)\b.*$" % "|".join(US_SHARE_WORDS))
+
+
+def _short_names(name: str, suffix_re: re.Pattern) -> list:
+    """社名から接尾辞を順に外した別名（元の名前と同じもの・1文字以下のものは除く）"""
+    aliases, current = [], name
+    while True:
+        shorter = suffix_re.sub("", current).strip(" ,.")
+        if shorter == current or len(shorter) < 2:
+            return aliases
+        aliases.append(shorter)
+        current = shorter
+
+
+def read_jpx_rows(path: Path) -> list:
+    if path.suffix.lower() in (".xls", ".xlsx"):
+        if xlrd is None:
+            sys.exit("❌ xlrd がないため .xls を読めません（Excel で CSV 保存したものを指定してください）")
+        sheet = xlrd.open_workbook(str(path)).sheet_by_index(0)
+        header = [str(c.value) for c in sheet.row(0)]
+        return [dict(zip(header, (str(c.value) for c in sheet.row(i)))) for i in range(1, sheet.nrows)]
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            with open(path, "r", encoding=encoding, newline="") as f:
+                return list(csv.DictReader(f))
+        except UnicodeDecodeError:
+            continue
+    sys.exit(f"❌ 文字コードを判定できません: {path}")
+
+
+def jpx_entities(path: Path) -> list:
+    entities = []
+    for row in read_jpx_rows(path):
+        code = str(row.get("コード", "")).strip().removesuffix(".0")  # xls では数値として読まれる
+        name = str(row.get("銘柄名", "")).strip()
+        if code and name:
+            entities.append((code, TSE, name, _short_names(name, JA_SUFFIX_RE)))
+    return entities
+
+
+def us_entities(path: Path) -> list:
+    entities = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, delimiter="|"):
+            symbol = (row.get("Symbol") or row.get("ACT Symbol") or "").strip()
+            security = (row.get("Security Name") or "").strip()
+            if not symbol or not security or row.get("Test Issue") == "Y" or row.get("ETF") == "Y":
+                continue  # 最終行（File Creation Time）・テスト銘柄・ETF は除く
+            if not any(word in security for word in US_SHARE_WORDS):
+                continue  # 優先株・ワラントなど
+            full = US_SHARE_RE.sub("", security.split(" - ")[0]).strip()
+            shorter = _short_names(full, US_SUFFIX_RE)
+            # 最も短い名前を正式名にし、元の社名も別名に残す
+            entities.append((symbol.replace("$", ".").replace(" ", "."), US, shorter[-1] if shorter else full,
+                             [full] + shorter[:-1] if shorter else []))
+    return entities
+
+
+def main():
+    parser = argparse.ArgumentParser(description="銘柄辞書（CSV）の作成")
+    parser.add_argument("--jpx", nargs="*", default=[], help="JPX の東証上場銘柄一覧（.xls / .csv）")
+    parser.add_argument("--us", nargs="*", default=[], help="NASDAQ Trader の nasdaqlisted.txt / otherlisted.txt")
+    parser.add_argument("--out", default=str(Path.home() / "YouTubeInsightGen_venv" / "tickers.csv"))
+    args = parser.parse_args()
+    if not args.jpx and not args.us:
+        parser.error("--jpx か --us を指定してください")
+
+    entities = {}
+    for path in args.jpx:
+        for entity in jpx_entities(Path(path).expanduser()):
+            entities[entity[0]] = entity
+    for path in args.us:
+        for entity in us_entities(Path(path).expanduser()):
+            entities.setdefault(entity[0], entity)  # 東証のコードとは重ならないが、念のため先勝ち
+
+    out = Path(args.out).expanduser()
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["code", "market", "name", "aliases"])
+        for code, market, name, aliases in sorted(entities.values(), key=lambda e: (e[1], e[0])):
+            writer.writerow([code, market, name, "|".join(aliases)])
+    counts = {m: sum(1 for e in entities.values() if e[1] == m) for m in (TSE, US)}
+    print(f"✅ 銘柄辞書を作成: {out}（東証 {counts[TSE]}件 / 米国 {counts[US]}件）")
+
+
+if __name__ == "__main__":
+    main()
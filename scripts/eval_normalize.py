@@ -0,0 +1,143 @@
+"""
+字幕の正規化（utils/text_normalize.py）の削減量と品質を確認するスクリプト
+
+動画ごとに
+- 正規化前後の推定トークン数と削減率、消したフィラー・雑音タグの数
+- 内容語の保持率: 正規化前の字幕に含まれる漢字・カタカナ・英数字（雑音タグを除く）が、正規化後にも残っている割合
+  （語間の空白を詰めると語の区切りが変わるため、文字単位で数える）
+を表示し、保持率が --min-retention を下回る動画があれば終了コード 1 を返す。
+--summarize を付けると正規化前後の字幕でそれぞれ Gemini に要約させ（GEMINI_API_BASE で代替サーバーも可）、
+要約に出てくる数値の一致率と文字 bigram の類似度で要約が劣化していないかを比べる。
+
+入力は --vtt（VTT ファイル）、--archive（保存済みの .ytt のフォルダ）、どちらもなければ合成字幕。
+
+使い方:
+    python scripts/eval_normalize.py --archive ~/YouTubeInsightGen_venv/transcripts --limit 20
+    python scripts/eval_normalize.py --vtt captions.ja.vtt --summarize --genre stock_analyst
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_transcript_store import PHRASES  # noqa: E402
+from utils.context_cache import API_BASE, GeminiRestClient  # noqa: E402
+from utils.text_normalize import NOISE_WORDS, TextNormalizer  # noqa: E402
+from utils.transcript import Transcript  # noqa: E402
+from utils.transcript_store import TranscriptFile  # noqa: E402
+
+CONTENT_RE = re.compile(r"[\u4e00-\u9fff々〆\u30a1-\u30faA-Za-z0-9]")
+NOISE_TAG_RE = re.compile(r"[\[(]\s*(?:%s)\s*[\])]" % "|".join(map(re.escape, NOISE_WORDS)), re.I)
+NUMBER_RE = re.compile(r"\d[\d,.]*")
+SYNTHETIC_NOISE = ["えー", "あのー", "まあ", "えっと", "[音楽]", "[拍手]", "うーん", "なんか、"]
+
+
+def synthetic_transcripts(count: int, rng: random.Random):
+    for n in range(count):
+        lines, starts = [], array("I")
+        for i in range(600):
+            words = rng.sample(PHRASES, 4)
+            if rng.random() < 0.5:
+                words.insert(rng.randrange(len(words) + 1), rng.choice(SYNTHETIC_NOISE))
+            lines.append(" ".join(words))
+            starts.append(i * 3000)
+        yield f"synthetic-{n}", Transcript(lines, starts)
+
+
+def load_inputs(args):
+    if args.vtt:
+        for path in args.vtt:
+            yield Path(path).name, Transcript.from_vtt(Path(path).read_text(encoding="utf-8"))
+    elif args.archive:
+        for path in sorted(Path(args.archive).expanduser().glob("*.ytt"))[:args.limit]:
+            with TranscriptFile(path) as f:
+                yield path.stem, f.load()
+    else:
+        yield from synthetic_transcripts(args.limit, random.Random(0))
+
+
+def content_chars(text: str) -> Counter:
+    """内容語の文字（漢字・カタカナ・英数字）の出現数（幅の違いは NFKC で揃え、雑音タグは除く）"""
+    return Counter(CONTENT_RE.findall(NOISE_TAG_RE.sub("", unicodedata.normalize("NFKC", text))))
+
+
+def retention(before: str, after: str) -> float:
+    expected = content_chars(before)
+    total = sum(expected.values())
+    return sum((expected & content_chars(after)).values()) / total if total else 1.0
+
+
+def bigram_similarity(a: str, b: str) -> float:
+    grams_a = {a[i:i + 2] for i in range(len(a) - 1)}
+    grams_b = {b[i:i + 2] for i in range(len(b) - 1)}
+    return len(grams_a & grams_b) / len(grams_a | grams_b) if grams_a | grams_b else 1.0
+
+
+def summarize(client: GeminiRestClient, model: str, template: str, text: str, title: str) -> str:
+    # app.create_prompt と同じ置き換え
+    prompt = template.replace("{cleaned_text}", text).replace("{video_title}", title).replace("{video_url}", "")
+    return client.generate(model, prompt).text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="字幕の正規化の削減量・品質確認")
+    parser.add_argument("--vtt", nargs="+", help="VTT ファイル")
+    parser.add_argument("--archive", help="保存済みの字幕（.ytt）のフォルダ")
+    parser.add_argument("--limit", type=int, default=10, help="--archive / 合成字幕の件数")
+    parser.add_argument("--min-retention", type=float, default=0.99, help="内容語の保持率の下限")
+    parser.add_argument("--summarize", action="store_true", help="正規化前後の要約を Gemini で比較する")
+    parser.add_argument("--genre", default="general", help="--summarize で使う prompts.json のジャンル")
+    parser.add_argument("--model", default=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"))
+    args = parser.parse_args()
+
+    normalizer = TextNormalizer()
+    client = template = None
+    if args.summarize:
+        client = GeminiRestClient(os.getenv("GEMINI_API_KEY_PRIMARY") or os.getenv("GEMINI_API_KEY", ""),
+                                  os.getenv("GEMINI_API_BASE", API_BASE))
+        with open(Path(__file__).resolve().parent.parent / "prompts.json", "r", encoding="utf-8") as f:
+            template = json.load(f)[args.genre]["prompt_template"]
+
+    rows, failed = [], []
+    for name, transcript in load_inputs(args):
+        normalized, report = normalizer.transcript(transcript)
+        row = {"name": name, **report, "retention": round(retention(transcript.text, normalized.text), 4)}
+        if args.summarize:
+            before = summarize(client, args.model, template, transcript.timestamped_text(), name)
+            after = summarize(client, args.model, template, normalized.timestamped_text(), name)
+            numbers = set(NUMBER_RE.findall(before))
+            row["summary_numbers"] = round(len(numbers & set(NUMBER_RE.findall(after))) / len(numbers), 3) \
+                if numbers else 1.0
+            row["summary_similarity"] = round(bigram_similarity(before, after), 3)
+        rows.append(row)
+        if row["retention"] < args.min_retention:
+            failed.append(name)
+        extra = (f" 要約の数値一致 {row['summary_numbers']:.0%} 類似度 {row['summary_similarity']:.2f}"
+                 if args.summarize else "")
+        print(f"  {name}: {row['tokens_before']}→{row['tokens_after']}トークン (-{row['saved_pct']}%) "
+              f"フィラー{row['fillers']} 雑音{row['noise']} 内容語保持 {row['retention']:.2%}{extra}")
+
+    if not rows:
+        print("⚠️ 評価する字幕がありません")
+        return
+    print(f"📊 {len(rows)}本: 削減率 中央値 {statistics.median(r['saved_pct'] for r in rows)}% / "
+          f"内容語保持 最小 {min(r['retention'] for r in rows):.2%}")
+    if failed:
+        print(f"❌ 内容語の保持率が {args.min_retention:.0%} 未満: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ 品質チェック通過")
+
+
+if __name__ == "__main__":
+    main()
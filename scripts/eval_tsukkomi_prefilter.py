@@ -0,0 +1,170 @@
+"""
+ツッコミ分析の候補抽出（utils/tsukkomi.prefilter_lines）の削減量と取りこぼしを確認するスクリプト
+
+- 合成字幕（既定）: 退屈な発言の中に「面白い発言」を埋め込み、抜粋にそれが何割含まれるか（被覆率）を測る
+- --vtt / --archive: 実際の字幕で抜粋の行数・推定トークン数を表示する
+- --gemini: 字幕全体と抜粋のそれぞれで Gemini にツッコミ分析させ、全体で見つかったフレーズのうち
+  抜粋に含まれていた割合（被覆率）と、抜粋での分析結果にも出てきた割合（再現率）、入力トークン数・応答時間を比べる
+  （GEMINI_API_BASE で代替サーバーも指定できるが、その場合フレーズは出てこないので数値の確認用）
+
+使い方:
+    python scripts/eval_tsukkomi_prefilter.py --videos 20 --top-k 40
+    python scripts/eval_tsukkomi_prefilter.py --vtt variety.ja.vtt --gemini
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_transcript_store import PHRASES  # noqa: E402
+from utils.context_cache import API_BASE, GeminiRestClient  # noqa: E402
+from utils.text_normalize import TextNormalizer  # noqa: E402
+from utils.transcript import Transcript  # noqa: E402
+from utils.transcript_store import TranscriptFile  # noqa: E402
+from utils.tsukkomi import TSUKKOMI_CONTEXT_LINES, TSUKKOMI_TOP_K, build_tsukkomi_prompt, prefilter_lines  # noqa: E402
+
+PUNCHLINES = ["もはやエッグトルネードやん", "それゴリラの握力やろ", "プロテインで炊いたご飯", "冷蔵庫が反抗期なんよ",
+              "ラーメンの気持ちになって", "完全にマグロの目してる", "カレーは飲み物じゃなくて思想", "ハトに住民票あげて"]
+TSUKKOMI = ["いやいや何それ！", "なんでやねん", "どういうこと？", "ちょっと待って", "言い方！"]
+REACTIONS = ["[笑]", "(笑)", "[拍手]", "ｗｗｗ"]
+_QUOTE_RE = re.compile(r"「([^」]{2,60})」")
+
+
+def synthetic(count: int, lines_per_video: int, planted: int, rng: random.Random):
+    """(名前, Transcript, 埋め込んだ面白い発言の行番号) を返す"""
+    for n in range(count):
+        lines, starts, gold = [], array("I"), set()
+        plant_at = set(rng.sample(range(20, lines_per_video - 20), planted))
+        i = 0
+        while len(lines) < lines_per_video:
+            if i in plant_at:
+                gold.add(len(lines))
+                lines.append(f"{rng.choice(PUNCHLINES)}{n}{i}")
+                if rng.random() < 0.7:
+                    lines.append(rng.choice(REACTIONS))
+                if rng.random() < 0.6:
+                    lines.append(rng.choice(TSUKKOMI))
+            else:
+                lines.append(" ".join(rng.sample(PHRASES, 3)) + ("！" if rng.random() < 0.05 else ""))
+            i += 1
+        starts.extend(k * 3000 for k in range(len(lines)))
+        yield f"synthetic-{n}", Transcript(lines, starts), gold
+
+
+def load_inputs(args):
+    if args.vtt:
+        for path in args.vtt:
+            yield Path(path).name, Transcript.from_vtt(Path(path).read_text(encoding="utf-8")), None
+    elif args.archive:
+        for path in sorted(Path(args.archive).expanduser().glob("*.ytt"))[:args.videos]:
+            with TranscriptFile(path) as f:
+                yield path.stem, f.load(), None
+    else:
+        yield from synthetic(args.videos, args.lines, args.planted, random.Random(0))
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text))
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def contains(phrase: str, text_bigrams: set, threshold: float = 0.7) -> bool:
+    """phrase の文字 bigram の threshold 以上が text に含まれていれば、含まれているとみなす"""
+    grams = _bigrams(_squash(phrase))
+    return bool(grams) and len(grams & text_bigrams) / len(grams) >= threshold
+
+
+def extract_phrases(markdown_text: str) -> list:
+    """分析結果から取り上げられたフレーズ（表の1列目と「」の中）を取り出す"""
+    phrases = [m.group(1) for m in _QUOTE_RE.finditer(markdown_text)]
+    for line in markdown_text.splitlines():
+        cells = [c.strip() for c in line.strip().strip("|").split("|")]
+        if line.lstrip().startswith("|") and cells and not set(cells[0]) <= set("-: ") and "フレーズ" not in cells[0]:
+            phrases.append(cells[0].strip("「」*"))
+    return list(dict.fromkeys(p for p in phrases if len(_squash(p)) >= 3))
+
+
+def analyze(client: GeminiRestClient, model: str, prompt: str) -> tuple:
+    started = time.perf_counter()
+    response = client.generate(model, prompt)
+    return response.text, response.usage_metadata.prompt_token_count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ツッコミ分析の候補抽出の評価")
+    parser.add_argument("--vtt", nargs="+", help="VTT ファイル")
+    parser.add_argument("--archive", help="保存済みの字幕（.ytt）のフォルダ")
+    parser.add_argument("--videos", type=int, default=10, help="合成字幕 / --archive の件数")
+    parser.add_argument("--lines", type=int, default=1200, help="合成字幕の行数（3秒/行）")
+    parser.add_argument("--planted", type=int, default=15, help="合成字幕に埋め込む面白い発言の数")
+    parser.add_argument("--top-k", type=int, default=TSUKKOMI_TOP_K)
+    parser.add_argument("--context", type=int, default=TSUKKOMI_CONTEXT_LINES)
+    parser.add_argument("--gemini", action="store_true", help="字幕全体と抜粋で Gemini の分析結果を比べる")
+    parser.add_argument("--model", default=os.getenv("TSUKKOMI_MODEL", "gemini-2.5-flash-lite"))
+    args = parser.parse_args()
+
+    normalizer = TextNormalizer()
+    client = GeminiRestClient(os.getenv("GEMINI_API_KEY_PRIMARY") or os.getenv("GEMINI_API_KEY", ""),
+                              os.getenv("GEMINI_API_BASE", API_BASE)) if args.gemini else None
+    rows = []
+    for name, transcript, gold in load_inputs(args):
+        starts = transcript.starts if transcript.has_timestamps else None
+        excerpt, report = prefilter_lines(transcript.lines, starts, args.top_k, args.context, normalizer.normalize)
+        row = {"name": name, **report, "saved_pct": round(100 * (1 - report["tokens_after"] / report["tokens_before"]), 1)
+               if report["tokens_before"] else 0.0}
+        excerpt_grams = _bigrams(_squash(excerpt))
+        if gold is not None:
+            row["planted_coverage"] = sum(contains(transcript.lines[i], excerpt_grams) for i in gold) / len(gold)
+        if client:
+            full_text = normalizer.clean(transcript.text)[0]
+            full_md, full_tokens, full_s = analyze(client, args.model, build_tsukkomi_prompt(full_text, name))
+            part_md, part_tokens, part_s = analyze(client, args.model, build_tsukkomi_prompt(excerpt, name, True))
+            phrases = extract_phrases(full_md)
+            part_grams = _bigrams(_squash(part_md))
+            row.update({
+                "phrases": len(phrases),
+                "phrase_coverage": sum(contains(p, excerpt_grams) for p in phrases) / len(phrases) if phrases else None,
+                "phrase_recall": sum(contains(p, part_grams) for p in phrases) / len(phrases) if phrases else None,
+                "prompt_tokens": (full_tokens, part_tokens),
+                "latency_s": (round(full_s, 1), round(part_s, 1)),
+            })
+        rows.append(row)
+        details = [f"{row['lines_sent']}/{row['lines_total']}行 {row['windows']}箇所",
+                   f"約{row['tokens_before']}→{row['tokens_after']}トークン (-{row['saved_pct']}%)"]
+        if "planted_coverage" in row:
+            details.append(f"埋め込み被覆 {row['planted_coverage']:.0%}")
+        if client:
+            rate = lambda key: "-" if row[key] is None else f"{row[key]:.0%}"  # noqa: E731
+            details.append(f"フレーズ {row['phrases']}件 被覆 {rate('phrase_coverage')} 再現 {rate('phrase_recall')}")
+            details.append(f"入力 {row['prompt_tokens'][0]}→{row['prompt_tokens'][1]}トークン "
+                           f"応答 {row['latency_s'][0]}→{row['latency_s'][1]}秒")
+        print(f"  {name}: " + " / ".join(details))
+
+    if not rows:
+        print("⚠️ 評価する字幕がありません")
+        return
+    summary = f"📊 {len(rows)}本: 削減率 中央値 {statistics.median(r['saved_pct'] for r in rows)}%"
+    coverage = [r["planted_coverage"] for r in rows if "planted_coverage" in r]
+    if coverage:
+        summary += f" / 埋め込み被覆 平均 {statistics.mean(coverage):.1%}"
+    recalls = [r["phrase_recall"] for r in rows if r.get("phrase_recall") is not None]
+    if recalls:
+        summary += f" / フレーズ再現率 平均 {statistics.mean(recalls):.1%}"
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
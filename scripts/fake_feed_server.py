@@ -0,0 +1,154 @@
+"""
+YouTube チャンネルフィードの代替サーバー（watcher.py の動作確認・負荷試験用）
+
+- GET  /feeds/videos.xml?channel_id=X … Atom フィード（ETag / Last-Modified 付き、条件一致なら 304）
+- POST /publish?channel_id=X          … そのチャンネルに新しい動画を1件追加する
+- GET  /stats                          … リクエスト数・304 応答数など
+未知のチャンネルIDにも初回アクセス時に動画3件のフィードを作って返す。
+
+使い方:
+    python scripts/fake_feed_server.py --port 8765
+    python watcher.py --once --feed-base http://127.0.0.1:8765/feeds/videos.xml
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FEED_SIZE = 15  # 本物のフィードと同じく最新15件だけを載せる
+
+
+class FeedStore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.channels = {}
+        self.stats = {"requests": 0, "not_modified": 0, "published": 0}
+        self._lock = threading.Lock()
+
+    def _channel(self, channel_id: str) -> dict:
+        # self._lock を保持した状態で呼ぶ
+        if channel_id not in self.channels:
+            self.channels[channel_id] = {"videos": [], "updated": time.time()}
+            for _ in range(3):
+                self._publish(channel_id)
+        return self.channels[channel_id]
+
+    def _publish(self, channel_id: str) -> dict:
+        channel = self.channels[channel_id]
+        n = len(channel["videos"])
+        video_id = hashlib.sha1(f"{channel_id}:{n}".encode()).hexdigest()[:11]
+        video = {"video_id": video_id, "title": f"{channel_id} の動画 #{n + 1}", "published": time.time()}
+        channel["videos"].insert(0, video)
+        del channel["videos"][FEED_SIZE:]
+        channel["updated"] = time.time()
+        return video
+
+    def publish(self, channel_id: str) -> dict:
+        with self._lock:
+            self._channel(channel_id)
+            self.stats["published"] += 1
+            return self._publish(channel_id)
+
+    def feed(self, channel_id: str):
+        with self._lock:
+            channel = self._channel(channel_id)
+            etag = '"' + hashlib.sha1(json.dumps(channel["videos"]).encode()).hexdigest()[:16] + '"'
+            return channel, etag, formatdate(channel["updated"], usegmt=True)
+
+
+def render_feed(channel_id: str, videos: list) -> bytes:
+    entries = "".join(
+        f"""<entry><id>yt:video:{v['video_id']}</id><yt:videoId>{v['video_id']}</yt:videoId>
+<yt:channelId>{channel_id}</yt:channelId><title>{escape(v['title'])}</title>
+<link rel="alternate" href="https://www.youtube.com/watch?v={v['video_id']}"/>
+<published>{time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(v['published']))}</published></entry>"""
+        for v in videos
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+<title>{channel_id}</title>{entries}</feed>""".encode("utf-8")
+
+
+def make_handler(store: FeedStore):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _json(self, data: dict, status: int = 200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                return self._json(store.stats)
+            channel_id = parse_qs(url.query).get("channel_id", [""])[0]
+            if url.path != "/feeds/videos.xml" or not channel_id:
+                return self._json({"error": "not found"}, 404)
+
+            if store.latency:
+                time.sleep(store.latency)
+            channel, etag, last_modified = store.feed(channel_id)
+            with store._lock:
+                store.stats["requests"] += 1
+            if self.headers.get("If-None-Match") == etag or (
+                not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since") == last_modified
+            ):
+                with store._lock:
+                    store.stats["not_modified"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            body = render_feed(channel_id, channel["videos"])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/atom+xml; charset=UTF-8")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            channel_id = parse_qs(url.query).get("channel_id", [""])[0]
+            if url.path != "/publish" or not channel_id:
+                return self._json({"error": "not found"}, 404)
+            return self._json(store.publish(channel_id))
+
+    return Handler
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, latency: float = 0.0):
+    """テストから起動できるよう (server, store) を返す（serve_forever は呼び出し側で行う）"""
+    store = FeedStore(latency)
+    return ThreadingHTTPServer((host, port), make_handler(store)), store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YouTube チャンネルフィードの代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="フィード応答の遅延（秒）")
+    args = parser.parse_args()
+
+    server, _ = make_server(args.host, args.port, args.latency)
+    print(f"📡 代替フィードサーバー起動: http://{args.host}:{args.port}/feeds/videos.xml?channel_id=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("👋 停止しました")
+
+
+if __name__ == "__main__":
+    main()
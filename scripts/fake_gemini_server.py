@@ -0,0 +1,281 @@
+"""
+Gemini API（generateContent / cachedContents）の代替サーバー（コンテキストキャッシュの動作確認・負荷試験用）
+
+- POST   /v1beta/cachedContents                 … キャッシュ作成（TTL 付き、期限切れは自動で消える）
+- GET    /v1beta/cachedContents/ID              … キャッシュ情報
+- PATCH  /v1beta/cachedContents/ID?updateMask=ttl … 期限の延長
+- DELETE /v1beta/cachedContents/ID              … キャッシュ削除
+- POST   /v1beta/models/MODEL:generateContent   … 固定の応答を返す（cachedContent を指定するとその分を
+                                                   cachedContentTokenCount として usageMetadata に載せる）
+- POST   /v1beta/models/MODEL:batchGenerateContent … バッチ投入（batch_delay 秒後に完了。fail_every 件ごとに
+                                                   1件をエラーにし、結果は突き合わせの確認のため逆順で返す）
+- GET    /v1beta/batches/ID                     … バッチの状態（完了後は結果を含む）
+- POST   /v1beta/batches/ID:cancel              … バッチのキャンセル
+- GET    /stats                                  … 作成・削除・キャッシュ参照の回数、送信されたトークン数
+トークン数は utils/model_router.estimate_tokens の見積もりで数える。
+
+使い方:
+    python scripts/fake_gemini_server.py --port 8766 --latency 0.5 --batch-delay 5 --fail-every 10
+    python scripts/bench_context_cache.py --base http://127.0.0.1:8766
+    CONTEXT_CACHE=1 GEMINI_API_BASE=http://127.0.0.1:8766 python app.py
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.model_router import estimate_tokens  # noqa: E402
+
+PREFIX = "/v1beta/"
+
+
+class GeminiStore:
+    def __init__(self, latency: float = 0.0, batch_delay: float = 0.0, fail_every: int = 0):
+        self.latency = latency
+        self.batch_delay = batch_delay
+        self.fail_every = fail_every
+        self.caches = {}
+        self.batches = {}
+        self.stats = {"created": 0, "deleted": 0, "refreshed": 0, "generate": 0, "cache_hits": 0,
+                      "cache_misses": 0, "sent_tokens": 0, "cached_tokens": 0, "batches": 0, "batch_requests": 0}
+        self._lock = threading.Lock()
+
+    def _purge(self):
+        # self._lock を保持した状態で呼ぶ
+        now = time.time()
+        for name in [n for n, c in self.caches.items() if c["expire_at"] <= now]:
+            del self.caches[name]
+
+    @staticmethod
+    def _ttl(body: dict) -> float:
+        return float(str(body.get("ttl", "3600s")).rstrip("s"))
+
+    def create(self, body: dict) -> dict:
+        text = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        system = "".join(p.get("text", "") for p in body.get("systemInstruction", {}).get("parts", []))
+        tokens = estimate_tokens(system + text)
+        name = f"cachedContents/{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._purge()
+            self.caches[name] = {"model": body.get("model", ""), "tokens": tokens,
+                                 "expire_at": time.time() + self._ttl(body)}
+            self.stats["created"] += 1
+            self.stats["sent_tokens"] += tokens
+        return self.describe(name)
+
+    def describe(self, name: str) -> dict:
+        c = self.caches[name]
+        return {"name": name, "model": c["model"],
+                "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(c["expire_at"])),
+                "usageMetadata": {"totalTokenCount": c["tokens"]}}
+
+    def get(self, name: str) -> dict:
+        with self._lock:
+            self._purge()
+            return self.describe(name) if name in self.caches else None
+
+    def refresh(self, name: str, body: dict) -> dict:
+        with self._lock:
+            self._purge()
+            if name not in self.caches:
+                return None
+            self.caches[name]["expire_at"] = time.time() + self._ttl(body)
+            self.stats["refreshed"] += 1
+            return self.describe(name)
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            self._purge()
+            if self.caches.pop(name, None) is None:
+                return False
+            self.stats["deleted"] += 1
+            return True
+
+    def generate(self, model: str, body: dict, delay: bool = True):
+        """(ステータス, 応答) を返す"""
+        prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = 0
+        name = body.get("cachedContent")
+        with self._lock:
+            self._purge()
+            self.stats["generate"] += 1
+            if name:
+                cache = self.caches.get(name)
+                if cache is None:
+                    self.stats["cache_misses"] += 1
+                    return 403, {"error": {"code": 403, "message": f"CachedContent not found: {name}"}}
+                if cache["model"] != f"models/{model}":
+                    return 400, {"error": {"code": 400, "message": "Model does not match the cached content"}}
+                cached_tokens = cache["tokens"]
+                self.stats["cache_hits"] += 1
+                self.stats["cached_tokens"] += cached_tokens
+            self.stats["sent_tokens"] += prompt_tokens
+        if self.latency and delay:
+            time.sleep(self.latency)
+        text = f"- 代替サーバーの応答（{model}, 入力 {prompt_tokens + cached_tokens} トークン）"
+        return 200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens + cached_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": estimate_tokens(text),
+            },
+        }
+
+    def create_batch(self, model: str, body: dict) -> dict:
+        batch = body.get("batch", {})
+        requests = batch.get("input_config", {}).get("requests", {}).get("requests", [])
+        name = f"batches/{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self.batches[name] = {"model": f"models/{model}", "display_name": batch.get("display_name", ""),
+                                  "requests": requests, "state": "BATCH_STATE_PENDING",
+                                  "ready_at": time.time() + self.batch_delay, "output": None}
+            self.stats["batches"] += 1
+            self.stats["batch_requests"] += len(requests)
+        return self.describe_batch(name)
+
+    def _run_batch(self, name: str):
+        # 期限が来たバッチの全要求を処理して完了にする（self._lock の外で呼ぶ）
+        batch = self.batches[name]
+        model = batch["model"][len("models/"):]
+        output = []
+        for n, entry in enumerate(batch["requests"], 1):
+            if self.fail_every and n % self.fail_every == 0:
+                output.append({"error": {"code": 500, "message": "Internal error (fake)"},
+                               "metadata": entry.get("metadata", {})})
+                continue
+            status, data = self.generate(model, entry.get("request", {}), delay=False)
+            result = {"response": data} if status == 200 else {"error": data["error"]}
+            output.append({**result, "metadata": entry.get("metadata", {})})
+        with self._lock:
+            if batch["state"] != "BATCH_STATE_CANCELLED":
+                batch["output"] = list(reversed(output))
+                batch["state"] = "BATCH_STATE_SUCCEEDED"
+
+    def get_batch(self, name: str) -> dict:
+        batch = self.batches.get(name)
+        if batch is None:
+            return None
+        if batch["state"] in ("BATCH_STATE_PENDING", "BATCH_STATE_RUNNING"):
+            if time.time() >= batch["ready_at"]:
+                self._run_batch(name)
+            else:
+                batch["state"] = "BATCH_STATE_RUNNING"
+        return self.describe_batch(name)
+
+    def cancel_batch(self, name: str) -> bool:
+        with self._lock:
+            batch = self.batches.get(name)
+            if batch is None:
+                return False
+            if batch["state"] in ("BATCH_STATE_PENDING", "BATCH_STATE_RUNNING"):
+                batch["state"] = "BATCH_STATE_CANCELLED"
+            return True
+
+    def describe_batch(self, name: str) -> dict:
+        batch = self.batches[name]
+        body = {"model": batch["model"], "displayName": batch["display_name"], "state": batch["state"],
+                "batchStats": {"requestCount": len(batch["requests"])}}
+        done = batch["state"] not in ("BATCH_STATE_PENDING", "BATCH_STATE_RUNNING")
+        data = {"name": name, "metadata": body, "done": done}
+        if batch["output"] is not None:
+            data["response"] = {**body, "output": {"inlinedResponses": {"inlinedResponses": batch["output"]}}}
+        return data
+
+
+def make_handler(store: GeminiStore):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _json(self, data: dict, status: int = 200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length)) if length else {}
+
+        def _not_found(self):
+            return self._json({"error": {"code": 404, "message": "not found"}}, 404)
+
+        def _name(self) -> str:
+            return urlparse(self.path).path[len(PREFIX):]
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/stats":
+                with store._lock:
+                    return self._json({**store.stats, "active_caches": len(store.caches)})
+            if path.startswith(PREFIX + "cachedContents/"):
+                info = store.get(self._name())
+                return self._json(info) if info else self._not_found()
+            if path.startswith(PREFIX + "batches/"):
+                info = store.get_batch(self._name())
+                return self._json(info) if info else self._not_found()
+            return self._not_found()
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path == PREFIX + "cachedContents":
+                return self._json(store.create(self._body()))
+            if path.startswith(PREFIX + "models/") and path.endswith(":generateContent"):
+                model = path[len(PREFIX + "models/"):-len(":generateContent")]
+                status, data = store.generate(model, self._body())
+                return self._json(data, status)
+            if path.startswith(PREFIX + "models/") and path.endswith(":batchGenerateContent"):
+                model = path[len(PREFIX + "models/"):-len(":batchGenerateContent")]
+                return self._json(store.create_batch(model, self._body()))
+            if path.startswith(PREFIX + "batches/") and path.endswith(":cancel"):
+                return self._json({}) if store.cancel_batch(self._name()[:-len(":cancel")]) else self._not_found()
+            return self._not_found()
+
+        def do_PATCH(self):
+            info = store.refresh(self._name(), self._body())
+            return self._json(info) if info else self._not_found()
+
+        def do_DELETE(self):
+            return self._json({}) if store.delete(self._name()) else self._not_found()
+
+    return Handler
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8766, latency: float = 0.0, batch_delay: float = 0.0,
+                fail_every: int = 0):
+    """テストから起動できるよう (server, store) を返す（serve_forever は呼び出し側で行う）"""
+    store = GeminiStore(latency, batch_delay, fail_every)
+    return ThreadingHTTPServer((host, port), make_handler(store)), store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API の代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="generateContent の応答遅延（秒）")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="バッチが完了するまでの時間（秒）")
+    parser.add_argument("--fail-every", type=int, default=0, help="バッチ内でこの件数ごとに1件をエラーにする（0で無効）")
+    args = parser.parse_args()
+
+    server, _ = make_server(args.host, args.port, args.latency, args.batch_delay, args.fail_every)
+    print(f"🤖 代替 Gemini サーバー起動: http://{args.host}:{args.port}{PREFIX}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("👋 停止しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+app.py / app_tsukkomi.py に同時に多数のリクエストを送る負荷試験（外部サービスはすべてローカルの偽物）
+
+- yt-dlp … PATH の先頭に置いた偽の yt-dlp（指定したレイテンシだけ待ち、動画IDごとに異なる字幕・メタデータを出す）
+- Gemini / TTS / Gmail … アプリのモジュールの該当部分を、指定したレイテンシで待つだけの偽物に差し替える
+フォームの POST とブックマークレットの GET（/?url=...）を混ぜて --clients 本ずつ並行に送り、
+スループット・レイテンシの分布・エラー率と、ほかのリクエストの結果が混ざった応答（取り違え）を数える。
+
+取り違えの判定: 偽の Gemini は受け取ったプロンプトに含まれる動画ID（字幕の各行に入れてある）を
+「対象動画: ...」として返すので、応答の要約が自分の動画IDだけを含むかを確かめる。
+音声は偽の TTS が読み上げテキストをそのまま MP3 として書くので、メールの件名の動画IDと添付の内容を照合する。
+
+データベース・字幕の保存先などはすべて一時フォルダに向けるため、本番のデータには触れない。
+アプリの設定（MAX_RUNNING_JOBS など）は環境変数でそのまま変えられる。
+
+使い方:
+    python scripts/load_test.py --app app --clients 20 --requests 200
+    python scripts/load_test.py --app tsukkomi --clients 8 --requests 40 --ytdlp-latency 0.5
+    python scripts/load_test.py --app all --get-ratio 0.5 --videos 10 --json report.json
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+VIDEO_ID_RE = re.compile(r"lt\d{9}")
+ANALYZED_RE = re.compile(r"対象動画: ((?:lt\d{9}(?:, )?)+)")
+PERCENTILES = (50, 90, 95, 99)
+
+# 偽の yt-dlp（設定は環境変数で受け取る）。メタデータ取得（--dump-single-json）と字幕取得の両方に対応する
+FAKE_YTDLP = r'''
+import json, os, random, re, sys, time
+
+time.sleep(float(os.environ.get("LOADTEST_YTDLP_LATENCY", "0")))
+args = sys.argv[1:]
+
+
+def opt(name):
+    return args[args.index(name) + 1] if name in args else None
+
+
+if opt("--load-info-json"):
+    with open(opt("--load-info-json"), encoding="utf-8") as f:
+        video_id = json.load(f)["id"]
+else:
+    video_id = re.search(r"(?:v=|youtu\.be/)([\w-]{11})", args[-1]).group(1)
+title = "負荷試験 " + video_id
+if "--dump-single-json" in args:
+    json.dump({"id": video_id, "title": title, "channel": "負荷試験チャンネル", "upload_date": "20250101",
+               "duration": 600, "automatic_captions": {"ja": [{"ext": "vtt", "url": "http://127.0.0.1/"}]}},
+              sys.stdout, ensure_ascii=False)
+    sys.exit(0)
+
+phrases = ["決算発表について", "売上高は前年同期比で増加", "ガイダンスが市場予想を上回って", "半導体の需要が強い",
+           "為替の影響で利益率はやや低下", "金利とFRBの発言に注目", "株価は時間外取引で上昇", "来期の見通しです"]
+rng = random.Random(video_id)
+cues = ["WEBVTT", ""]
+for i in range(int(os.environ.get("LOADTEST_CAPTION_LINES", "60"))):
+    start = f"00:{i * 3 // 60:02d}:{i * 3 % 60:02d}.000"
+    end = f"00:{(i * 3 + 3) // 60:02d}:{(i * 3 + 3) % 60:02d}.000"
+    cues += [f"{start} --> {end}", f"{video_id} の字幕 {i}行目 {rng.choice(phrases)}", ""]
+lang = (opt("--sub-lang") or "ja").split(",")[0]
+path = opt("--output").replace("%(title)s", title).replace("%(id)s", video_id).replace("%(ext)s", f"{lang}.vtt")
+with open(path, "w", encoding="utf-8") as f:
+    f.write("\n".join(cues))
+'''
+
+
+def prepare_environment(workdir: Path, args):
+    """
+    偽の yt-dlp を PATH の先頭に置き、アプリの保存先をすべて workdir に向ける（アプリを import する前に呼ぶ）
+    .env の値は load_dotenv が既存の環境変数を上書きしないため、ここで設定したものが優先される
+    """
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir()
+    ytdlp = bin_dir / "yt-dlp"
+    ytdlp.write_text(f"#!{sys.executable}\n{FAKE_YTDLP}", encoding="utf-8")
+    ytdlp.chmod(0o755)
+    state = workdir / "state"
+    state.mkdir()
+    (workdir / "YouTubeInsightGen_venv").mkdir()  # HOME を差し替えるため、アプリが前提とする venv のフォルダも作る
+    os.environ.update({
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "LOADTEST_YTDLP_LATENCY": str(args.ytdlp_latency),
+        "LOADTEST_CAPTION_LINES": str(args.caption_lines),
+        "HOME": str(workdir),
+        "SUMMARY_BACKEND": f"sqlite:///{state / 'state.db'}",
+        "SEARCH_DB": str(state / "search.db"),
+        "NEAR_DUP_DB": str(state / "near_dup.db"),
+        "ENTITY_DB": str(state / "entities.db"),
+        "USAGE_DB": str(state / "usage.db"),
+        "ROUTING_LOG": str(state / "model_runs.jsonl"),
+        "TRANSCRIPT_ARCHIVE_DIR": str(state / "transcripts"),
+        "CONTEXT_CACHE_DB": str(state / "context_cache.db"),
+        # コンテキストキャッシュは REST で本物の API を呼ぶため使わない
+        "CONTEXT_CACHE": "0",
+        # 合成字幕は動画どうしがよく似ているため、類似動画の要約の再利用（正しい動作）が取り違えに見えてしまう
+        "NEAR_DUP_ENABLED": "0",
+        "GMAIL_TO": "",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "loadtest-dummy")
+    # 全クライアントが 127.0.0.1 から来るため、クライアントごとの上限で弾かれないようにする
+    os.environ.setdefault("MAX_JOBS_PER_CLIENT", str(args.clients))
+    os.environ.setdefault("MAX_QUEUED_JOBS", str(args.clients))
+    (workdir / "app").mkdir()
+    shutil.copy(ROOT / "prompts.json", workdir / "app" / "prompts.json")
+    # app_tsukkomi は起動時にカレントディレクトリの captions を空にする
+    os.chdir(workdir / "app")
+
+
+def fake_generate(latency: float, fail_rate: float, rng: random.Random):
+    """偽の Gemini の応答（プロンプト中の動画IDを「対象動画」として返す）"""
+
+    def generate(prompt: str):
+        time.sleep(latency)
+        if rng.random() < fail_rate:
+            raise RuntimeError("503 偽の Gemini の一時エラー")
+        if "カテゴリ候補" in prompt:
+            text = "general"
+        else:
+            ids = sorted(set(VIDEO_ID_RE.findall(prompt)))
+            text = f"## ① 全体の要約\n- 対象動画: {', '.join(ids)}\n- 負荷試験用の要約です"
+        usage = SimpleNamespace(prompt_token_count=len(prompt) // 2, candidates_token_count=len(text) // 2)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    return generate
+
+
+def fake_gemini_clients(args) -> list:
+    """GEMINI_CLIENTS の代わり（app.py・app_tsukkomi.py とも APIキーごとの REST クライアントで呼ぶ）"""
+    generate = fake_generate(args.gemini_latency, args.gemini_fail_rate, random.Random(0))
+    client = SimpleNamespace(generate=lambda model, prompt, cached_content=None: generate(prompt))
+    return [("DEFAULT", client)]
+
+
+def install_app_fakes(module, args, mailbox: list):
+    module.GEMINI_CLIENTS = fake_gemini_clients(args)
+    lock = threading.Lock()
+
+    def fake_tts(text_to_read, output_filepath, job=None):
+        time.sleep(args.tts_latency)
+        # 読み上げテキストをそのまま書いておき、メール側で動画IDを照合する
+        Path(output_filepath).write_text(text_to_read, encoding="utf-8")
+        return True
+
+    def fake_send_gmail(subject, html_body, to_email, attachment_path=None):
+        time.sleep(args.gmail_latency)
+        audio = Path(attachment_path).read_text(encoding="utf-8") if attachment_path else None
+        with lock:
+            mailbox.append({"subject": subject, "audio": audio})
+
+    module.generate_gcp_tts_mp3 = fake_tts
+    module.send_gmail = fake_send_gmail
+
+
+def load_app(name: str, args, mailbox: list):
+    """(Flask アプリ, ブックマークレットの GET に対応するか)"""
+    if name == "app":
+        import app as module
+        install_app_fakes(module, args, mailbox)
+        return module.app, True
+    import app_tsukkomi as module
+    module.GEMINI_CLIENTS = fake_gemini_clients(args)
+    return module.app, False
+
+
+def start_server(flask_app):
+    from werkzeug.serving import make_server
+
+    # app.run() と同じ Werkzeug のスレッド型サーバー
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def video_id_for(i: int, videos: int) -> str:
+    return f"lt{(i % videos if videos else i):09d}"
+
+
+def classify(status: int, body: str, video_id: str) -> tuple:
+    """(結果, 応答に含まれていたほかの動画ID)"""
+    if status in (429, 503):
+        return "rejected", []
+    if status == 409:
+        return "cancelled", []
+    if status != 200:
+        return "error", []
+    analyzed = ANALYZED_RE.search(body)
+    if not analyzed:
+        return "error", []  # 200 でエラー画面を返した場合（字幕の取得に失敗しました など）
+    foreign = sorted(set(VIDEO_ID_RE.findall(body)) - {video_id})
+    if foreign or analyzed.group(1).split(", ") != [video_id]:
+        return "contaminated", foreign
+    return "ok", []
+
+
+def drive(base_url: str, args, genre: str, use_get: bool) -> list:
+    rng = random.Random(args.seed)
+    plan = [(i, video_id_for(i, args.videos), use_get and rng.random() < args.get_ratio) for i in range(args.requests)]
+
+    def one(item) -> dict:
+        i, video_id, is_get = item
+        youtube_url = f"https://www.youtube.com/watch?v={video_id}"
+        if is_get:
+            query = urllib.parse.urlencode({"url": youtube_url, "genre": genre})
+            req = urllib.request.Request(f"{base_url}/?{query}")
+        else:
+            body = urllib.parse.urlencode({"youtube_url": youtube_url, "genre": genre}).encode()
+            req = urllib.request.Request(f"{base_url}/", data=body)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=args.timeout) as resp:
+                status, text = resp.status, resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            status, text = e.code, e.read().decode("utf-8", "replace")
+        except Exception as e:
+            status, text = 0, f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - started
+        outcome, foreign = classify(status, text, video_id) if status else ("error", [])
+        return {"i": i, "video_id": video_id, "method": "GET" if is_get else "POST", "status": status,
+                "outcome": outcome, "foreign": foreign, "latency_s": latency,
+                "detail": "" if outcome == "ok" else re.sub(r"<[^>]+>|\s+", " ", text)[:200].strip()}
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        return list(pool.map(one, plan))
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """最近傍順位法のパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))]
+
+
+def audio_report(mailbox: list) -> dict:
+    """メールの件名の動画IDと、添付した音声（の元テキスト）の動画IDを照合する"""
+    wrong, missing = [], 0
+    for mail in mailbox:
+        expected = set(VIDEO_ID_RE.findall(mail["subject"]))
+        if mail["audio"] is None:
+            missing += 1
+        elif set(VIDEO_ID_RE.findall(mail["audio"])) != expected:
+            wrong.append(mail["subject"])
+    return {"emails": len(mailbox), "without_audio": missing, "wrong_audio": len(wrong), "wrong_samples": wrong[:5]}
+
+
+def summarize(name: str, results: list, elapsed: float, mailbox: list) -> dict:
+    counts = {k: 0 for k in ("ok", "contaminated", "error", "rejected", "cancelled")}
+    for r in results:
+        counts[r["outcome"]] += 1
+    latencies = sorted(r["latency_s"] for r in results)
+    ok_latencies = sorted(r["latency_s"] for r in results if r["outcome"] == "ok")
+    report = {
+        "app": name,
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(counts["ok"] / elapsed, 2) if elapsed else 0.0,
+        "outcomes": counts,
+        "error_rate": round((counts["error"] + counts["contaminated"]) / len(results), 4) if results else 0.0,
+        "latency_s": {f"p{p}": round(percentile(latencies, p), 3) for p in PERCENTILES},
+        "ok_latency_s": {f"p{p}": round(percentile(ok_latencies, p), 3) for p in PERCENTILES},
+        "by_method": {m: sum(1 for r in results if r["method"] == m) for m in ("POST", "GET")},
+        "contaminated_samples": [
+            {"video_id": r["video_id"], "method": r["method"], "foreign": r["foreign"]}
+            for r in results if r["outcome"] == "contaminated"
+        ][:5],
+        "error_samples": [
+            {"video_id": r["video_id"], "status": r["status"], "detail": r["detail"]}
+            for r in results if r["outcome"] == "error"
+        ][:5],
+    }
+    report["latency_s"]["max"] = round(latencies[-1], 3) if latencies else 0.0
+    if mailbox is not None:
+        report["audio"] = audio_report(mailbox)
+    return report
+
+
+def print_report(report: dict):
+    c = report["outcomes"]
+    print(f"\n📊 {report['app']}: {report['requests']} リクエスト（POST {report['by_method']['POST']} / "
+          f"GET {report['by_method']['GET']}）/ {report['elapsed_s']}秒 / 成功 {report['throughput_rps']} 件/秒")
+    print(f"   成功 {c['ok']} / 取り違え {c['contaminated']} / エラー {c['error']} / "
+          f"受付拒否 {c['rejected']} / キャンセル {c['cancelled']}（エラー率 {report['error_rate']:.1%}）")
+    print("   レイテンシ（全体）: " + " / ".join(f"{k} {v:.2f}s" for k, v in report["latency_s"].items()))
+    print("   レイテンシ（成功）: " + " / ".join(f"{k} {v:.2f}s" for k, v in report["ok_latency_s"].items()))
+    if "audio" in report:
+        a = report["audio"]
+        print(f"   メール {a['emails']} 通 / 音声なし {a['without_audio']} / 音声の取り違え {a['wrong_audio']}")
+        for subject in a["wrong_samples"]:
+            print(f"   🔀 音声の取り違え: {subject}")
+    for sample in report["contaminated_samples"]:
+        print(f"   🔀 取り違え: {sample['video_id']} ({sample['method']}) に {', '.join(sample['foreign'])} が混入")
+    for sample in report["error_samples"]:
+        print(f"   ❌ {sample['video_id']} HTTP {sample['status']}: {sample['detail']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py / app_tsukkomi.py の同時実行の負荷試験")
+    parser.add_argument("--app", choices=("app", "tsukkomi", "all"), default="app")
+    parser.add_argument("--clients", type=int, default=10, help="同時クライアント数")
+    parser.add_argument("--requests", type=int, default=50, help="アプリごとの総リクエスト数")
+    parser.add_argument("--get-ratio", type=float, default=0.3, help="ブックマークレット（GET）の割合（app.py のみ）")
+    parser.add_argument("--videos", type=int, default=0, help="動画の種類（0 ならリクエストごとに別の動画。"
+                        "同じ動画が同時に届くと app.py は再送信とみなして前のジョブをキャンセルする）")
+    parser.add_argument("--genre", default="general", help="app.py に渡すジャンル（auto で判定も含める）")
+    parser.add_argument("--ytdlp-latency", type=float, default=0.5, help="偽の yt-dlp の待ち時間（秒）")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="偽の Gemini の待ち時間（秒）")
+    parser.add_argument("--gemini-fail-rate", type=float, default=0.0, help="偽の Gemini がエラーを返す割合")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="偽の TTS の待ち時間（秒）")
+    parser.add_argument("--gmail-latency", type=float, default=0.2, help="偽の Gmail 送信の待ち時間（秒）")
+    parser.add_argument("--caption-lines", type=int, default=60, help="偽の字幕の行数")
+    parser.add_argument("--timeout", type=float, default=600, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を JSON で保存する")
+    parser.add_argument("--verbose", action="store_true", help="アプリのログも表示する")
+    args = parser.parse_args()
+
+    json_path = Path(args.json).resolve() if args.json else None  # 作業フォルダに移動する前に解決
+    workdir = Path(tempfile.mkdtemp(prefix="yig_loadtest_"))
+    prepare_environment(workdir, args)
+    # アプリのログ（print）は --verbose のときだけ標準エラーに出す
+    app_log = sys.stderr if args.verbose else open(workdir / "app.log", "w", encoding="utf-8")
+    if not args.verbose:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # 1リクエスト1行のアクセスログ
+    reports = []
+    try:
+        for name in (("app", "tsukkomi") if args.app == "all" else (args.app,)):
+            mailbox = []
+            print(f"▶ {name}: {args.requests} リクエスト / 同時 {args.clients} クライアント "
+                  f"(yt-dlp {args.ytdlp_latency}s, Gemini {args.gemini_latency}s, TTS {args.tts_latency}s)")
+            with contextlib.redirect_stdout(app_log):
+                flask_app, supports_get = load_app(name, args, mailbox)
+                base_url, stop = start_server(flask_app)
+                started = time.perf_counter()
+                try:
+                    results = drive(base_url, args, args.genre if supports_get else "tsukkomi", supports_get)
+                finally:
+                    stop()
+            report = summarize(name, results, time.perf_counter() - started, mailbox if supports_get else None)
+            print_report(report)
+            reports.append(report)
+    finally:
+        if app_log is not sys.stderr:
+            app_log.close()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        json_path.write_text(json.dumps(reports, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"💾 結果を保存しました: {json_path}")
+    bad = sum(r["outcomes"]["contaminated"] + r.get("audio", {}).get("wrong_audio", 0) for r in reports)
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+analyze_youtube.py の複数動画版（URL の一覧をまとめて要約し、1動画1行の NDJSON で結果を出す）
+
+- URL（または動画ID）をファイルか標準入力から読み、--concurrency 本ずつ並行して処理する
+- 字幕は analyze_youtube.fetch_transcript_text で取得し（YouTubeTranscriptApi はスレッドごとに使い回す）、
+  要約は gcli を起動せず、プロセス内の Gemini REST クライアント（APIキーごとに1つ、全スレッドで共有）で行う
+- 結果は終わった順に1行ずつ書き出す（--out を指定するとファイルに追記）
+- 途中で止まっても、同じ --out を指定して再実行すれば成功済みの動画を飛ばして続きから処理する
+ログは標準エラーに出すので、標準出力はそのまま NDJSON として jq などに渡せる。
+
+使い方:
+    python src/analyze_bulk.py urls.txt --out results.ndjson --concurrency 4
+    cat urls.txt | python src/analyze_bulk.py - --genre stock_analyst | jq -r .summary
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from analyze_youtube import SUMMARY_INSTRUCTION, extract_video_id, fetch_transcript_text  # noqa: E402
+from youtube_transcript_api import YouTubeTranscriptApi  # noqa: E402
+
+from utils.context_cache import API_BASE, CacheApiError, GeminiRestClient  # noqa: E402
+
+RETRY_STATUSES = (429, 500, 503)
+_local = threading.local()
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def read_urls(path: str) -> list:
+    """1行1URL（空行と # で始まる行は無視）。- は標準入力"""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def load_done(path: Path, skip_failed: bool = False) -> set:
+    """
+    前回の出力から処理済みの動画IDを集める（成功したもの。skip_failed なら失敗したものも）
+    強制終了で途中まで書かれた最後の行は読み飛ばす
+    """
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok" or skip_failed:
+                done.add(record.get("video_id"))
+    return done
+
+
+def gemini_clients() -> list:
+    """(キー名, クライアント) を優先順に（app.get_gemini_api_keys と同じ順）"""
+    base = os.getenv("GEMINI_API_BASE", API_BASE)
+    keys = [("PRIMARY", os.getenv("GEMINI_API_KEY_PRIMARY")), ("FALLBACK", os.getenv("GEMINI_API_KEY_FALLBACK"))]
+    clients = [(name, GeminiRestClient(key, base)) for name, key in keys if key]
+    if not clients and os.getenv("GEMINI_API_KEY"):
+        clients.append(("DEFAULT", GeminiRestClient(os.getenv("GEMINI_API_KEY"), base)))
+    return clients
+
+
+def build_prompt_factory(genre: str):
+    """prompts.json のジャンル（app.create_prompt と同じ置き換え）。未指定なら analyze_youtube と同じ指示"""
+    if not genre:
+        return lambda text, video_id, url: f"{SUMMARY_INSTRUCTION}\n\n{text}"
+    with open(ROOT / "prompts.json", "r", encoding="utf-8") as f:
+        template = json.load(f)[genre]["prompt_template"]
+    return lambda text, video_id, url: (template.replace("{cleaned_text}", text)
+                                        .replace("{video_title}", video_id).replace("{video_url}", url))
+
+
+def transcript_api():
+    """youtube_transcript_api 1.x はスレッドごとにインスタンス（HTTP セッション）を使い回す（0.x は None）"""
+    if hasattr(YouTubeTranscriptApi, "list_transcripts"):
+        return None
+    if getattr(_local, "api", None) is None:
+        _local.api = YouTubeTranscriptApi()
+    return _local.api
+
+
+def summarize(clients: list, model: str, prompt: str, retries: int):
+    """キーを優先順に試し、一時的なエラー（429 / 5xx）は指数的に待ってやり直す。(キー名, 応答) を返す"""
+    last_error = None
+    for key_name, client in clients:
+        for attempt in range(retries + 1):
+            try:
+                return key_name, client.generate(model, prompt)
+            except CacheApiError as e:
+                last_error = e
+                if e.status not in RETRY_STATUSES:
+                    break
+                if attempt < retries:
+                    time.sleep(2 ** attempt)
+            except OSError as e:  # 接続エラー・タイムアウト
+                last_error = e
+                if attempt < retries:
+                    time.sleep(2 ** attempt)
+        log(f"⚠️ {key_name} で失敗: {last_error}")
+    raise last_error or RuntimeError("Gemini の APIキーが設定されていません")
+
+
+def analyze_one(url: str, args, clients: list, build_prompt) -> dict:
+    """1動画分の字幕取得と要約（失敗しても例外にせず、status / stage / error を入れた結果を返す）"""
+    video_id = extract_video_id(url)
+    record = {"url": url, "video_id": video_id, "status": "error"}
+    try:
+        text = fetch_transcript_text(video_id, args.langs, transcript_api())
+    except Exception as e:
+        record.update(stage="transcript", error=f"{type(e).__name__}: {e}"[:500])
+        return record
+    if not text.strip():
+        record.update(stage="transcript", error="字幕が空です")
+        return record
+    record["chars"] = len(text)
+    try:
+        key_name, response = summarize(clients, args.model, build_prompt(text, video_id, url), args.retries)
+    except Exception as e:
+        record.update(stage="summary", error=f"{type(e).__name__}: {e}"[:500])
+        return record
+    usage = response.usage_metadata
+    record.update(status="ok", model=args.model, key_name=key_name, summary=response.text,
+                  prompt_tokens=usage.prompt_token_count, output_tokens=usage.candidates_token_count)
+    return record
+
+
+def process(url: str, args, clients: list, build_prompt) -> dict:
+    started = time.perf_counter()
+    record = analyze_one(url, args, clients, build_prompt)
+    record["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YouTube 動画の一括要約（NDJSON 出力・再開対応）")
+    parser.add_argument("urls", help="URL（または動画ID）の一覧ファイル（- で標準入力）")
+    parser.add_argument("--out", help="結果の NDJSON を追記するファイル（再開に使う。省略時は標準出力）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に処理する動画数")
+    parser.add_argument("--genre", help="prompts.json のジャンルのプロンプトを使う（省略時は単純な要約）")
+    parser.add_argument("--model", default=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"))
+    parser.add_argument("--langs", default="ja,en", type=lambda s: [x.strip() for x in s.split(",") if x.strip()],
+                        help="字幕の言語（優先順・カンマ区切り）")
+    parser.add_argument("--retries", type=int, default=2, help="429 / 5xx のときのやり直し回数（キーごと）")
+    parser.add_argument("--skip-failed", action="store_true", help="前回失敗した動画もやり直さない")
+    args = parser.parse_args()
+
+    clients = gemini_clients()
+    if not clients:
+        sys.exit("❌ GEMINI_API_KEY_PRIMARY または GEMINI_API_KEY が設定されていません")
+    build_prompt = build_prompt_factory(args.genre)
+
+    urls = list({extract_video_id(u): u for u in read_urls(args.urls)}.items())
+    out_path = Path(args.out) if args.out else None
+    done = load_done(out_path, args.skip_failed) if out_path else set()
+    pending = [(vid, url) for vid, url in urls if vid not in done]
+    log(f"📚 {len(urls)} 件中 {len(pending)} 件を処理します（処理済み {len(urls) - len(pending)} 件, "
+        f"並列 {args.concurrency}, model={args.model}）")
+
+    out = sys.stdout
+    if out_path:
+        # 強制終了で改行が書かれなかった行に続けて書かないようにする
+        needs_newline = False
+        if out_path.exists() and out_path.stat().st_size > 0:
+            with open(out_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        out = open(out_path, "a", encoding="utf-8")
+        if needs_newline:
+            out.write("\n")
+
+    started = time.perf_counter()
+    counts = {"ok": 0, "error": 0}
+    pool = ThreadPoolExecutor(max_workers=max(1, args.concurrency))
+    try:
+        futures = {pool.submit(process, url, args, clients, build_prompt): vid for vid, url in pending}
+        for n, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+            mark = "✅" if record["status"] == "ok" else "❌"
+            log(f"{mark} [{n}/{len(pending)}] {record['video_id']}"
+                + (f" ({record['stage']}: {record['error']})" if record["status"] != "ok" else "")
+                + f" {record['elapsed_s']}秒")
+    except KeyboardInterrupt:
+        log("🛑 中断しました（同じ --out で再実行すると続きから処理します）")
+        pool.shutdown(wait=False, cancel_futures=True)
+        sys.exit(130)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    pool.shutdown()
+    elapsed = time.perf_counter() - started
+    log(f"📊 成功 {counts['ok']} / 失敗 {counts['error']} / {elapsed:.1f}秒"
+        + (f"（{len(pending) / elapsed * 60:.1f} 本/分）" if elapsed > 0 and pending else ""))
+
+
+if __name__ == "__main__":
+    main()
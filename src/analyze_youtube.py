@@ -11,12 +11,20 @@ def extract_video_id(url: str) -> str:
     match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11})", url)
     return match.group(1) if match else url.strip()
 
-# 字幕取得
+# 字幕取得（失敗時は例外。api に YouTubeTranscriptApi のインスタンスを渡すと使い回せる）
+def fetch_transcript_text(video_id: str, languages=('ja', 'en'), api=None) -> str:
+    if api is None and hasattr(YouTubeTranscriptApi, "list_transcripts"):
+        transcripts = YouTubeTranscriptApi.list_transcripts(video_id)  # 0.x はクラスメソッド
+    else:
+        transcripts = (api or YouTubeTranscriptApi()).list(video_id)  # 1.x はインスタンスのメソッド
+    transcript = transcripts.find_transcript(list(languages)).fetch()
+    # 0.x は dict、1.x は text 属性を持つオブジェクトの並び
+    return "\n".join(item['text'] if isinstance(item, dict) else item.text for item in transcript)
+
+# 字幕取得（失敗時は空文字）
 def fetch_transcript(video_id: str, languages=['ja', 'en']) -> str:
     try:
-        transcripts = YouTubeTranscriptApi.list_transcripts(video_id)
-        transcript = transcripts.find_transcript(languages).fetch()
-        return "\n".join([item['text'] for item in transcript])
+        return fetch_transcript_text(video_id, languages)
     except (TranscriptsDisabled, NoTranscriptFound) as e:
         print(f"⚠️ 字幕取得失敗: {e}")
         return ""
@@ -24,12 +32,14 @@ def fetch_transcript(video_id: str, languages=['ja', 'en']) -> str:
         print(f"⚠️ その他のエラー: {e}")
         return ""
 
+SUMMARY_INSTRUCTION = '以下のYouTube字幕を要約してください'
+
 # Gemini CLI へ要約依頼
 def summarize_with_gemini(text: str) -> str:
     try:
         # `echo テキスト | gcli` でGemini CLIへパイプ送信
         result = subprocess.run(
-            ['gcli', '--model', 'gemini-1.5-pro-latest', '--system', '以下のYouTube字幕を要約してください'],
+            ['gcli', '--model', 'gemini-1.5-pro-latest', '--system', SUMMARY_INSTRUCTION],
             input=text.encode('utf-8'),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
@@ -0,0 +1,246 @@
+# utils/admission.py
+"""
+要約パイプラインの流入制御（アドミッションコントロール）と優先度スケジューリング
+
+- 同時実行数の上限を超えた分は待機列に並べる
+- 待機列が満杯なら 503、同じクライアントの同時リクエストが上限を超えたら 429 を即座に返す
+- Retry-After は直近の処理時間と現在の待機数から見積もる
+- 待機列は interactive（ブックマークレット・画面操作）と bulk（バックフィル）の2レーンに分け、
+  空いた実行枠を重み付きで公平に配分する（PriorityGate）
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+DEFAULT_SERVICE_TIME = 60.0  # 実績がないときに仮定する1件あたりの処理時間（秒）
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+
+class AdmissionRejected(Exception):
+    """受け付けを拒否したことを示す例外（HTTPステータスと再試行までの秒数を持つ）"""
+
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Ticket:
+    __slots__ = ("lane", "granted")
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.granted = False
+
+
+class PriorityGate:
+    """
+    capacity 個の実行枠をレーン間で配分するゲート
+
+    weights: レーンごとの重み（滑らかな重み付きラウンドロビンで配分）。
+             重み 0 のレーンは、重みを持つレーンに待ちがないときだけ枠を得る
+    limits:  レーンごとの同時実行数の上限（bulk が全枠を埋めないようにする等）
+    """
+
+    def __init__(self, capacity: int, weights: Dict[str, int], limits: Optional[Dict[str, int]] = None):
+        self.capacity = capacity
+        self.weights = weights
+        self.limits = limits or {}
+        self.running = {lane: 0 for lane in weights}
+        self._queues = {lane: deque() for lane in weights}
+        self._credit = {lane: 0 for lane in weights}
+        self._cond = threading.Condition()
+
+    def waiting(self, lane: Optional[str] = None) -> int:
+        if lane:
+            return len(self._queues[lane])
+        return sum(len(q) for q in self._queues.values())
+
+    def total_running(self) -> int:
+        return sum(self.running.values())
+
+    def _eligible(self, lane: str) -> bool:
+        return bool(self._queues[lane]) and self.running[lane] < self.limits.get(lane, self.capacity)
+
+    def _pick_lane(self) -> Optional[str]:
+        eligible = [lane for lane in self.weights if self._eligible(lane)]
+        weighted = [lane for lane in eligible if self.weights[lane] > 0]
+        if not weighted:
+            return eligible[0] if eligible else None
+        total = sum(self.weights[lane] for lane in weighted)
+        for lane in weighted:
+            self._credit[lane] += self.weights[lane]
+        best = max(weighted, key=lambda lane: self._credit[lane])
+        self._credit[best] -= total
+        return best
+
+    def _dispatch(self):
+        # self._cond を保持した状態で呼ぶ
+        while self.total_running() < self.capacity:
+            lane = self._pick_lane()
+            if lane is None:
+                break
+            ticket = self._queues[lane].popleft()
+            ticket.granted = True
+            self.running[lane] += 1
+        self._cond.notify_all()
+
+    def acquire(self, lane: str, check: Optional[Callable[[], None]] = None, max_wait: Optional[float] = None) -> float:
+        """
+        実行枠を得るまで待ち、待機時間（秒）を返す
+        max_wait 秒を超えたら TimeoutError、check はキャンセル確認用
+        """
+        started = time.time()
+        with self._cond:
+            ticket = _Ticket(lane)
+            self._queues[lane].append(ticket)
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    if max_wait is not None and time.time() - started > max_wait:
+                        raise TimeoutError(f"{lane} レーンの待機時間が上限を超えました")
+                    self._cond.wait(timeout=1.0)
+                    if check:
+                        check()
+            except BaseException:
+                if ticket.granted:
+                    self.running[lane] -= 1
+                else:
+                    self._queues[lane].remove(ticket)
+                self._dispatch()
+                raise
+        return time.time() - started
+
+    def release(self, lane: str):
+        with self._cond:
+            self.running[lane] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane: str, check: Optional[Callable[[], None]] = None):
+        self.acquire(lane, check)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+
+class AdmissionController:
+    def __init__(self, max_running: int, max_queued: int, per_client: int, max_wait: float,
+                 weights: Optional[Dict[str, int]] = None, reserved_interactive: int = 1):
+        self.max_running = max_running
+        self.max_queued = max_queued  # レーンごとの待機数の上限
+        self.per_client = per_client
+        self.max_wait = max_wait
+        # bulk は interactive 用に reserved_interactive 枠を残して実行する
+        self.gate = PriorityGate(
+            max_running,
+            weights or {INTERACTIVE: 3, BULK: 1},
+            limits={BULK: max(1, max_running - reserved_interactive)},
+        )
+        self._clients: Dict[str, int] = {}
+        self._service_times = deque(maxlen=50)
+        self._wait_times = {lane: deque(maxlen=50) for lane in LANES}
+        self._lock = threading.Lock()
+
+    def _avg_service_time(self) -> float:
+        if not self._service_times:
+            return DEFAULT_SERVICE_TIME
+        return sum(self._service_times) / len(self._service_times)
+
+    def _estimate_wait(self, ahead: int) -> float:
+        """ahead 件が前に並んでいるときの待ち時間の見積もり（秒）"""
+        return self._avg_service_time() * (ahead // self.max_running + 1)
+
+    def snapshot(self) -> dict:
+        """index画面・監視用の現在の状態"""
+        with self._lock:
+            wait_times = [t for lane in LANES for t in self._wait_times[lane]]
+            busy = self.gate.total_running() >= self.max_running
+            return {
+                "running": self.gate.total_running(),
+                "max_running": self.max_running,
+                "waiting": self.gate.waiting(),
+                "max_queued": self.max_queued,
+                "per_client": self.per_client,
+                "lanes": {
+                    lane: {
+                        "running": self.gate.running[lane],
+                        "waiting": self.gate.waiting(lane),
+                        "avg_wait_s": round(sum(self._wait_times[lane]) / len(self._wait_times[lane]), 1)
+                        if self._wait_times[lane] else 0.0,
+                    }
+                    for lane in LANES
+                },
+                "avg_service_s": round(self._avg_service_time(), 1),
+                "avg_wait_s": round(sum(wait_times) / len(wait_times), 1) if wait_times else 0.0,
+                "estimated_wait_s": math.ceil(self._estimate_wait(self.gate.waiting(INTERACTIVE))) if busy else 0,
+            }
+
+    def reserve(self, client: str, lane: str = INTERACTIVE):
+        """受け付け可否を即座に判定する（不可なら AdmissionRejected）"""
+        with self._lock:
+            if self._clients.get(client, 0) >= self.per_client:
+                raise AdmissionRejected(
+                    429, max(1, math.ceil(self._avg_service_time())),
+                    f"同時に処理できるリクエストは1クライアントあたり{self.per_client}件までです",
+                )
+            if self.gate.total_running() >= self.max_running and self.gate.waiting(lane) >= self.max_queued:
+                raise AdmissionRejected(
+                    503, max(1, math.ceil(self._estimate_wait(self.gate.waiting(lane)))),
+                    "現在混み合っています。しばらくしてから再度お試しください",
+                )
+            self._clients[client] = self._clients.get(client, 0) + 1
+
+    def cancel_reservation(self, client: str):
+        """reserve したが slot に入らずに終わったリクエスト（ジョブ作成の失敗・開始前のキャンセル）の予約を戻す"""
+        self._release_client(client)
+
+    def _release_client(self, client: str):
+        with self._lock:
+            count = self._clients.get(client, 0) - 1
+            if count > 0:
+                self._clients[client] = count
+            else:
+                self._clients.pop(client, None)
+
+    @contextmanager
+    def slot(self, client: str, lane: str = INTERACTIVE, check: Optional[Callable[[], None]] = None):
+        """reserve 済みのリクエストについて 実行枠の待機 → 実行 → 解放 をまとめて行う"""
+        try:
+            waited = self.gate.acquire(lane, check, max_wait=self.max_wait)
+        except TimeoutError:
+            self._release_client(client)
+            raise AdmissionRejected(503, max(1, math.ceil(self._estimate_wait(self.gate.waiting(lane)))),
+                                    "待機時間が上限を超えました")
+        except BaseException:
+            self._release_client(client)
+            raise
+        with self._lock:
+            self._wait_times[lane].append(waited)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.gate.release(lane)
+            self._release_client(client)
+            with self._lock:
+                self._service_times.append(time.time() - started)
+
+
+def forwarded_client(remote_addr: str, forwarded_for: Optional[str], trusted_hops: int) -> str:
+    """
+    X-Forwarded-For からクライアントのアドレスを取り出す（werkzeug の ProxyFix(x_for=trusted_hops) と同じ規則）
+    信頼するプロキシが追加した末尾 trusted_hops 個のうち先頭の値を使い、足りなければ直接の接続元を使う
+    """
+    if not trusted_hops or not forwarded_for:
+        return remote_addr
+    values = [v.strip() for v in forwarded_for.split(",")]
+    return values[-trusted_hops] if len(values) >= trusted_hops else remote_addr
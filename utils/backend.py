@@ -0,0 +1,382 @@
+# utils/backend.py
+"""
+複数インスタンスで共有する状態（ジョブキュー・キャッシュ・重複防止ロック）のバックエンド
+
+環境変数 SUMMARY_BACKEND で切り替える:
+- redis://host:6379/0        … Redisプロトコル（複数ノード構成向け、要 redis パッケージ）
+- sqlite:///path/to/state.db … SQLite（単一ノード / 共有ディスク上のローカル代替）
+未設定時は ~/YouTubeInsightGen_venv/state.db の SQLite を使う。
+
+single_flight() は「キャッシュ確認 → ロック取得 → 計算 → キャッシュ保存」を行い、
+同じキーの計算（Gemini呼び出しなど）をクラスタ全体で1回に抑える。
+ロックは計算中に延長し続けるため、長い計算でも期限切れで他ノードが重複して計算することはなく、
+計算中のノードが落ちた場合だけ lock_ttl 秒後に他ノードが引き継ぐ。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+DEFAULT_SQLITE_PATH = Path.home() / "YouTubeInsightGen_venv" / "state.db"
+DEFAULT_LEASE = 1800  # ジョブ取り出し後、完了報告がなければ再配布するまでの秒数
+SUMMARY_QUEUE = "summarize"  # 要約ジョブの共有キュー名（app.py / worker.py / watcher.py で共通）
+
+
+class SqliteBackend:
+    """SQLite による実装（1ファイルにキュー・キャッシュ・ロックを保存）"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS queue (
+                    id TEXT PRIMARY KEY, queue TEXT NOT NULL, payload TEXT NOT NULL,
+                    status TEXT NOT NULL, lease_until REAL, result TEXT,
+                    created_at REAL NOT NULL, updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS queue_pending ON queue (queue, status, created_at);
+                CREATE TABLE IF NOT EXISTS cache (
+                    ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,
+                    PRIMARY KEY (ns, key)
+                );
+                CREATE TABLE IF NOT EXISTS locks (
+                    name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL
+                );
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # スレッドごとに接続を持つ（sqlite3の接続はスレッド間で共有できないため）
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # --- ジョブキュー ---
+    def enqueue(self, queue: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO queue (id, queue, payload, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, queue, json.dumps(payload, ensure_ascii=False), now, now),
+        )
+        return job_id
+
+    def dequeue(self, queue: str, timeout: float = 5.0, lease: float = DEFAULT_LEASE) -> Optional[Tuple[str, dict]]:
+        """
+        最も古いジョブを1件取り出す（リースが切れた実行中ジョブも再配布対象）
+        timeout 秒待っても無ければ None
+        """
+        deadline = time.time() + timeout
+        conn = self._conn()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, payload FROM queue WHERE queue = ? AND "
+                    "(status = 'queued' OR (status = 'running' AND lease_until < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (queue, now),
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE queue SET status = 'running', lease_until = ?, updated_at = ? WHERE id = ?",
+                        (now + lease, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if row:
+                return row[0], json.loads(row[1])
+            if now >= deadline:
+                return None
+            time.sleep(min(0.5, max(0.0, deadline - now)))
+
+    def complete(self, job_id: str, status: str, result: Optional[dict] = None):
+        self._conn().execute(
+            "UPDATE queue SET status = ?, result = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(), job_id),
+        )
+
+    def job_info(self, job_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT status, payload, result FROM queue WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {"job_id": job_id, "status": row[0], "payload": json.loads(row[1]),
+                "result": json.loads(row[2]) if row[2] else None}
+
+    def queue_length(self, queue: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM queue WHERE queue = ? AND status = 'queued'", (queue,)
+        ).fetchone()[0]
+
+    # --- キャッシュ ---
+    def cache_get(self, ns: str, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE ns = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (ns, key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def cache_set(self, ns: str, key: str, value: str, ttl: Optional[float] = None):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (ns, key, value, time.time() + ttl if ttl else None),
+        )
+
+    def cache_add(self, ns: str, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """キーが存在しない（または期限切れの）場合のみ保存する。保存できたら True"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE ns = ? AND key = ? AND expires_at <= ?", (ns, key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO cache (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (ns, key, value, now + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def cache_delete(self, ns: str, key: str):
+        self._conn().execute("DELETE FROM cache WHERE ns = ? AND key = ?", (ns, key))
+
+    # --- ロック ---
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE name = ? AND expires_at <= ?", (name, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO locks (name, token, expires_at) VALUES (?, ?, ?)",
+                (name, token, now + ttl),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return token if cur.rowcount == 1 else None
+
+    def extend_lock(self, name: str, token: str, ttl: float) -> bool:
+        """自分が持っているロックの期限を今から ttl 秒後に延ばす。既に失っていれば False"""
+        cur = self._conn().execute(
+            "UPDATE locks SET expires_at = ? WHERE name = ? AND token = ?", (time.time() + ttl, name, token)
+        )
+        return cur.rowcount == 1
+
+    def release_lock(self, name: str, token: str):
+        self._conn().execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+
+class RedisBackend:
+    """Redis プロトコルによる実装（複数ノードでキュー・キャッシュ・ロックを共有）"""
+
+    # トークンが一致する場合のみロックを解放する
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    # トークンが一致する場合のみロックの期限を延ばす
+    _EXTEND_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('pexpire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    # リース切れのジョブを待ち行列へ戻してから、最も古いジョブを処理中リストへ移してリースを付ける
+    # （移動とリース登録の間でワーカーが落ちても、リースのない処理中ジョブが残らないよう1つのスクリプトで行う）
+    _DEQUEUE_SCRIPT = """
+    local expired = redis.call('zrangebyscore', KEYS[3], '-inf', ARGV[1])
+    for _, id in ipairs(expired) do
+        redis.call('zrem', KEYS[3], id)
+        redis.call('lrem', KEYS[2], 0, id)
+        redis.call('rpush', KEYS[1], id)
+    end
+    local id = redis.call('lmove', KEYS[1], KEYS[2], 'RIGHT', 'LEFT')
+    if not id then
+        return false
+    end
+    redis.call('zadd', KEYS[3], ARGV[2], id)
+    local job = ARGV[3] .. id
+    redis.call('hset', job, 'status', 'running')
+    return {id, redis.call('hget', job, 'payload')}
+    """
+
+    def __init__(self, url: str, prefix: str = "ytig"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Redisバックエンドには redis パッケージが必要です (pip install redis)")
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._release = self.r.register_script(self._RELEASE_SCRIPT)
+        self._extend = self.r.register_script(self._EXTEND_SCRIPT)
+        self._dequeue = self.r.register_script(self._DEQUEUE_SCRIPT)
+
+    def _k(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    # --- ジョブキュー ---
+    def enqueue(self, queue: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        pipe = self.r.pipeline()
+        pipe.hset(self._k("job", job_id), mapping={
+            "queue": queue, "status": "queued", "payload": json.dumps(payload, ensure_ascii=False),
+        })
+        pipe.lpush(self._k("queue", queue), job_id)
+        pipe.execute()
+        return job_id
+
+    def dequeue(self, queue: str, timeout: float = 5.0, lease: float = DEFAULT_LEASE) -> Optional[Tuple[str, dict]]:
+        """
+        最も古いジョブを1件取り出す（リースが切れた実行中ジョブも再配布対象）
+        timeout 秒待っても無ければ None（スクリプト内では待てないため、SQLite 版と同じくポーリングする）
+        """
+        keys = [self._k("queue", queue), self._k("processing", queue), self._k("leases", queue)]
+        deadline = time.time() + timeout
+        while True:
+            now = time.time()
+            item = self._dequeue(keys=keys, args=[now, now + lease, self._k("job", "")])
+            if item:
+                return item[0], json.loads(item[1])
+            if now >= deadline:
+                return None
+            time.sleep(min(0.5, max(0.0, deadline - now)))
+
+    def complete(self, job_id: str, status: str, result: Optional[dict] = None):
+        queue = self.r.hget(self._k("job", job_id), "queue")
+        pipe = self.r.pipeline()
+        pipe.hset(self._k("job", job_id), mapping={
+            "status": status, "result": json.dumps(result, ensure_ascii=False) if result is not None else "",
+        })
+        pipe.lrem(self._k("processing", queue), 0, job_id)
+        pipe.zrem(self._k("leases", queue), job_id)
+        pipe.execute()
+
+    def job_info(self, job_id: str) -> Optional[dict]:
+        data = self.r.hgetall(self._k("job", job_id))
+        if not data:
+            return None
+        return {"job_id": job_id, "status": data["status"], "payload": json.loads(data["payload"]),
+                "result": json.loads(data["result"]) if data.get("result") else None}
+
+    def queue_length(self, queue: str) -> int:
+        return self.r.llen(self._k("queue", queue))
+
+    # --- キャッシュ ---
+    def cache_get(self, ns: str, key: str) -> Optional[str]:
+        return self.r.get(self._k("cache", ns, key))
+
+    def cache_set(self, ns: str, key: str, value: str, ttl: Optional[float] = None):
+        self.r.set(self._k("cache", ns, key), value, px=int(ttl * 1000) if ttl else None)
+
+    def cache_add(self, ns: str, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(self.r.set(self._k("cache", ns, key), value, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    def cache_delete(self, ns: str, key: str):
+        self.r.delete(self._k("cache", ns, key))
+
+    # --- ロック ---
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.r.set(self._k("lock", name), token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def extend_lock(self, name: str, token: str, ttl: float) -> bool:
+        """自分が持っているロックの期限を今から ttl 秒後に延ばす。既に失っていれば False"""
+        return bool(self._extend(keys=[self._k("lock", name)], args=[token, int(ttl * 1000)]))
+
+    def release_lock(self, name: str, token: str):
+        self._release(keys=[self._k("lock", name)], args=[token])
+
+
+def get_backend(url: Optional[str] = None):
+    """SUMMARY_BACKEND の設定に応じたバックエンドを返す"""
+    url = url or os.getenv("SUMMARY_BACKEND", "")
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        print(f"🗄️ 共有バックエンド: Redis ({url.split('@')[-1]})")
+        return RedisBackend(url)
+    path = Path(url[len("sqlite:///"):]) if url.startswith("sqlite:///") else DEFAULT_SQLITE_PATH
+    print(f"🗄️ 共有バックエンド: SQLite ({path})")
+    return SqliteBackend(path)
+
+
+def _keep_lock(backend, name: str, token: str, ttl: float, stop: threading.Event):
+    """stop が立つまで ttl の 1/3 ごとにロックを延長する（single_flight の計算中に別スレッドで動かす）"""
+    while not stop.wait(ttl / 3):
+        try:
+            if not backend.extend_lock(name, token, ttl):
+                print(f"⚠️ ロックを失いました（期限切れ）: {name}")
+                return
+        except Exception as e:
+            # 一時的な接続エラーでは諦めず、次の周期で延長を再試行する
+            print(f"⚠️ ロックの延長に失敗: {name}: {e}")
+
+
+def single_flight(backend, ns: str, key: str, compute: Callable[[], str], ttl: Optional[float] = None,
+                  lock_ttl: float = 60, wait_timeout: Optional[float] = None, poll: float = 1.0,
+                  check: Optional[Callable[[], None]] = None) -> str:
+    """
+    キャッシュにあればそれを返し、無ければロックを取ったノードだけが compute() を実行する
+    他ノードが計算中の場合は結果がキャッシュに入るまで待つ（check はキャンセル確認用）
+    計算中はロックを延長し続けるので、lock_ttl は計算時間ではなく「落ちたノードの検出までの秒数」。
+    待つ側はロックが生きている限り待ち続ける（wait_timeout を指定した場合はその秒数で打ち切る）
+    """
+    cached = backend.cache_get(ns, key)
+    if cached is not None:
+        print(f"♻️ キャッシュ利用: {ns}/{key}")
+        return cached
+
+    deadline = time.time() + wait_timeout if wait_timeout is not None else None
+    lock_name = f"{ns}:{key}"
+    announced = False
+    while True:
+        token = backend.acquire_lock(lock_name, lock_ttl)
+        if token:
+            stop = threading.Event()
+            keeper = threading.Thread(target=_keep_lock, args=(backend, lock_name, token, lock_ttl, stop),
+                                      daemon=True)
+            keeper.start()
+            try:
+                # ロック待ちの間に他ノードが計算し終えている場合がある
+                cached = backend.cache_get(ns, key)
+                if cached is not None:
+                    return cached
+                value = compute()
+                backend.cache_set(ns, key, value, ttl)
+                return value
+            finally:
+                stop.set()
+                keeper.join()
+                backend.release_lock(lock_name, token)
+
+        if not announced:
+            print(f"⏳ 他のノードが処理中のため結果を待機: {ns}/{key}")
+            announced = True
+        if deadline is not None and time.time() >= deadline:
+            raise TimeoutError(f"{ns}/{key} の結果待ちがタイムアウトしました")
+        if check:
+            check()
+        time.sleep(poll)
+        cached = backend.cache_get(ns, key)
+        if cached is not None:
+            return cached
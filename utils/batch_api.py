@@ -0,0 +1,177 @@
+# utils/batch_api.py
+"""
+Gemini Batch API（batchGenerateContent）で急がない要約をまとめて処理する
+
+過去動画のバックフィルのように結果を急がない要約は、1件ずつ generateContent を呼ぶ代わりに
+1つのバッチジョブとして投入する（料金は通常の半額、対話リクエストの実行枠も使わない）。
+- pack_requests: 要求をモデルごとに分け、件数・サイズの上限でバッチに詰める
+- BatchClient: バッチの投入・状態確認・完了待ち・キャンセル（REST を urllib で直接呼ぶ）
+- reconcile: バッチの結果を要求のキーに突き合わせる（応答のない要求・エラーの要求も返す）
+- save_manifest / load_manifest: 投入したバッチの要求キーの一覧を保存する（失敗・期限切れのバッチは結果に
+  キーが残らないため、中断後の再開ではこの一覧から動画を復元する）
+要求はインラインで送るため、1バッチの合計は MAX_INLINE_BYTES までにする。
+base_url を変えれば scripts/fake_gemini_server.py で動作を確認できる。
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.context_cache import GeminiRestClient, parse_response
+
+MAX_INLINE_BYTES = 18 * 1024 * 1024  # インライン要求の上限（20MB）に余裕を持たせる
+MAX_BATCH_REQUESTS = 500
+SUCCEEDED = "BATCH_STATE_SUCCEEDED"
+TERMINAL_STATES = {SUCCEEDED, "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"}
+
+
+def request_entry(item: dict) -> dict:
+    """1件分の要求（key は結果の突き合わせに使う）"""
+    return {
+        "request": {"contents": [{"role": "user", "parts": [{"text": item["prompt"]}]}]},
+        "metadata": {"key": item["key"]},
+    }
+
+
+def pack_requests(items: List[dict], max_requests: int = MAX_BATCH_REQUESTS,
+                  max_bytes: int = MAX_INLINE_BYTES) -> List[dict]:
+    """
+    items（key / model / prompt を持つ dict）をモデルごとに分け、件数とサイズの上限で
+    {"model": ..., "items": [...]} のバッチに詰める（同じモデル内の順序は保つ）
+    1件で上限を超える要求は単独のバッチにする（API に拒否された場合は呼び出し側で通常の呼び出しに回す）
+    """
+    by_model: Dict[str, List[dict]] = {}
+    for item in items:
+        by_model.setdefault(item["model"], []).append(item)
+
+    batches = []
+    for model, group in by_model.items():
+        current, size = [], 0
+        for item in group:
+            item_bytes = len(json.dumps(request_entry(item), ensure_ascii=False).encode("utf-8"))
+            if current and (len(current) >= max_requests or size + item_bytes > max_bytes):
+                batches.append({"model": model, "items": current})
+                current, size = [], 0
+            current.append(item)
+            size += item_bytes
+        if current:
+            batches.append({"model": model, "items": current})
+    return batches
+
+
+def _body(batch: dict) -> dict:
+    # 取得した状態は操作（operation）の形で、バッチ本体は response（完了後）または metadata にある
+    return batch.get("response") or batch.get("metadata") or batch
+
+
+def batch_state(batch: dict) -> str:
+    return _body(batch).get("state") or (batch.get("metadata") or {}).get("state", "")
+
+
+def batch_model(batch: dict) -> str:
+    return _body(batch).get("model", "").removeprefix("models/")
+
+
+def _inlined(batch: dict) -> List[dict]:
+    return ((_body(batch).get("output") or {}).get("inlinedResponses") or {}).get("inlinedResponses", [])
+
+
+def result_keys(batch: dict) -> List[str]:
+    """完了したバッチの結果に含まれる要求のキー（中断後に結果だけを回収するときに使う）"""
+    return [k for k in ((entry.get("metadata") or {}).get("key") for entry in _inlined(batch)) if k]
+
+
+def reconcile(items: List[dict], batch: dict) -> Tuple[Dict[str, SimpleNamespace], Dict[str, str]]:
+    """
+    完了したバッチの結果を items の key に突き合わせ、(成功した応答, 失敗の理由) をそれぞれ key ごとに返す
+    結果に key がない場合は投入した順序で対応させる。結果のない要求は失敗として扱う
+    """
+    keys = [item["key"] for item in items]
+    responses, errors = {}, {}
+    for position, entry in enumerate(_inlined(batch)):
+        key = (entry.get("metadata") or {}).get("key")
+        if key is None and position < len(keys):
+            key = keys[position]
+        if key not in keys:
+            continue
+        if "error" in entry:
+            errors[key] = entry["error"].get("message") or json.dumps(entry["error"], ensure_ascii=False)
+        else:
+            responses[key] = parse_response(entry.get("response") or {})
+
+    state = batch_state(batch)
+    for key in keys:
+        if key not in responses and key not in errors:
+            errors[key] = f"バッチの結果がありません（{state or '状態不明'}）"
+    return responses, errors
+
+
+def manifest_path(directory: Path, name: str) -> Path:
+    """バッチ名（batches/xxxx）ごとの要求キー一覧のファイル"""
+    return Path(directory) / f"{name.replace('/', '_')}.json"
+
+
+def save_manifest(directory: Path, name: str, manifest: dict):
+    """投入したバッチの要求キー一覧を書き出す（途中で止まっても壊れたファイルを残さないよう置き換えで書く）"""
+    path = manifest_path(directory, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def load_manifest(directory: Path, name: str) -> Optional[dict]:
+    """save_manifest で書いた一覧（なければ None）"""
+    try:
+        return json.loads(manifest_path(directory, name).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+class BatchClient(GeminiRestClient):
+    """GeminiRestClient に batches の操作を加えたもの"""
+
+    def create_batch(self, model: str, items: List[dict], display_name: str = "") -> dict:
+        body = {"batch": {
+            "display_name": display_name[:128],
+            "input_config": {"requests": {"requests": [request_entry(item) for item in items]}},
+        }}
+        return self._request("POST", f"{self._model_path(model)}:batchGenerateContent", body)
+
+    def get_batch(self, name: str) -> dict:
+        return self._request("GET", name)
+
+    def cancel_batch(self, name: str):
+        self._request("POST", f"{name}:cancel", {})
+
+    def wait(self, names: List[str], interval: float = 60, timeout: Optional[float] = None,
+             on_poll: Optional[Callable[[str, str], None]] = None) -> Dict[str, dict]:
+        """
+        すべてのバッチが終了状態になるまで interval 秒ごとに確認し、バッチ名ごとの最終状態を返す
+        timeout を過ぎたら TimeoutError（バッチ自体は API 側で処理が続く）
+        """
+        deadline = time.time() + timeout if timeout else None
+        pending, finished = list(names), {}
+        while True:
+            for name in list(pending):
+                batch = self.get_batch(name)
+                state = batch_state(batch)
+                if on_poll:
+                    on_poll(name, state)
+                if state in TERMINAL_STATES:
+                    finished[name] = batch
+                    pending.remove(name)
+            if not pending:
+                return finished
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"バッチが完了しませんでした: {', '.join(pending)}")
+            time.sleep(interval)
@@ -0,0 +1,264 @@
+# utils/context_cache.py
+"""
+Gemini のコンテキストキャッシュ（cachedContents）の管理
+
+同じ動画の字幕を何度も送る処理（複数ジャンルの同時実行・要約のやり直し・後からの追加質問など）のために、
+字幕を動画・モデルごとに1回だけアップロードし、以降の呼び出しではキャッシュ名（cachedContents/...）を
+参照して、プロンプトには指示文だけを載せる。
+キャッシュはモデルごとに作られ、保存期間（TTL）の間は保存料金がかかるため、
+- 1回しか使われない字幕はキャッシュしない（同じ動画で2回目の要求が来たとき、または呼び出し側が
+  複数回使うと分かっているときに作る）
+- MIN_CACHE_TOKENS より小さい字幕はキャッシュしない（API の最小サイズ）
+- 手元の表（SQLite）でキャッシュ名と期限を管理し、件数が上限を超えたら最後に使った時刻が古いものから削除する
+REST API を urllib で直接呼ぶため、base_url を変えれば scripts/fake_gemini_server.py で動作を確認できる。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from utils.model_router import tier_of
+
+API_BASE = "https://generativelanguage.googleapis.com"
+API_VERSION = "v1beta"
+REQUEST_TIMEOUT = 300
+# キャッシュできる最小トークン数（モデルの種類ごと）
+MIN_CACHE_TOKENS = {"lite": 1024, "flash": 1024, "pro": 4096}
+REFRESH_MARGIN = 0.25  # 残り期間が TTL のこの割合を切ったら、使ったときに期限を延ばす
+EXPIRY_SAFETY_S = 30  # 期限ぎりぎりのキャッシュは使わない（リクエスト中に消えるのを避ける）
+
+
+class CacheApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+def parse_response(data: dict) -> SimpleNamespace:
+    """
+    generateContent の応答 JSON を、SDK の応答と同じ属性（text / usage_metadata）を持つオブジェクトにする
+    （utils/usage_ledger の gemini_usage などをそのまま使えるようにする）
+    """
+    parts = (data.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+    usage = data.get("usageMetadata", {})
+    return SimpleNamespace(
+        text="".join(p.get("text", "") for p in parts),
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount", 0),
+            candidates_token_count=usage.get("candidatesTokenCount", 0),
+            thoughts_token_count=usage.get("thoughtsTokenCount", 0),
+            cached_content_token_count=usage.get("cachedContentTokenCount", 0),
+        ),
+    )
+
+
+class GeminiRestClient:
+    """cachedContents と generateContent だけを扱う最小限の REST クライアント"""
+
+    def __init__(self, api_key: str, base_url: str = API_BASE, timeout: float = REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(f"{self.base_url}/{API_VERSION}/{path}", data=data, method=method)
+        req.add_header("x-goog-api-key", self.api_key)
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as res:
+                raw = res.read()
+        except urllib.error.HTTPError as e:
+            raise CacheApiError(e.code, e.read().decode("utf-8", "replace")[:300]) from e
+        return json.loads(raw) if raw else {}
+
+    @staticmethod
+    def _model_path(model: str) -> str:
+        return model if model.startswith("models/") else f"models/{model}"
+
+    def create_cache(self, model: str, text: str, ttl_s: int, display_name: str = "",
+                     system_instruction: Optional[str] = None) -> dict:
+        body = {
+            "model": self._model_path(model),
+            "displayName": display_name[:128],
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+            "ttl": f"{int(ttl_s)}s",
+        }
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return self._request("POST", "cachedContents", body)
+
+    def update_ttl(self, name: str, ttl_s: int) -> dict:
+        return self._request("PATCH", f"{name}?updateMask=ttl", {"ttl": f"{int(ttl_s)}s"})
+
+    def delete_cache(self, name: str):
+        self._request("DELETE", name)
+
+    def generate(self, model: str, prompt: str, cached_content: Optional[str] = None):
+        """generateContent を呼び、parse_response の形で返す"""
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if cached_content:
+            body["cachedContent"] = cached_content
+        return parse_response(self._request("POST", f"{self._model_path(model)}:generateContent", body))
+
+
+class ContextCache:
+    """キャッシュ名・期限・利用状況を SQLite で管理する"""
+
+    def __init__(self, client: GeminiRestClient, path: Path, ttl: int = 3600, max_entries: int = 50):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS caches (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                name TEXT,
+                tokens INTEGER NOT NULL,
+                expire_at REAL NOT NULL,
+                requests INTEGER NOT NULL,
+                hits INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        # 同じ字幕を並列のジャンルから同時に要求されても、アップロードは1回だけにする
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def cache_key(video_id: str, model: str, text: str) -> str:
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        return f"{video_id}:{model}:{digest}"
+
+    def get_or_create(self, video_id: str, model: str, text: str, est_tokens: int,
+                      expected_uses: int = 1, display_name: str = "") -> Optional[str]:
+        """
+        使えるキャッシュ名を返す。まだなければ、2回目の要求（または expected_uses >= 2）のときだけ作る
+        キャッシュを使わない（作れない）場合は None
+        """
+        tier = tier_of(model)
+        if tier is None or est_tokens < MIN_CACHE_TOKENS[tier]:
+            return None
+        key = self.cache_key(video_id, model, text)
+        now = time.time()
+        with self._lock_for(key):
+            conn = self._conn()
+            row = conn.execute("SELECT name, expire_at, requests FROM caches WHERE key = ?", (key,)).fetchone()
+            if row and row[0] and row[1] - EXPIRY_SAFETY_S > now:
+                name, expire_at = row[0], row[1]
+                if expire_at - now < self.ttl * REFRESH_MARGIN:
+                    expire_at = self._refresh(name, now) or expire_at
+                with conn:
+                    conn.execute("UPDATE caches SET hits = hits + 1, requests = requests + 1, last_used = ?, "
+                                 "expire_at = ? WHERE key = ?", (now, expire_at, key))
+                return name
+
+            requests = (row[2] if row else 0) + 1
+            if requests < 2 and expected_uses < 2:
+                # 1回目は記録だけ（同じ動画がもう一度使われたらキャッシュする）
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO caches (key, video_id, model, name, tokens, expire_at, requests, hits, "
+                        "last_used) VALUES (?, ?, ?, NULL, ?, 0, ?, 0, ?)",
+                        (key, video_id, model, est_tokens, requests, now),
+                    )
+                return None
+
+            self._evict(keep=self.max_entries - 1)
+            try:
+                created = self.client.create_cache(model, text, self.ttl, display_name or video_id)
+            except Exception as e:
+                print(f"⚠️ コンテキストキャッシュ作成失敗 ({video_id}, {model}): {e}")
+                return None
+            name = created["name"]
+            tokens = created.get("usageMetadata", {}).get("totalTokenCount", est_tokens)
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO caches (key, video_id, model, name, tokens, expire_at, requests, hits, "
+                    "last_used) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                    (key, video_id, model, name, tokens, now + self.ttl, requests, now),
+                )
+            print(f"🗃️ コンテキストキャッシュ作成: {name} ({video_id}, {model}, {tokens}トークン, TTL {self.ttl}秒)")
+            return name
+
+    def _refresh(self, name: str, now: float) -> Optional[float]:
+        """よく使われているキャッシュの期限を延ばす（失敗したら None）"""
+        try:
+            self.client.update_ttl(name, self.ttl)
+            return now + self.ttl
+        except Exception as e:
+            print(f"⚠️ コンテキストキャッシュの期限延長失敗 ({name}): {e}")
+            return None
+
+    def _evict(self, keep: int):
+        """期限切れの行を消し、有効なキャッシュが keep 件を超える分は最後に使った時刻が古いものから削除する"""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("DELETE FROM caches WHERE name IS NOT NULL AND expire_at <= ?", (now,))
+            # キャッシュを作っていない記録（1回目の要求）は期限の代わりに TTL 経過で消す
+            conn.execute("DELETE FROM caches WHERE name IS NULL AND last_used <= ?", (now - self.ttl,))
+        victims = conn.execute(
+            "SELECT key, name FROM caches WHERE name IS NOT NULL ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+            (max(keep, 0),),
+        ).fetchall()
+        for key, name in victims:
+            self._delete_remote(name)
+            with conn:
+                conn.execute("DELETE FROM caches WHERE key = ?", (key,))
+            print(f"🧹 コンテキストキャッシュ削除（上限超過）: {name}")
+
+    def _delete_remote(self, name: str):
+        try:
+            self.client.delete_cache(name)
+        except CacheApiError as e:
+            if e.status != 404:  # 期限切れで消えている場合は無視
+                print(f"⚠️ コンテキストキャッシュ削除失敗 ({name}): {e}")
+        except Exception as e:
+            print(f"⚠️ コンテキストキャッシュ削除失敗 ({name}): {e}")
+
+    def invalidate(self, name: str):
+        """使えなかったキャッシュ（サーバー側で消えていた等）を手元の表から外す"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM caches WHERE name = ?", (name,))
+
+    def clear(self):
+        """手元で管理しているキャッシュをすべて削除する"""
+        for (name,) in self._conn().execute("SELECT name FROM caches WHERE name IS NOT NULL").fetchall():
+            self._delete_remote(name)
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM caches")
+
+    def stats(self) -> dict:
+        now = time.time()
+        active, tokens, hits = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(SUM(hits), 0) FROM caches "
+            "WHERE name IS NOT NULL AND expire_at > ?", (now,)
+        ).fetchone()
+        return {"active": active, "cached_tokens": tokens, "hits": hits, "max_entries": self.max_entries, "ttl": self.ttl}
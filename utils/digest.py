@@ -0,0 +1,156 @@
+# utils/digest.py
+"""
+複数動画の要約を1本にまとめるマーケットダイジェスト（字幕ではなく保存済みの要約から作る）
+
+期間内の要約を短く切り詰め（全体の要約・要点・投資判断のポイントだけを残す）、
+共通の銘柄（utils/entity_index の言及）か、要約の文字 bigram の類似度でグループに分けてから、
+1回の Gemini 呼び出しで統合する。動画は [V番号] で参照させ、出力後に動画へのリンクに置き換える。
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from utils.search_index import to_bigrams
+
+KEEP_SECTIONS = ("①", "②", "⑥")  # stock_analyst の「全体の要約」「要点リスト」「投資判断のための重要ポイント」
+MAX_SUMMARY_CHARS = 1200  # 1動画あたりの要約の上限（文字）
+PRIMARY_TICKERS = 3  # 動画の主な銘柄とみなす数（言及の多い順）
+THEME_SIMILARITY = 0.35  # 銘柄を共有しない動画を同じテーマとみなす要約の類似度（Jaccard）
+
+_SECTION_RE = re.compile(r"^\s*(?:#+\s*)?(?:\*\*)?\s*([①-⑳])", re.M)
+_APPENDIX_RE = re.compile(r"^##\s*📑.*", re.M | re.S)  # finish_summary が付けるチャプターの一覧
+_TIME_LINK_RE = re.compile(r"\s*\[\d+:\d{2}(?::\d{2})?\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_VIDEO_REF_RE = re.compile(r"\[V(\d+)\](?!\()")
+
+
+def compact_summary(summary_md: str, keep: Sequence[str] = KEEP_SECTIONS, max_chars: int = MAX_SUMMARY_CHARS) -> str:
+    """
+    要約から keep の番号の節だけを残し（番号付きの節がなければ先頭から）、リンク・時刻を除いて max_chars に収める
+    """
+    text = _APPENDIX_RE.sub("", summary_md)
+    text = _LINK_RE.sub(r"\1", _TIME_LINK_RE.sub("", text))
+    marks = list(_SECTION_RE.finditer(text))
+    if marks:
+        parts = [text[m.start():marks[i + 1].start() if i + 1 < len(marks) else len(text)]
+                 for i, m in enumerate(marks) if m.group(1) in keep]
+        text = "\n".join(parts) or text
+    lines = [line.rstrip() for line in text.splitlines() if line.strip()]
+    result, size = [], 0
+    for line in lines:
+        if size + len(line) > max_chars:
+            result.append("…")
+            break
+        result.append(line)
+        size += len(line) + 1
+    return "\n".join(result)
+
+
+def _theme_grams(text: str) -> set:
+    return set(to_bigrams(text).split())
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def cluster_videos(videos: List[dict], tickers: Dict[str, List[dict]],
+                   threshold: float = THEME_SIMILARITY) -> List[dict]:
+    """
+    videos（video_id と compact を持つ）を、主な銘柄を共有するか要約が似ている動画どうしでまとめる（Union-Find）
+    グループは動画数の多い順。各グループは label（共通銘柄、なければテーマ）・codes・videos を持つ
+    """
+    parent = list(range(len(videos)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int):
+        parent[find(i)] = find(j)
+
+    owner = {}
+    for i, v in enumerate(videos):
+        for t in tickers.get(v["video_id"], [])[:PRIMARY_TICKERS]:
+            if t["code"] in owner:
+                union(i, owner[t["code"]])
+            else:
+                owner[t["code"]] = i
+    grams = [_theme_grams(v["compact"]) for v in videos]
+    for i in range(len(videos)):
+        for j in range(i + 1, len(videos)):
+            if find(i) != find(j) and _jaccard(grams[i], grams[j]) >= threshold:
+                union(i, j)
+
+    groups = {}
+    for i in range(len(videos)):
+        groups.setdefault(find(i), []).append(videos[i])
+    clusters = []
+    for members in groups.values():
+        counts, names = Counter(), {}
+        for v in members:
+            for t in tickers.get(v["video_id"], [])[:PRIMARY_TICKERS]:
+                counts[t["code"]] += 1
+                names[t["code"]] = t["name"]
+        codes = [code for code, _ in counts.most_common(3)]
+        label = "・".join(f"{names[c]}({c})" for c in codes) if codes else "銘柄を特定しない話題"
+        clusters.append({"label": label, "codes": codes, "videos": members})
+    clusters.sort(key=lambda c: (-len(c["videos"]), c["label"]))
+    return clusters
+
+
+def build_digest_prompt(clusters: List[dict], period: str, tickers: Dict[str, List[dict]]) -> str:
+    """グループごとに [V番号] 付きの要約を並べた、統合用のプロンプト（番号は clusters の順に振る）"""
+    total = sum(len(c["videos"]) for c in clusters)
+    sections, n = [], 0
+    for k, cluster in enumerate(clusters, 1):
+        rows = [f"### グループ{k}: {cluster['label']}（{len(cluster['videos'])}本）"]
+        for v in cluster["videos"]:
+            n += 1
+            v["ref"] = n
+            mentioned = "、".join(f"{t['name']}({t['code']})" for t in tickers.get(v["video_id"], [])[:5])
+            rows.append(f"[V{n}] {v['title']}（{v['date']}）" + (f"\n言及銘柄: {mentioned}" if mentioned else ""))
+            rows.append(v["compact"])
+        sections.append("\n\n".join(rows))
+    body = "\n\n".join(sections)
+    return f"""あなたはプロの株式アナリスト兼マーケットエディターです。
+以下は {period} に要約した株式系YouTube動画 {total} 本の要約です（共通の銘柄・テーマごとにグループ分けしてあります）。
+これらを統合して、1本で読めるマーケットダイジェストを日本語の Markdown で作成してください。
+
+# 出力フォーマット
+## 全体の相場観
+- 複数の動画に共通する見方と、意見が分かれている点（強気/弱気の比率も）
+## 銘柄・テーマ別
+- グループごとに見出しを立て、各動画の主張・根拠・数値・前提を統合する（同じ主張は1つにまとめる）
+- 動画間で見解が食い違う場合は、その違いを明示する
+## 注目イベント・日程
+## 共通して挙げられたリスク
+## 動画一覧
+- 1動画1行で、[V番号] とその動画の一言要約
+
+# 条件
+- 根拠とした動画を文末に [V番号] で示す（例: [V3][V7]）
+- 要約にない情報・数値を足さない
+- 個別銘柄の「買い/売り」は断定せず、「動画の論調としては強気/弱気寄り」と表現する
+
+# 入力（動画ごとの要約）
+{body}
+"""
+
+
+def link_video_refs(digest_md: str, videos: List[dict]) -> str:
+    """[V番号] を動画へのリンクに置き換える"""
+    by_ref = {v["ref"]: v for v in videos if "ref" in v}
+
+    def _replace(m: re.Match) -> str:
+        video = by_ref.get(int(m.group(1)))
+        return f"[V{m.group(1)}]({video['url']})" if video else m.group(0)
+
+    return _VIDEO_REF_RE.sub(_replace, digest_md)
+
+
+def digest_period(since: str, until: Optional[str]) -> str:
+    return since if until in (None, since) else f"{since}〜{until}"
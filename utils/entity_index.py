@@ -0,0 +1,405 @@
+# utils/entity_index.py
+"""
+字幕からの銘柄・企業名の抽出（辞書 + Aho-Corasick）と、言及箇所のインデックス（SQLite）
+
+東証の銘柄コード・米国ティッカー・企業名（別名を含む）の辞書から Aho-Corasick オートマトンを作り、
+整形済み字幕を1回走査して言及を拾う（字幕の長さに比例する時間）。重なる一致は最も左で最も長いものを残す。
+言及は行・開始時刻付きで保存し、「今月 7203 に触れた動画」のような動画をまたいだ検索に使う。
+誤検出を減らすため
+- 英数字で始まる（終わる）パターンは、前（後ろ）が英数字でないときだけ一致とする
+- 数字だけのコードは、前後が数値の続き（1,7203 / 7203円 / 7203年 など）なら数値とみなして捨てる
+- ティッカーは大文字で書かれたときだけ、MIN_TICKER_LEN 文字以上で TICKER_STOPWORDS（AI / EPS など）以外のものだけ拾う
+  （社名は大文字小文字を区別しない）
+辞書は BUILTIN_ENTITIES（主要銘柄）に、scripts/build_ticker_dict.py で作った CSV を重ねて使う。
+"""
+
+import csv
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from utils.live import format_offset
+from utils.transcript import Transcript
+
+TSE, US = "TSE", "US"
+MARKET_LABELS = {TSE: "東証", US: "米国"}
+MIN_TICKER_LEN = 3
+# ティッカーと同じ綴りの、相場の話でよく使う略語（ティッカーとしては拾わない）
+TICKER_STOPWORDS = frozenset({
+    "AI", "API", "CEO", "CFO", "CPI", "DX", "EPS", "ESG", "ETF", "EV", "FED", "FRB", "FX", "GDP", "IPO", "IT",
+    "JPY", "NISA", "PBR", "PCE", "PER", "PMI", "ROA", "ROE", "USA", "USD",
+})
+PROMPT_LIMIT = 30  # プロンプトに載せる銘柄数（言及の多い順）
+
+# (コード, 市場, 正式名, 別名)
+BUILTIN_ENTITIES = (
+    ("7203", TSE, "トヨタ自動車", ("トヨタ",)),
+    ("6758", TSE, "ソニーグループ", ("ソニー",)),
+    ("9984", TSE, "ソフトバンクグループ", ("ソフトバンクG", "SBG")),
+    ("9434", TSE, "ソフトバンク", ()),
+    ("9432", TSE, "日本電信電話", ("NTT",)),
+    ("9433", TSE, "KDDI", ()),
+    ("8306", TSE, "三菱UFJフィナンシャル・グループ", ("三菱UFJ", "MUFG")),
+    ("8316", TSE, "三井住友フィナンシャルグループ", ("三井住友FG", "SMFG")),
+    ("8411", TSE, "みずほフィナンシャルグループ", ("みずほFG", "みずほ")),
+    ("6861", TSE, "キーエンス", ()),
+    ("8035", TSE, "東京エレクトロン", ("東エレク",)),
+    ("6857", TSE, "アドバンテスト", ()),
+    ("6920", TSE, "レーザーテック", ()),
+    ("285A", TSE, "キオクシアホールディングス", ("キオクシア",)),
+    ("9983", TSE, "ファーストリテイリング", ("ファストリ", "ユニクロ")),
+    ("6098", TSE, "リクルートホールディングス", ("リクルート",)),
+    ("7974", TSE, "任天堂", ()),
+    ("4063", TSE, "信越化学工業", ("信越化学",)),
+    ("6501", TSE, "日立製作所", ("日立",)),
+    ("7267", TSE, "本田技研工業", ("ホンダ",)),
+    ("7011", TSE, "三菱重工業", ("三菱重工",)),
+    ("8058", TSE, "三菱商事", ()),
+    ("8001", TSE, "伊藤忠商事", ("伊藤忠",)),
+    ("8031", TSE, "三井物産", ()),
+    ("8766", TSE, "東京海上ホールディングス", ("東京海上",)),
+    ("4502", TSE, "武田薬品工業", ("武田薬品",)),
+    ("4568", TSE, "第一三共", ()),
+    ("6367", TSE, "ダイキン工業", ("ダイキン",)),
+    ("6594", TSE, "ニデック", ("日本電産",)),
+    ("7741", TSE, "HOYA", ()),
+    ("2914", TSE, "日本たばこ産業", ("JT",)),
+    ("5401", TSE, "日本製鉄", ()),
+    ("9101", TSE, "日本郵船", ()),
+    ("AAPL", US, "Apple", ("アップル",)),
+    ("MSFT", US, "Microsoft", ("マイクロソフト",)),
+    ("NVDA", US, "NVIDIA", ("エヌビディア", "エヌビデア")),
+    ("GOOGL", US, "Alphabet", ("Google", "グーグル")),
+    ("AMZN", US, "Amazon", ("アマゾン",)),
+    ("META", US, "Meta Platforms", ("メタ・プラットフォームズ", "Facebook", "フェイスブック")),
+    ("TSLA", US, "Tesla", ("テスラ",)),
+    ("AVGO", US, "Broadcom", ("ブロードコム",)),
+    ("TSM", US, "TSMC", ()),
+    ("AMD", US, "Advanced Micro Devices", ()),
+    ("INTC", US, "Intel", ("インテル",)),
+    ("NFLX", US, "Netflix", ("ネットフリックス",)),
+    ("PLTR", US, "Palantir", ("パランティア",)),
+    ("ASML", US, "ASML", ()),
+    ("ARM", US, "Arm Holdings", ("アーム・ホールディングス",)),
+    ("BRK.B", US, "Berkshire Hathaway", ("バークシャー",)),
+    ("JPM", US, "JPMorgan Chase", ("JPモルガン",)),
+)
+
+CODE, NAME = "code", "name"
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_ALNUM = frozenset("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+# 数字だけのコードの直後に来たら数値（年・金額・割合など）とみなす文字
+_NUMBER_SUFFIX = frozenset("年月日円万億兆%％人件回倍株台時分秒歳個点代名社ド.,．，")
+_NUMBER_PREFIX = frozenset("¥￥$＄#＃.,．，")
+
+
+class AhoCorasick:
+    """複数パターンの同時検索（パターンの総文字数 + テキスト長 + 一致数 に比例する時間）"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        goto, out = [{}], [[]]
+        for word, value in patterns:
+            node = 0
+            for ch in word:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                node = nxt
+            if word:
+                out[node].append((len(word), value))
+
+        # 幅優先で失敗遷移を張り、失敗先の出力を引き継ぐ
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+        self._alphabet = frozenset(goto[0]).union(*goto[1:]) if len(goto) > 1 else frozenset()
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """(開始, 終了, 値) をパターンの終了位置の順に返す"""
+        goto, fail, out, alphabet = self._goto, self._fail, self._out, self._alphabet
+        node = 0
+        for i, ch in enumerate(text):
+            if ch not in alphabet:
+                node = 0
+                continue
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, value in out[node]:
+                yield i + 1 - length, i + 1, value
+
+
+def load_dictionary(paths: Iterable[Path]) -> List[tuple]:
+    """
+    scripts/build_ticker_dict.py 形式の CSV（code,market,name,aliases）を読む
+    aliases は | 区切り。存在しないファイルは警告して飛ばす
+    """
+    entities = []
+    for path in paths:
+        path = Path(path).expanduser()
+        if not path.exists():
+            print(f"⚠️ 銘柄辞書が見つかりません: {path}")
+            continue
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                code, name = (row.get("code") or "").strip(), (row.get("name") or "").strip()
+                if code and name:
+                    aliases = tuple(a.strip() for a in (row.get("aliases") or "").split("|") if a.strip())
+                    entities.append((code, (row.get("market") or TSE).strip(), name, aliases))
+    return entities
+
+
+def quote_symbol(code: str, market: str) -> str:
+    """Yahoo!ファイナンスの銘柄シンボル（東証は 7203.T）"""
+    return f"{code}.T" if market == TSE else code
+
+
+class EntityExtractor:
+    def __init__(self, entities: Iterable[tuple] = BUILTIN_ENTITIES, min_ticker_len: int = MIN_TICKER_LEN):
+        """entities は (コード, 市場, 正式名, 別名) の並び。同じコードは後のもので名前を上書きし、別名は足し合わせる"""
+        self.entities = {}
+        for code, market, name, aliases in entities:
+            known = self.entities.get(code)
+            merged = tuple(dict.fromkeys((*(known["aliases"] if known else ()), *aliases)))
+            self.entities[code] = {"code": code, "market": market, "name": name, "aliases": merged}
+
+        patterns, seen = [], set()
+        for code, entity in self.entities.items():
+            # 東証のコードは数字（新コードは英字入り）、米国はティッカー（大文字の一致のみ）
+            if entity["market"] == TSE or (len(code) >= min_ticker_len and code not in TICKER_STOPWORDS):
+                patterns.append((code, CODE, code))
+            for word in (entity["name"], *entity["aliases"]):
+                if len(word) >= 2:
+                    patterns.append((word, NAME, code))
+        entries = []
+        for word, kind, code in patterns:
+            folded = word.translate(_ASCII_LOWER)
+            if folded not in seen:  # 同じ表記は先に登録した銘柄を優先
+                seen.add(folded)
+                entries.append((folded, (kind, code, word)))
+        self._matcher = AhoCorasick(entries)
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    @staticmethod
+    def _accept(text: str, start: int, end: int, kind: str, word: str) -> bool:
+        if kind == CODE and text[start:end] != word:
+            return False
+        before = text[start - 1] if start > 0 else ""
+        after = text[end] if end < len(text) else ""
+        if word[0] in _ALNUM and before in _ALNUM:
+            return False
+        if word[-1] in _ALNUM and after in _ALNUM:
+            return False
+        if kind == CODE and word.isdigit() and (after in _NUMBER_SUFFIX or before in _NUMBER_PREFIX):
+            return False
+        return True
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """(開始, 終了, コード) を出現順に返す"""
+        hits = [(start, end, value) for start, end, value in self._matcher.finditer(text.translate(_ASCII_LOWER))
+                if self._accept(text, start, end, value[0], value[2])]
+        hits.sort(key=lambda h: (h[0], h[0] - h[1]))
+        result, covered = [], 0
+        for start, end, (_kind, code, _word) in hits:
+            if start >= covered:
+                result.append((start, end, code))
+                covered = end
+        return result
+
+    def resolve(self, query: str) -> Optional[str]:
+        """検索語（コード・社名・別名・それを含む文）を銘柄コードにする"""
+        query = query.strip()
+        for code in self.entities:
+            if code.lower() == query.lower():
+                return code
+        found = self.find(query)
+        return found[0][2] if found else None
+
+    def mentions(self, transcript: Transcript) -> List[dict]:
+        """字幕中の言及（行番号・開始時刻付き）"""
+        text = transcript.text
+        offsets, pos = [], 0
+        for line in transcript.lines:
+            offsets.append(pos)
+            pos += len(line) + 1
+        timed = transcript.has_timestamps
+        result = []
+        for start, end, code in self.find(text):
+            line = bisect_right(offsets, start) - 1
+            entity = self.entities[code]
+            result.append({
+                "code": code,
+                "market": entity["market"],
+                "name": entity["name"],
+                "surface": text[start:end],
+                "line": line,
+                "start_ms": transcript.starts[line] if timed else None,
+            })
+        return result
+
+
+def summarize_mentions(mentions: List[dict]) -> List[dict]:
+    """銘柄ごとの言及回数・初出位置・表記（言及の多い順、同数なら初出順）"""
+    by_code = {}
+    for m in mentions:
+        entry = by_code.get(m["code"])
+        if entry is None:
+            entry = by_code[m["code"]] = {"code": m["code"], "market": m["market"], "name": m["name"], "count": 0,
+                                          "first_line": m["line"], "first_ms": m["start_ms"], "surfaces": []}
+        entry["count"] += 1
+        if m["surface"] not in entry["surfaces"]:
+            entry["surfaces"].append(m["surface"])
+    return sorted(by_code.values(), key=lambda e: (-e["count"], e["first_line"]))
+
+
+def entity_prompt_block(entities: List[dict], limit: int = PROMPT_LIMIT) -> str:
+    """プロンプトの末尾に付ける、辞書照合で見つけた銘柄の一覧"""
+    if not entities:
+        return ""
+    rows = []
+    for e in entities[:limit]:
+        where = f", 初出 [t={format_offset(e['first_ms'] / 1000)}]" if e["first_ms"] is not None else ""
+        market = MARKET_LABELS.get(e["market"], e["market"])
+        rows.append(f"- {e['name']}（{quote_symbol(e['code'], e['market'])} / {market}）: {e['count']}回{where}")
+    return ("\n\n【事前抽出した銘柄候補】\n"
+            "字幕を銘柄辞書と照合して見つけた銘柄です（コード・言及回数・初出位置）。銘柄の特定と銘柄リンク生成には"
+            "この一覧のコードを使い、文脈上その銘柄を指していないもの（同じ語の別の意味など）は除いてください。"
+            "一覧にない銘柄が字幕に出てくる場合は追加して構いません。\n" + "\n".join(rows))
+
+
+class EntityIndex:
+    """動画ごとの銘柄の言及（行・開始時刻）を保存し、銘柄から動画を引く"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                date TEXT NOT NULL,
+                indexed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS mentions (
+                video_id TEXT NOT NULL,
+                code TEXT NOT NULL,
+                market TEXT NOT NULL,
+                name TEXT NOT NULL,
+                surface TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                start_ms INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS mentions_code ON mentions (code, video_id);
+            CREATE INDEX IF NOT EXISTS mentions_video ON mentions (video_id);
+            CREATE INDEX IF NOT EXISTS videos_date ON videos (date);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, video_id: str, title: str, url: str, mentions: List[dict], date: Optional[str] = None):
+        """1動画分の言及を登録する（同じ動画は置き換え）。date は YYYY-MM-DD（公開日。不明なら処理日）"""
+        date = date or time.strftime("%Y-%m-%d")
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM mentions WHERE video_id = ?", (video_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO videos (video_id, title, url, date, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (video_id, title, url, date, time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO mentions (video_id, code, market, name, surface, line, start_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(video_id, m["code"], m["market"], m["name"], m["surface"], m["line"], m["start_ms"])
+                 for m in mentions],
+            )
+
+    @staticmethod
+    def _period(since: Optional[str], until: Optional[str]) -> Tuple[str, list]:
+        where, params = [], []
+        if since:
+            where.append("v.date >= ?")
+            params.append(since)
+        if until:
+            where.append("v.date <= ?")
+            params.append(until)
+        return "".join(f" AND {w}" for w in where), params
+
+    def videos(self, code: str, since: Optional[str] = None, until: Optional[str] = None, limit: int = 50,
+               max_positions: int = 5) -> List[dict]:
+        """その銘柄に言及した動画（新しい順）と、動画内の言及回数・最初の数か所の開始時刻（ミリ秒）"""
+        period, params = self._period(since, until)
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT v.video_id, v.title, v.url, v.date, COUNT(*) "
+            "FROM mentions m JOIN videos v ON v.video_id = m.video_id "
+            f"WHERE m.code = ?{period} GROUP BY v.video_id ORDER BY v.date DESC, v.indexed_at DESC LIMIT ?",
+            [code, *params, limit],
+        ).fetchall()
+        results = []
+        for video_id, title, url, date, count in rows:
+            positions = [r[0] for r in conn.execute(
+                "SELECT start_ms FROM mentions WHERE video_id = ? AND code = ? AND start_ms IS NOT NULL "
+                "ORDER BY line LIMIT ?", (video_id, code, max_positions))]
+            results.append({"video_id": video_id, "title": title, "url": url, "date": date, "count": count,
+                            "positions_ms": positions})
+        return results
+
+    def tickers_for(self, video_ids: List[str]) -> Dict[str, List[dict]]:
+        """動画ごとの言及銘柄（言及の多い順）"""
+        result = {}
+        if not video_ids:
+            return result
+        marks = ",".join("?" * len(video_ids))
+        rows = self._conn().execute(
+            f"SELECT video_id, code, market, MAX(name), COUNT(*) FROM mentions WHERE video_id IN ({marks}) "
+            "GROUP BY video_id, code ORDER BY video_id, COUNT(*) DESC, MIN(line)",
+            list(video_ids),
+        ).fetchall()
+        for video_id, code, market, name, count in rows:
+            result.setdefault(video_id, []).append({"code": code, "market": market, "name": name, "count": count})
+        return result
+
+    def top(self, since: Optional[str] = None, until: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """期間内に言及の多かった銘柄（言及した動画数・言及回数）"""
+        period, params = self._period(since, until)
+        rows = self._conn().execute(
+            "SELECT m.code, m.market, MAX(m.name), COUNT(DISTINCT m.video_id), COUNT(*) "
+            f"FROM mentions m JOIN videos v ON v.video_id = m.video_id WHERE 1 = 1{period} "
+            "GROUP BY m.code ORDER BY COUNT(DISTINCT m.video_id) DESC, COUNT(*) DESC LIMIT ?",
+            [*params, limit],
+        ).fetchall()
+        return [{"code": code, "market": market, "name": name, "videos": videos, "mentions": mentions}
+                for code, market, name, videos, mentions in rows]
+
+
+def default_extractor(dict_paths: Sequence[Path] = ()) -> EntityExtractor:
+    """組み込みの主要銘柄に、辞書ファイルの銘柄を重ねた抽出器"""
+    return EntityExtractor((*BUILTIN_ENTITIES, *load_dictionary(dict_paths)))
@@ -0,0 +1,228 @@
+# utils/feed_watch.py
+"""
+YouTube チャンネルの RSS（Atom）フィードを監視し、新着動画を要約キューに登録する
+
+- ETag / Last-Modified を保存し、条件付きリクエスト（If-None-Match / If-Modified-Since）で取得する
+  （更新がなければ 304 が返り、本文の転送・解析は行わない）
+- チャンネルごとの既読動画は、動画IDの 8byte ハッシュを直近 SEEN_LIMIT 件だけ保持する
+  （フィードは最新15件しか載らないため、それより古い既読情報は不要）
+- 初回はフィードに載っている既存動画を既読にするだけで、キューには登録しない（--backfill で登録）
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.admission import BULK
+from utils.backend import SUMMARY_QUEUE
+
+FEED_BASE = "https://www.youtube.com/feeds/videos.xml"
+SEEN_LIMIT = 64
+REQUEST_TIMEOUT = 15
+_NS = {
+    "atom": "http://www.w3.org/2005/Atom",
+    "yt": "http://www.youtube.com/xml/schemas/2015",
+}
+
+
+def channels_from_prompts(prompts: dict) -> Dict[str, str]:
+    """prompts.json の各ジャンルの "channels" から {チャンネルID: 既定ジャンル} を作る"""
+    channels = {}
+    for genre, data in prompts.items():
+        for channel_id in data.get("channels", []):
+            channels.setdefault(channel_id, genre)
+    return channels
+
+
+def parse_feed(body: bytes) -> List[dict]:
+    """Atom フィードから動画の一覧（新しい順）を取り出す"""
+    root = ET.fromstring(body)
+    videos = []
+    for entry in root.findall("atom:entry", _NS):
+        video_id = entry.findtext("yt:videoId", default="", namespaces=_NS)
+        if not video_id:
+            continue
+        link = entry.find("atom:link", _NS)
+        videos.append({
+            "video_id": video_id,
+            "title": entry.findtext("atom:title", default="", namespaces=_NS),
+            "published": entry.findtext("atom:published", default="", namespaces=_NS),
+            "url": link.get("href") if link is not None else f"https://www.youtube.com/watch?v={video_id}",
+        })
+    return videos
+
+
+def video_hash(video_id: str) -> bytes:
+    return hashlib.blake2b(video_id.encode("ascii"), digest_size=8).digest()
+
+
+class SeenSet:
+    """直近 limit 件の動画IDハッシュを古い順に連結したバイト列として保持する"""
+
+    def __init__(self, packed: bytes = b"", limit: int = SEEN_LIMIT):
+        self.limit = limit
+        self._items = [packed[i:i + 8] for i in range(0, len(packed), 8)]
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_hash(video_id) in self._items
+
+    def add(self, video_id: str):
+        h = video_hash(video_id)
+        if h not in self._items:
+            self._items.append(h)
+            del self._items[:-self.limit]
+
+    def pack(self) -> bytes:
+        return b"".join(self._items)
+
+
+class FeedStateStore:
+    """チャンネルごとの ETag / Last-Modified / 既読セットを SQLite に保存する"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS channels (
+                channel_id TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                seen BLOB NOT NULL,
+                checked_at REAL NOT NULL,
+                last_status INTEGER
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, channel_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT etag, last_modified, seen FROM channels WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "seen": SeenSet(row[2])}
+
+    def save(self, channel_id: str, etag: Optional[str], last_modified: Optional[str], seen: SeenSet, status: int):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO channels (channel_id, etag, last_modified, seen, checked_at, last_status) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (channel_id, etag, last_modified, seen.pack(), time.time(), status),
+            )
+
+
+class FeedWatcher:
+    def __init__(self, backend, store: FeedStateStore, channels: Dict[str, str], feed_base: str = FEED_BASE,
+                 concurrency: int = 8, max_queue_depth: int = 500, backfill: bool = False):
+        self.backend = backend
+        self.store = store
+        self.channels = channels
+        self.feed_base = feed_base
+        self.concurrency = concurrency
+        self.max_queue_depth = max_queue_depth
+        self.backfill = backfill
+        self._enqueue_lock = threading.Lock()
+
+    def _fetch(self, channel_id: str, state: Optional[dict]):
+        """条件付きGET。(ステータス, 本文, ETag, Last-Modified) を返す"""
+        req = urllib.request.Request(f"{self.feed_base}?channel_id={channel_id}")
+        if state and state["etag"]:
+            req.add_header("If-None-Match", state["etag"])
+        if state and state["last_modified"]:
+            req.add_header("If-Modified-Since", state["last_modified"])
+        try:
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as res:
+                return res.status, res.read(), res.headers.get("ETag"), res.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, b"", state["etag"] if state else None, state["last_modified"] if state else None
+            raise
+
+    def _enqueue(self, video: dict, genre: str) -> bool:
+        """キューに登録する（キューが満杯なら登録せず False。既読にしないので次回再試行される）"""
+        with self._enqueue_lock:
+            if self.backend.queue_length(SUMMARY_QUEUE) >= self.max_queue_depth:
+                return False
+            # 新着の自動登録はバックフィル扱い（画面からのリクエストを優先させる）
+            self.backend.enqueue(SUMMARY_QUEUE, {"url": video["url"], "genre": genre, "lane": BULK, "source": "watcher"})
+            return True
+
+    def poll_channel(self, channel_id: str) -> dict:
+        """1チャンネルを確認し、結果（ステータス・新着件数）を返す"""
+        genre = self.channels[channel_id]
+        state = self.store.load(channel_id)
+        try:
+            status, body, etag, last_modified = self._fetch(channel_id, state)
+        except Exception as e:
+            print(f"⚠️ フィード取得失敗 ({channel_id}): {e}")
+            return {"channel_id": channel_id, "status": "error", "new": 0}
+        if status == 304:
+            return {"channel_id": channel_id, "status": 304, "new": 0}
+
+        try:
+            videos = parse_feed(body)
+        except ET.ParseError as e:
+            print(f"⚠️ フィード解析失敗 ({channel_id}): {e}")
+            return {"channel_id": channel_id, "status": "error", "new": 0}
+
+        first_time = state is None
+        seen = SeenSet() if first_time else state["seen"]
+        new = 0
+        deferred = False
+        # 古い順に処理して、既読セットの並びを公開順に保つ
+        for video in reversed(videos):
+            if video["video_id"] in seen:
+                continue
+            if first_time and not self.backfill:
+                seen.add(video["video_id"])
+                continue
+            if not self._enqueue(video, genre):
+                deferred = True
+                break
+            seen.add(video["video_id"])
+            new += 1
+            print(f"🆕 新着動画を登録: {video['title']} ({channel_id}, genre={genre})")
+        # キュー満杯で登録を見送った場合は検証子を保存せず、次回も本文を取得する
+        if deferred:
+            etag = last_modified = None
+            print(f"🚦 キューが満杯のため {channel_id} の残りの新着は次回に登録します")
+        self.store.save(channel_id, etag, last_modified, seen, status)
+        return {"channel_id": channel_id, "status": status, "new": new}
+
+    def run_once(self) -> dict:
+        """全チャンネルを最大 concurrency 並列で1巡確認する"""
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self.poll_channel, self.channels))
+        summary = {
+            "channels": len(results),
+            "not_modified": sum(1 for r in results if r["status"] == 304),
+            "errors": sum(1 for r in results if r["status"] == "error"),
+            "new_videos": sum(r["new"] for r in results),
+            "elapsed_s": round(time.time() - started, 2),
+        }
+        print(f"📡 巡回完了: {summary['channels']}件 (304: {summary['not_modified']}, "
+              f"エラー: {summary['errors']}, 新着: {summary['new_videos']}) {summary['elapsed_s']}秒")
+        return summary
+
+    def run_forever(self, interval: float, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.run_once()
+            stop.wait(interval)
@@ -0,0 +1,179 @@
+# utils/jobs.py
+"""
+実行中の要約ジョブを管理し、協調的キャンセルを提供するモジュール
+
+- 各ジョブは専用の作業フォルダ (workspace) を持つ
+- cancel() で yt-dlp 子プロセスを kill し、待機中の Gemini/TTS 呼び出しを放棄する
+- パイプライン側は各ステージの前後で job.check() を呼び、キャンセル済みなら JobCancelled を送出する
+"""
+
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+POLL_INTERVAL = 0.2  # キャンセル確認の間隔（秒）
+FINISHED_JOB_TTL = 600  # 完了ジョブをレジストリに残す時間（秒）
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたことを示す例外"""
+
+
+class Job:
+    def __init__(self, job_id: str, workspace: Path, client_key: Optional[str] = None, lane: str = "interactive"):
+        self.id = job_id
+        self.workspace = workspace
+        self.client_key = client_key
+        self.lane = lane  # interactive / bulk（Gemini呼び出しの優先度に使う）
+        self.status = "running"  # running / done / failed / cancelled
+        self.events: List[str] = []
+        self.result: Optional[dict] = None
+        self.usage_tags: Dict[str, str] = {}  # 利用記録に付ける動画ID・ジャンル・チャンネル
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self.workspace.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def progress(self, message: str):
+        """進捗メッセージを記録する（ストリーミング配信用）"""
+        print(message)
+        self.events.append(message)
+
+    def cancel(self):
+        """ジョブをキャンセルし、実行中の子プロセスがあれば kill する"""
+        if self._cancel_event.is_set():
+            return
+        self._cancel_event.set()
+        with self._lock:
+            proc = self._process
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.kill()
+                print(f"🛑 [{self.id}] 子プロセスを停止しました (pid={proc.pid})")
+            except Exception as e:
+                print(f"⚠️ [{self.id}] 子プロセス停止に失敗: {e}")
+        print(f"🛑 [{self.id}] ジョブをキャンセルしました")
+
+    def check(self):
+        """キャンセル済みなら JobCancelled を送出する"""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    def wait(self, seconds: float):
+        """指定秒数待つ（途中でキャンセルされたら JobCancelled）"""
+        self._cancel_event.wait(seconds)
+        self.check()
+
+    def run_process(self, cmd: List[str], **kwargs) -> int:
+        """
+        子プロセスを起動し、キャンセルを監視しながら終了を待つ
+        キャンセルされた場合はプロセスを kill して JobCancelled を送出する
+        """
+        self.check()
+        proc = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._process = proc
+        try:
+            while True:
+                try:
+                    returncode = proc.wait(timeout=POLL_INTERVAL)
+                    # cancel() 側で kill された場合もキャンセルとして扱う
+                    self.check()
+                    return returncode
+                except subprocess.TimeoutExpired:
+                    if self._cancel_event.is_set():
+                        proc.kill()
+                        proc.wait()
+                        raise JobCancelled(self.id)
+        finally:
+            with self._lock:
+                self._process = None
+
+    def run_cancellable(self, func: Callable, *args, **kwargs):
+        """
+        ブロッキング呼び出し（Gemini/TTSなど）を別スレッドで実行し、完了を待つ
+        キャンセルされた場合は結果を待たずに JobCancelled を送出する（呼び出しは放棄）
+        """
+        self.check()
+        outcome: dict = {}
+        done = threading.Event()
+
+        def _target():
+            try:
+                outcome["value"] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=_target, daemon=True).start()
+        while not done.wait(POLL_INTERVAL):
+            if self._cancel_event.is_set():
+                raise JobCancelled(self.id)
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("value")
+
+    def cleanup(self):
+        """ジョブの作業フォルダを削除する"""
+        shutil.rmtree(self.workspace, ignore_errors=True)
+        print(f"🧹 [{self.id}] 作業フォルダを削除しました: {self.workspace}")
+
+
+_JOBS: Dict[str, Job] = {}
+_JOBS_LOCK = threading.Lock()
+
+
+def _purge_finished():
+    now = time.time()
+    for job_id in [j.id for j in _JOBS.values() if j.finished_at and now - j.finished_at > FINISHED_JOB_TTL]:
+        del _JOBS[job_id]
+
+
+def create_job(base_dir: Path, client_key: Optional[str] = None, lane: str = "interactive") -> Job:
+    """
+    新しいジョブを登録する
+    同じ client_key の実行中ジョブがあれば再送信とみなしてキャンセルする
+    """
+    job_id = uuid.uuid4().hex[:12]
+    job = Job(job_id, base_dir / job_id, client_key, lane)
+    superseded = []
+    with _JOBS_LOCK:
+        _purge_finished()
+        if client_key:
+            superseded = [j for j in _JOBS.values() if j.client_key == client_key and j.status == "running" and not j.cancelled]
+        _JOBS[job_id] = job
+    for old in superseded:
+        print(f"🔁 再送信を検知: 旧ジョブ {old.id} をキャンセルします")
+        old.cancel()
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _JOBS_LOCK:
+        return _JOBS.get(job_id)
+
+
+def cancel_job(job_id: str) -> bool:
+    job = get_job(job_id)
+    if job is None or job.status != "running":
+        return False
+    job.cancel()
+    return True
+
+
+def finish_job(job: Job, status: str):
+    """ジョブの終了状態を記録し、作業フォルダを片付ける"""
+    job.status = "cancelled" if job.cancelled else status
+    job.finished_at = time.time()
+    job.cleanup()
@@ -0,0 +1,102 @@
+# utils/live.py
+"""
+ライブ配信・プレミア公開の逐次要約で使う字幕の差分処理
+
+配信中は字幕トラックが伸び続けるため、ポーリングのたびに同じ VTT を丸ごと取り直すことになる。
+ここでは前回処理したキューの開始時刻（ウォーターマーク）より後のキューだけを取り出し、
+Gemini には「これまでの要約 + 新しい発言」だけを渡せるよう差分を溜めておく。
+"""
+
+import re
+from collections import deque
+from pathlib import Path
+from typing import List, Tuple
+
+_CUE_RE = re.compile(r"^(\d+):(\d\d):(\d\d)\.(\d{3}) --> (\d+):(\d\d):(\d\d)\.(\d{3})")
+_TAG_RE = re.compile(r"<.*?>")
+RECENT_LINES = 200  # 重複行の判定に使う直近の行数（自動字幕は同じ行が隣接キューに繰り返し出る）
+
+
+def _seconds(h: str, m: str, s: str, ms: str) -> float:
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000
+
+
+def format_offset(seconds: float) -> str:
+    """秒数を H:MM:SS 形式にする"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def parse_cues(vtt_text: str, after: float = -1.0) -> List[Tuple[float, float, str]]:
+    """
+    開始時刻が after より後のキューを (開始秒, 終了秒, テキスト) で返す
+    parse_vtt と同じく各キューの1行目だけを採用し、after 以前のキューは本文を読まずに読み飛ばす
+    """
+    cues = []
+    current = None
+    for line in vtt_text.splitlines():
+        if " --> " in line:
+            m = _CUE_RE.match(line.strip())
+            if m:
+                start = _seconds(*m.groups()[:4])
+                current = (start, _seconds(*m.groups()[4:])) if start > after else None
+            continue
+        if current is None:
+            continue
+        line = line.strip()
+        if line == "" or line.isdigit():
+            continue
+        cues.append((current[0], current[1], _TAG_RE.sub("", line)))
+        current = None
+    return cues
+
+
+class LiveSession:
+    """
+    逐次要約の状態（ウォーターマーク・未要約の差分・これまでの要約）
+    取り込んだ字幕は transcript_path に追記し、メモリには未要約分だけを持つ
+    """
+
+    def __init__(self, transcript_path: Path):
+        self.transcript_path = Path(transcript_path)
+        self.watermark = -1.0  # 取り込み済みの最後のキューの開始時刻
+        self.covered_until = 0.0  # 要約に反映済みの位置（秒）
+        self.summary = ""
+        self.revision = 0
+        self.pending: List[str] = []
+        self._pending_until = 0.0
+        self._recent = deque(maxlen=RECENT_LINES)
+
+    @property
+    def pending_text(self) -> str:
+        return "\n".join(self.pending)
+
+    def feed(self, vtt_text: str, final: bool = False) -> int:
+        """
+        新しいキューを取り込み、追加した行数を返す
+        配信中は最後のキューがまだ書き換わる可能性があるため、final=True になるまで取り込まない
+        """
+        cues = parse_cues(vtt_text, self.watermark)
+        if not final:
+            cues = cues[:-1]
+        added = []
+        for start, end, text in cues:
+            self.watermark = start
+            self._pending_until = max(self._pending_until, end)
+            text = text.strip()
+            if not text or text in self._recent:
+                continue
+            self._recent.append(text)
+            added.append(text)
+        if added:
+            self.pending.extend(added)
+            with self.transcript_path.open("a", encoding="utf-8") as f:
+                f.write("\n".join(added) + "\n")
+        return len(added)
+
+    def commit(self, summary: str):
+        """差分を要約に反映したことを記録する"""
+        self.summary = summary
+        self.revision += 1
+        self.pending = []
+        self.covered_until = self._pending_until
@@ -0,0 +1,123 @@
+# utils/model_router.py
+"""
+Gemini モデルの自動選択（flash-lite / flash / pro）
+
+プロンプトのトークン数を手元で見積もり、ジャンルごとの方針（prompts.json の "routing"）に従って
+リクエストごとにモデルを選ぶ。方針の項目:
+    model              … 基本のモデル（lite / flash / pro）
+    lite_max_tokens    … 入力がこれ以下なら lite にする（短い動画に重いモデルは不要）
+    upgrade_min_tokens … 入力がこれ以上なら1段上のモデルにする（長く密度の高い動画）
+    output_tokens      … 出力トークン数の見込み（費用・待ち時間の見積もり用）
+    max_cost_usd       … 1回あたりの費用上限。超える場合は1段ずつ下げる
+    max_latency_s      … 応答時間の目安の上限。超える場合は1段ずつ下げる
+環境変数 GEMINI_MODEL を設定した場合は従来どおりそのモデルに固定する。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+TIERS = ("lite", "flash", "pro")
+# 料金は100万トークンあたりのUSD（入力 / 出力）、速度は目安
+MODELS = {
+    "lite": {"name": os.getenv("GEMINI_MODEL_LITE", "gemini-2.5-flash-lite"),
+             "input_per_m": 0.10, "output_per_m": 0.40, "base_latency_s": 1.5, "output_tps": 250},
+    "flash": {"name": os.getenv("GEMINI_MODEL_FLASH", "gemini-2.5-flash"),
+              "input_per_m": 0.30, "output_per_m": 2.50, "base_latency_s": 4.0, "output_tps": 150},
+    "pro": {"name": os.getenv("GEMINI_MODEL_PRO", "gemini-2.5-pro"),
+            "input_per_m": 1.25, "output_per_m": 10.00, "base_latency_s": 10.0, "output_tps": 80},
+}
+INPUT_TPS = 20000  # 入力の処理速度の目安（トークン/秒）
+DEFAULT_ROUTING = {
+    "model": "flash",
+    "lite_max_tokens": 0,
+    "upgrade_min_tokens": 0,
+    "output_tokens": 2000,
+    "max_cost_usd": None,
+    "max_latency_s": None,
+}
+
+# Gemini のトークナイザは手元にないため文字種ごとの平均で見積もる
+# （英数字は約4文字、日本語は約1.3文字で1トークン）
+_ASCII_RE = re.compile(r"[\x00-\x7f]+")
+ASCII_CHARS_PER_TOKEN = 4.0
+CJK_CHARS_PER_TOKEN = 1.3
+
+_log_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    ascii_chars = sum(len(m) for m in _ASCII_RE.findall(text))
+    other_chars = len(text) - ascii_chars
+    return int(ascii_chars / ASCII_CHARS_PER_TOKEN + other_chars / CJK_CHARS_PER_TOKEN) + 1
+
+
+def tier_of(model_name: str) -> Optional[str]:
+    for tier, spec in MODELS.items():
+        if spec["name"] == model_name:
+            return tier
+    return None
+
+
+def estimate_cost(tier: str, input_tokens: int, output_tokens: int) -> float:
+    spec = MODELS[tier]
+    return (input_tokens * spec["input_per_m"] + output_tokens * spec["output_per_m"]) / 1_000_000
+
+
+def estimate_latency(tier: str, input_tokens: int, output_tokens: int) -> float:
+    spec = MODELS[tier]
+    return spec["base_latency_s"] + input_tokens / INPUT_TPS + output_tokens / spec["output_tps"]
+
+
+def route(input_tokens: int, routing: Optional[dict] = None, forced: Optional[str] = None) -> dict:
+    """入力トークン数と方針からモデルを選び、選んだ理由と見積もりを返す"""
+    policy = {**DEFAULT_ROUTING, **(routing or {})}
+    output_tokens = int(policy["output_tokens"])
+
+    if forced:
+        tier, reason = tier_of(forced), "環境変数で固定"
+        model_name = forced
+    else:
+        tier = policy["model"] if policy["model"] in TIERS else "flash"
+        reasons = [f"基本 {tier}"]
+        if policy["lite_max_tokens"] and input_tokens <= policy["lite_max_tokens"]:
+            tier = "lite"
+            reasons.append(f"入力{input_tokens}≦{policy['lite_max_tokens']}で lite")
+        elif policy["upgrade_min_tokens"] and input_tokens >= policy["upgrade_min_tokens"] and tier != "pro":
+            tier = TIERS[TIERS.index(tier) + 1]
+            reasons.append(f"入力{input_tokens}≧{policy['upgrade_min_tokens']}で {tier}")
+        # 費用・待ち時間の上限を超える間は1段ずつ下げる
+        while tier != "lite":
+            over_cost = policy["max_cost_usd"] is not None and \
+                estimate_cost(tier, input_tokens, output_tokens) > policy["max_cost_usd"]
+            over_latency = policy["max_latency_s"] is not None and \
+                estimate_latency(tier, input_tokens, output_tokens) > policy["max_latency_s"]
+            if not (over_cost or over_latency):
+                break
+            tier = TIERS[TIERS.index(tier) - 1]
+            reasons.append(f"{'費用' if over_cost else '待ち時間'}の上限により {tier}")
+        model_name = MODELS[tier]["name"]
+        reason = " → ".join(reasons)
+
+    return {
+        "model": model_name,
+        "tier": tier,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "est_cost_usd": round(estimate_cost(tier, input_tokens, output_tokens), 6) if tier else None,
+        "est_latency_s": round(estimate_latency(tier, input_tokens, output_tokens), 1) if tier else None,
+        "reason": reason,
+    }
+
+
+def record_route(path: Path, entry: dict):
+    """選択結果を JSON Lines で追記する（実行ごとの記録）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps({"ts": time.strftime("%Y-%m-%d %H:%M:%S"), **entry}, ensure_ascii=False)
+    with _log_lock, path.open("a", encoding="utf-8") as f:
+        f.write(line + "\n")
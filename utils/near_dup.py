@@ -0,0 +1,229 @@
+# utils/near_dup.py
+"""
+再アップロード・ミラー・ほぼ全編の切り抜き動画の検出（MinHash + LSH）
+
+整形済み字幕を文字 n-gram（shingle）の集合にし、MinHash 署名を SQLite に保存する。
+署名をバンドに分けたハッシュ（LSH バケット）で候補を絞り、推定 Jaccard 類似度が
+しきい値以上の既存動画があれば、その要約を再利用できる。
+同じ動画を複数ジャンルで要約することがあるため、要約済みのジャンルは動画ごとに別表で持ち、
+検索時にジャンルで絞り込める。
+numpy があればベクトル化して計算し、無ければ純 Python で同じ値を計算する。
+"""
+
+import hashlib
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy なしでも動作する（遅いだけ）
+    np = None
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+MIN_SHINGLES = 50  # これより短い字幕（ほぼ無言の動画など）は判定しない
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+_NORMALIZE_RE = re.compile(r"[\W_]+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """空白・記号を除いた文字列の n-gram を 32bit ハッシュの集合にする"""
+    normalized = _NORMALIZE_RE.sub("", text.lower())
+    return {zlib.crc32(normalized[i:i + size].encode("utf-8")) for i in range(len(normalized) - size + 1)}
+
+
+def lsh_params(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """
+    しきい値に合わせてバンド数 b と 1バンドあたりの行数 r を選ぶ
+    候補の取りこぼしを避けるため、LSH の実効しきい値 (1/b)^(1/r) はやや低めに取り、
+    最終判定は署名から推定した類似度で行う
+    """
+    target = threshold * 0.85
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        effective = (1 / bands) ** (1 / rows)
+        if best is None or abs(effective - target) < abs(best[2] - target):
+            best = (bands, rows, effective)
+    return best[0], best[1]
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.randint(1, _MERSENNE_PRIME - 1) for _ in range(num_perm)]
+        self.b = [rng.randint(0, _MERSENNE_PRIME - 1) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array(self.a, dtype=np.uint64)
+            self._b = np.array(self.b, dtype=np.uint64)
+
+    def signature(self, hashes: Iterable[int]) -> List[int]:
+        hashes = list(hashes)
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        if np is not None:
+            hv = np.array(hashes, dtype=np.uint64)[:, None]
+            # uint64 の桁あふれは純 Python 側でも同じ (& _MASK64) にそろえている
+            with np.errstate(over="ignore"):
+                phv = ((hv * self._a + self._b) % np.uint64(_MERSENNE_PRIME)) & np.uint64(_MAX_HASH)
+            return phv.min(axis=0).astype(np.uint32).tolist()
+        return [
+            min((((a * x + b) & _MASK64) % _MERSENNE_PRIME) & _MAX_HASH for x in hashes)
+            for a, b in zip(self.a, self.b)
+        ]
+
+
+def estimate_similarity(sig1: List[int], sig2: List[int]) -> float:
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+class NearDuplicateIndex:
+    def __init__(self, path: Path, threshold: float = 0.8, num_perm: int = NUM_PERM):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                video_id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                sig BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                bucket INTEGER NOT NULL,
+                video_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS lsh_bucket_idx ON lsh_buckets (bucket);
+            CREATE INDEX IF NOT EXISTS lsh_video_idx ON lsh_buckets (video_id);
+            CREATE TABLE IF NOT EXISTS signature_genres (
+                video_id TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (video_id, genre)
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        if conn.execute("SELECT value FROM meta WHERE key = 'genres'").fetchone() is None:
+            # ジャンル表の導入前の DB: signatures に残っている（最後に登録した）ジャンルを移す
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO signature_genres (video_id, genre, created_at) "
+                             "SELECT video_id, genre, created_at FROM signatures")
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('genres', '1')")
+        layout = f"{num_perm}x{self.rows}"
+        row = conn.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()
+        if row is None or row[0] != layout:
+            self._rebuild_buckets(layout)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _rebuild_buckets(self, layout: str):
+        """しきい値（バンド構成）が変わったときは保存済みの署名からバケットを作り直す"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM lsh_buckets")
+            rows = conn.execute("SELECT video_id, sig FROM signatures").fetchall()
+            conn.executemany(
+                "INSERT INTO lsh_buckets (bucket, video_id) VALUES (?, ?)",
+                [(bucket, vid) for vid, blob in rows for bucket in self._buckets(array("I", blob).tolist())],
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('layout', ?)", (layout,))
+        if rows:
+            print(f"🔁 類似動画インデックスのバケットを再構築しました ({len(rows)} 件, {layout})")
+
+    def _buckets(self, sig: List[int]) -> List[int]:
+        buckets = []
+        for band in range(self.bands):
+            chunk = array("I", sig[band * self.rows:(band + 1) * self.rows]).tobytes()
+            digest = hashlib.blake2b(band.to_bytes(2, "little") + chunk, digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, "little", signed=True))
+        return buckets
+
+    def signature(self, text: str) -> Optional[List[int]]:
+        """署名を計算する（短すぎる字幕は None）"""
+        hashes = shingles(text)
+        if len(hashes) < MIN_SHINGLES:
+            return None
+        return self.hasher.signature(hashes)
+
+    def add(self, video_id: str, title: str, url: str, genre: str, sig: List[int]):
+        self.add_many([(video_id, title, url, genre, sig)])
+
+    def add_many(self, entries: Iterable[Tuple[str, str, str, str, List[int]]]):
+        """
+        (video_id, title, url, genre, 署名) をまとめて1トランザクションで登録する（バックフィル用）
+        登録済みの動画を別のジャンルで登録すると、要約済みのジャンルに追加される（以前のジャンルは残る）
+        """
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            for video_id, title, url, genre, sig in entries:
+                conn.execute("DELETE FROM lsh_buckets WHERE video_id = ?", (video_id,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO signatures (video_id, title, url, genre, sig, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (video_id, title, url, genre, array("I", sig).tobytes(), now),
+                )
+                conn.executemany(
+                    "INSERT INTO lsh_buckets (bucket, video_id) VALUES (?, ?)",
+                    [(bucket, video_id) for bucket in self._buckets(sig)],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO signature_genres (video_id, genre, created_at) VALUES (?, ?, ?)",
+                    (video_id, genre, now),
+                )
+
+    def find(self, sig: List[int], exclude: Optional[str] = None, genre: Optional[str] = None) -> Optional[dict]:
+        """
+        類似度がしきい値以上で最も近い既存動画を返す（無ければ None）
+        genre を指定すると、そのジャンルで要約済みの動画だけを対象にする。
+        結果の genre は指定したジャンル（未指定なら最後に登録したジャンル）、genres は要約済みの全ジャンル
+        """
+        buckets = self._buckets(sig)
+        conn = self._conn()
+        query = (f"SELECT DISTINCT s.video_id, s.title, s.url, s.genre, s.sig FROM lsh_buckets b "
+                 f"JOIN signatures s ON s.video_id = b.video_id ")
+        params = list(buckets)
+        if genre is not None:
+            query += "JOIN signature_genres g ON g.video_id = s.video_id AND g.genre = ? "
+            params.insert(0, genre)
+        query += f"WHERE b.bucket IN ({','.join('?' * len(buckets))})"
+        candidates = conn.execute(query, params).fetchall()
+
+        best = None
+        for video_id, title, url, latest, blob in candidates:
+            if video_id == exclude:
+                continue
+            similarity = estimate_similarity(sig, array("I", blob).tolist())
+            if similarity >= self.threshold and (best is None or similarity > best["similarity"]):
+                best = {"video_id": video_id, "title": title, "url": url, "genre": genre or latest,
+                        "similarity": round(similarity, 3)}
+        if best:
+            best["genres"] = [row[0] for row in conn.execute(
+                "SELECT genre FROM signature_genres WHERE video_id = ? ORDER BY created_at DESC", (best["video_id"],)
+            )]
+        return best
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
@@ -0,0 +1,187 @@
+# utils/search_index.py
+"""
+字幕・要約の全文検索インデックス（SQLite FTS5）
+
+日本語は単語区切りがないため、CJK文字列は重なりのある2文字（バイグラム）に分割し、
+英数字は単語単位で小文字化してから FTS5 (unicode61) に登録する。
+検索語も同じ規則でバイグラムのフレーズに変換するので、2文字の語（株価・決算など）も検索できる。
+"""
+
+import html
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# 英数字の単語 / それ以外の文字（かな・漢字など）の連続。記号・空白は区切りとして捨てる
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+|[^\W_A-Za-z0-9]+")
+SNIPPET_RADIUS = 60
+
+
+def to_bigrams(text: str) -> str:
+    """検索用にテキストをバイグラム列（空白区切り）へ変換する"""
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text):
+        if run.isascii():
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return " ".join(tokens)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """検索語（空白区切りで AND）を FTS5 の MATCH 式に変換する"""
+    phrases = []
+    for term in query.split():
+        grams = to_bigrams(term)
+        if not grams:
+            continue
+        if " " not in grams and not grams.isascii() and len(grams) == 1:
+            # 1文字の語はその文字で始まるバイグラムの前方一致で探す
+            phrases.append(f'"{grams}"*')
+        else:
+            phrases.append('"' + grams.replace('"', '""') + '"')
+    return " AND ".join(phrases) if phrases else None
+
+
+def make_snippet(text: str, terms: List[str], radius: int = SNIPPET_RADIUS) -> str:
+    """最初に見つかった検索語の前後を切り出し、検索語を <mark> で強調した HTML を返す"""
+    lowered = text.lower()
+    hits = [(lowered.find(t.lower()), t) for t in terms if t and lowered.find(t.lower()) >= 0]
+    if not hits:
+        return html.escape(text[: radius * 2]) + ("…" if len(text) > radius * 2 else "")
+    pos = min(hits)[0]
+    start, end = max(0, pos - radius), min(len(text), pos + radius)
+    fragment = html.escape(text[start:end]).replace("\n", " ")
+    for term in sorted({t for _, t in hits}, key=len, reverse=True):
+        fragment = re.sub(re.escape(html.escape(term)), lambda m: f"<mark>{m.group(0)}</mark>", fragment, flags=re.IGNORECASE)
+    return ("…" if start > 0 else "") + fragment + ("…" if end < len(text) else "")
+
+
+class SearchIndex:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                date TEXT NOT NULL,
+                transcript TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                indexed_at REAL NOT NULL,
+                UNIQUE (video_id, genre)
+            );
+            CREATE INDEX IF NOT EXISTS docs_date ON docs (date);
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                title, summary, transcript, tokenize = 'unicode61 remove_diacritics 0'
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, video_id: str, genre: str, title: str, url: str, transcript: str, summary: str,
+            date: Optional[str] = None):
+        """1動画（＋ジャンル）分を登録する。同じ動画・ジャンルは上書き"""
+        date = date or time.strftime("%Y-%m-%d")
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT id FROM docs WHERE video_id = ? AND genre = ?", (video_id, genre)).fetchone()
+            if row:
+                conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+            cur = conn.execute(
+                "INSERT INTO docs (video_id, genre, title, url, date, transcript, summary, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, genre, title, url, date, transcript, summary, time.time()),
+            )
+            conn.execute(
+                "INSERT INTO docs_fts (rowid, title, summary, transcript) VALUES (?, ?, ?, ?)",
+                (cur.lastrowid, to_bigrams(title), to_bigrams(summary), to_bigrams(transcript)),
+            )
+        print(f"🔎 検索インデックス登録: {title} ({genre})")
+
+    def get_summary(self, video_id: str, genre: str) -> Optional[str]:
+        """登録済みの要約を返す（要約キャッシュの期限切れ後も類似動画の再利用に使える）"""
+        row = self._conn().execute(
+            "SELECT summary FROM docs WHERE video_id = ? AND genre = ?", (video_id, genre)
+        ).fetchone()
+        return row[0] if row else None
+
+    def summaries(self, genre: str, since: str, until: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """期間内（処理日 since〜until）に登録したそのジャンルの要約（古い順）"""
+        rows = self._conn().execute(
+            "SELECT video_id, title, url, date, summary FROM docs WHERE genre = ? AND date >= ? AND date <= ? "
+            "ORDER BY indexed_at LIMIT ?",
+            (genre, since, until or "9999-12-31", limit),
+        ).fetchall()
+        return [{"video_id": v, "title": t, "url": u, "date": d, "summary": s} for v, t, u, d, s in rows]
+
+    def search(self, query: str, genre: Optional[str] = None, since: Optional[str] = None,
+               page: int = 1, per_page: int = 20) -> dict:
+        """
+        検索語に一致する動画をスコア順（タイトル > 要約 > 字幕 の重み付き bm25）で返す
+        since は YYYY-MM-DD（その日以降に処理した動画に絞る）
+        """
+        started = time.perf_counter()
+        match = build_match_query(query)
+        if not match:
+            return {"query": query, "total": 0, "page": page, "per_page": per_page, "results": [], "elapsed_ms": 0.0}
+
+        where, params = ["docs_fts MATCH ?"], [match]
+        if genre:
+            where.append("d.genre = ?")
+            params.append(genre)
+        if since:
+            where.append("d.date >= ?")
+            params.append(since)
+        where_sql = " AND ".join(where)
+
+        conn = self._conn()
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid WHERE {where_sql}", params
+        ).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT d.video_id, d.genre, d.title, d.url, d.date, d.summary, d.transcript, "
+            f"bm25(docs_fts, 5.0, 3.0, 1.0) AS score "
+            f"FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid WHERE {where_sql} "
+            f"ORDER BY score LIMIT ? OFFSET ?",
+            params + [per_page, (page - 1) * per_page],
+        ).fetchall()
+
+        terms = query.split()
+        results = []
+        for video_id, g, title, url, date, summary, transcript, score in rows:
+            in_summary = any(t.lower() in summary.lower() for t in terms)
+            results.append({
+                "video_id": video_id,
+                "genre": g,
+                "title": title,
+                "url": url,
+                "date": date,
+                "score": round(-score, 3),
+                "snippet_html": make_snippet(summary if in_summary else transcript, terms),
+            })
+        return {
+            "query": query,
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "results": results,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
@@ -1,10 +1,13 @@
 # utils/subtitle.py
 
+import json
 import re
 import subprocess
 from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
+from utils.video_meta import CAPTION_LANGS, build_metadata_cmd, caption_track_args, choose_caption_track, summarize_info
+
 CAPTIONS_DIR = Path("captions")
 CAPTIONS_DIR.mkdir(exist_ok=True)
 
@@ -24,44 +27,61 @@ def get_video_id(url: str) -> str:
     query = parse_qs(parsed_url.query)
     return query.get("v", [""])[0]
 
+def _cached_vtt(video_id: str) -> Path | None:
+    # glob の [] は文字クラスになるため、ファイル名に "[動画ID]" を含むかで判定する
+    for p in CAPTIONS_DIR.glob("*.vtt"):
+        if f"[{video_id}]" in p.name:
+            return p
+    return None
+
 def get_subtitle(youtube_url: str) -> Path | None:
     """
-    キャッシュ機能付き字幕取得関数（日本語→英語の順で試行）
+    キャッシュ機能付き字幕取得関数
+    字幕の一覧を1回だけ取得し、優先言語（CAPTION_LANGS）・手動字幕優先で選んだ1トラックだけをダウンロードする
     """
     clean_url = clean_youtube_url(youtube_url)
     video_id = get_video_id(clean_url)
 
     # キャッシュチェック
-    existing = list(CAPTIONS_DIR.glob(f"*[{video_id}]*.vtt"))
+    existing = _cached_vtt(video_id)
     if existing:
-        return existing[0]
+        return existing
+
+    # 字幕一覧（info JSON）を取得し、ダウンロードでは --load-info-json で再利用する（動画の解析は1回だけ）
+    info_path = CAPTIONS_DIR / f"{video_id or 'video'}.info.json"
+    try:
+        with info_path.open("w", encoding="utf-8") as f:
+            subprocess.run(build_metadata_cmd(clean_url), check=True, stdout=f, stderr=subprocess.DEVNULL)
+        with info_path.open("r", encoding="utf-8") as f:
+            track = choose_caption_track(summarize_info(json.load(f)))
+
+        if track is None:
+            print(f"[ERROR] 優先言語 {CAPTION_LANGS} の字幕がありません: {youtube_url}")
+            return None
 
-    # 試す言語の順序（日本語→英語）
-    sub_langs = ["ja", "en"]
+        subprocess.run(
+            [
+                "yt-dlp",
+                *caption_track_args(track),
+                "--skip-download",
+                "--output",
+                str(CAPTIONS_DIR / "%(title)s [%(id)s].%(ext)s"),
+                "--load-info-json",
+                str(info_path),
+            ],
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except (subprocess.CalledProcessError, ValueError):
+        print(f"[ERROR] 字幕一覧の取得失敗: {youtube_url}")
+        return None
+    finally:
+        info_path.unlink(missing_ok=True)
 
-    for lang in sub_langs:
-        try:
-            subprocess.run(
-                [
-                    "yt-dlp",
-                    "--write-auto-sub",
-                    "--sub-lang",
-                    lang,
-                    "--skip-download",
-                    "--output",
-                    str(CAPTIONS_DIR / "%(title)s [%(id)s].%(ext)s"),
-                    clean_url,
-                ],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            # 成功したら.vttファイルができているか確認
-            vtt_files = list(CAPTIONS_DIR.glob(f"*[{video_id}]*.vtt"))
-            if vtt_files:
-                return vtt_files[0]
-        except subprocess.CalledProcessError:
-            continue  # 次の言語へ
+    vtt_path = _cached_vtt(video_id)
+    if vtt_path:
+        return vtt_path
 
     print(f"[ERROR] 字幕取得失敗: {youtube_url}")
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,131 @@
+# utils/text_normalize.py
+"""
+字幕テキストの正規化（Gemini に送るトークン数を減らす）
+
+日本語の自動字幕に多い
+- フィラー（えー / えっと / あのー / まあ など）
+- 雑音タグ（[音楽] / [拍手] / (笑) / ♪ など）
+- 全角英数字・半角カタカナ
+- 連続する空白・日本語の語間の空白
+を、1つにまとめた正規表現で1回走査して取り除く（置き換える）。
+工程は STEPS から選べ、フィラーは前後が空白・句読点・行頭・行末で区切られているときだけ消すので、
+「あの会社」「その後」のような指示語は残る。読点が続くときだけ消す語（あの、/ なんか、など）は WEAK_FILLERS に置く。
+"""
+
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+from utils.model_router import estimate_tokens
+from utils.transcript import Transcript
+
+STEPS = ("fillers", "noise", "width", "spaces")
+DEFAULT_FILLERS = (
+    "えー+っ?と?", "えっと", "えと", "あー+", "うー+ん", "んー+", "まあ", "まぁ", "まー+",
+    "あのー+", "そのー+", "このー+", "なんかー+", "ええと",
+)
+WEAK_FILLERS = ("あの", "その", "なんか", "ま", "ええ")
+NOISE_WORDS = (
+    "音楽", "拍手", "笑い", "笑", "歓声", "効果音", "BGM", "Music", "Applause", "Laughter", "Cheering", "Silence",
+)
+
+_SPACE = r"[ \t\u3000]"
+_JA = r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uff66-\uff9f\uff10-\uff19\uff21-\uff3a\uff41-\uff5a々〆]"  # 語間の空白を詰める文字（全角英数字を含む）
+# フィラーの左側に来てよい文字（これ以外の文字の直後のフィラーは単語の一部とみなす）
+_LEFT = r"(?<![^\s、。，,．.!?！？「」『』（）()…])"
+_RIGHT_STOP = r"(?=[\s、。，,．.!?！？」』…]|$)"
+_FULLWIDTH_OFFSET = 0xFEE0
+
+
+def _alternation(words: Iterable[str], literal: bool) -> str:
+    words = sorted(set(words), key=len, reverse=True)
+    return "|".join(re.escape(w) if literal else w for w in words)
+
+
+class TextNormalizer:
+    def __init__(self, steps: Iterable[str] = STEPS, fillers: Iterable[str] = DEFAULT_FILLERS,
+                 weak_fillers: Iterable[str] = WEAK_FILLERS, noise_words: Iterable[str] = NOISE_WORDS,
+                 extra_fillers: Iterable[str] = ()):
+        """fillers は正規表現、extra_fillers / weak_fillers / noise_words は文字どおりの語"""
+        self.steps = tuple(s for s in STEPS if s in set(steps))
+        parts = []
+        if "noise" in self.steps:
+            words = _alternation(noise_words, literal=True)
+            parts.append(rf"(?P<noise>{_SPACE}*[\[［(（]{_SPACE}*(?i:{words}){_SPACE}*[\]］)）]|[♪♫♬]+){_SPACE}*")
+        if "fillers" in self.steps:
+            strong = "|".join(filter(None, [_alternation(fillers, literal=False),
+                                            _alternation(extra_fillers, literal=True)]))
+            weak = _alternation(weak_fillers, literal=True)
+            parts.append(rf"(?P<filler>{_LEFT}(?:(?:{strong}){_RIGHT_STOP}|(?:{weak})(?=[、，,]))[、，,]?{_SPACE}*)")
+        if "spaces" in self.steps:
+            parts.append(rf"(?P<edge>^{_SPACE}+|{_SPACE}+$)")
+            parts.append(rf"(?P<jspace>(?<={_JA}){_SPACE}+(?={_JA}))")
+            parts.append(rf"(?P<space>{_SPACE}{{2,}}|[\t\u3000])")
+        if "width" in self.steps:
+            parts.append(r"(?P<wide>[\uff01-\uff5e]+)")
+            parts.append(r"(?P<hankana>[\uff66-\uff9f]+)")
+        self._re = re.compile("|".join(parts), re.M) if parts else None
+
+    def normalize(self, text: str, counts: Optional[Counter] = None) -> str:
+        """text を1回走査して正規化する（counts を渡すと種類ごとの置き換え回数を加算する）"""
+        if self._re is None:
+            return text
+
+        def _replace(m: re.Match) -> str:
+            kind = m.lastgroup
+            if counts is not None:
+                counts[kind] += 1
+            if kind == "space":
+                return " "
+            if kind == "wide":
+                return "".join(chr(ord(c) - _FULLWIDTH_OFFSET) for c in m.group())
+            if kind == "hankana":
+                return unicodedata.normalize("NFKC", m.group())
+            return ""
+
+        return self._re.sub(_replace, text)
+
+    def transcript(self, transcript: Transcript) -> Tuple[Transcript, dict]:
+        """
+        行ごとに正規化した Transcript と、削減量の報告を返す
+        正規化で空になった行（[音楽] だけの行など）と直前と同じになった行は、開始時刻ごと取り除く
+        """
+        counts = Counter()
+        timed = transcript.has_timestamps
+        lines, starts = [], array("I")
+        for i, line in enumerate(transcript.lines):
+            line = self.normalize(line, counts).strip()
+            if not line or (lines and lines[-1] == line):
+                continue
+            lines.append(line)
+            if timed:
+                starts.append(transcript.starts[i])
+        result = Transcript(lines, starts if timed else None, transcript.chapters)
+        before, after = estimate_tokens(transcript.text), estimate_tokens(result.text)
+        report = {
+            "tokens_before": before,
+            "tokens_after": after,
+            "saved_pct": round(100 * (before - after) / before, 1) if before else 0.0,
+            "fillers": counts["filler"],
+            "noise": counts["noise"],
+            "lines_dropped": len(transcript.lines) - len(lines),
+        }
+        return result, report
+
+    def clean(self, text: str) -> Tuple[str, dict]:
+        """1行1キューの字幕テキスト（clean_text の出力）を transcript と同じ手順で正規化する"""
+        normalized, report = self.transcript(Transcript(text.split("\n") if text else []))
+        return normalized.text, report
+
+
+def parse_steps(spec: str) -> Tuple[str, ...]:
+    """"fillers,noise" のような指定を STEPS の部分集合にする（"all" はすべて、空は無効）"""
+    names = [s.strip() for s in (spec or "").split(",") if s.strip()]
+    if "all" in names:
+        return STEPS
+    unknown = [s for s in names if s not in STEPS]
+    if unknown:
+        raise ValueError(f"未知の正規化工程: {', '.join(unknown)}（{', '.join(STEPS)} から選択）")
+    return tuple(names)
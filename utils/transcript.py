@@ -0,0 +1,101 @@
+# utils/transcript.py
+"""
+タイムスタンプ付きの字幕テキストとチャプター情報
+
+各行の開始時刻はミリ秒の array('I')（1行 4byte）で行と並べて持ち、
+チャプター単位の切り出しや、プロンプトへのタイムスタンプ挿入、要約中の [t=...] を
+動画の該当位置へのリンク（&t=秒s）に置き換えるのに使う。
+"""
+
+import base64
+import re
+from array import array
+from bisect import bisect_left
+from typing import List, Optional
+
+from utils.live import format_offset, parse_cues
+
+MARKER_INTERVAL = 30  # プロンプトにタイムスタンプを挟む間隔（秒）
+_TIMESTAMP_REF_RE = re.compile(r"\[t=(?:(\d+):)?(\d{1,2}):(\d{2})\]")
+
+
+class Transcript:
+    def __init__(self, lines: List[str], starts: Optional[array] = None, chapters: Optional[List[dict]] = None):
+        self.lines = lines
+        self.starts = starts if starts is not None else array("I")
+        self.chapters = chapters or []
+
+    @classmethod
+    def from_vtt(cls, vtt_text: str) -> "Transcript":
+        """VTT から作る（clean_text(parse_vtt()) と同じく、空行と既出の行は除く）"""
+        seen, lines, starts = set(), [], array("I")
+        for start, _end, text in parse_cues(vtt_text):
+            text = text.strip()
+            if text and text not in seen:
+                seen.add(text)
+                lines.append(text)
+                starts.append(int(start * 1000))
+        return cls(lines, starts)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    @property
+    def has_timestamps(self) -> bool:
+        return len(self.starts) == len(self.lines) and len(self.lines) > 0
+
+    def slice(self, start: float, end: float) -> "Transcript":
+        """開始時刻が [start, end) の行だけを取り出す"""
+        lo = bisect_left(self.starts, int(start * 1000))
+        hi = bisect_left(self.starts, int(end * 1000))
+        return Transcript(self.lines[lo:hi], self.starts[lo:hi])
+
+    def timestamped_text(self, interval: int = MARKER_INTERVAL) -> str:
+        """interval 秒ごとに行頭へ [t=H:MM:SS] を挟んだテキスト（Gemini に根拠の位置を示させる用）"""
+        if not self.has_timestamps:
+            return self.text
+        out, next_marker = [], 0
+        for line, start_ms in zip(self.lines, self.starts):
+            if start_ms >= next_marker:
+                out.append(f"[t={format_offset(start_ms / 1000)}] {line}")
+                next_marker = start_ms + interval * 1000
+            else:
+                out.append(line)
+        return "\n".join(out)
+
+    def to_dict(self) -> dict:
+        return {
+            "text": self.text,
+            "starts": base64.b64encode(self.starts.tobytes()).decode("ascii"),
+            "chapters": self.chapters,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Transcript":
+        """to_dict() の逆（starts を持たない古いキャッシュはタイムスタンプなしで復元）"""
+        lines = data["text"].split("\n") if data.get("text") else []
+        starts = array("I")
+        if data.get("starts"):
+            starts.frombytes(base64.b64decode(data["starts"]))
+        return cls(lines, starts, data.get("chapters"))
+
+
+def deep_link(video_url: str, seconds: float) -> str:
+    """動画の指定位置から再生するURL"""
+    return f"{video_url}{'&' if '?' in video_url else '?'}t={int(seconds)}s"
+
+
+def link_timestamps(summary_md: str, video_url: str) -> str:
+    """要約中の [t=H:MM:SS] を動画の該当位置へのリンクに置き換える"""
+    def _replace(m: re.Match) -> str:
+        seconds = int(m.group(1) or 0) * 3600 + int(m.group(2)) * 60 + int(m.group(3))
+        return f"[{format_offset(seconds)}]({deep_link(video_url, seconds)})"
+    return _TIMESTAMP_REF_RE.sub(_replace, summary_md)
+
+
+def chapter_index_md(chapters: List[dict], video_url: str) -> str:
+    """チャプター一覧（各チャプターの開始位置へのリンク付き）"""
+    return "\n".join(
+        f"- [{format_offset(c['start'])}]({deep_link(video_url, c['start'])}) {c['title']}" for c in chapters
+    )
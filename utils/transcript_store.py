@@ -0,0 +1,200 @@
+# utils/transcript_store.py
+"""
+字幕の保存形式（.ytt）: 圧縮テキストブロック + 行の開始時刻・オフセットの索引
+
+ファイル構成（数値はすべてリトルエンディアン）:
+    ヘッダー   magic "YTT1" / codec u8 / フラグ u8 / 予約 2byte / 行数 u32 / ブロック数 u32 / メタ長 u32
+    メタ       JSON（タイトル・チャプター・保存時の配信状態）
+    開始時刻   u32 × 行数（ミリ秒。時刻のない字幕は 0 で埋め、フラグ FLAG_UNTIMED を立てる）
+    ブロック表 (データ先頭からのオフセット u64, 圧縮長 u32, 先頭行 u32) × ブロック数
+    データ     BLOCK_LINES 行ずつ改行で連結して圧縮したブロック
+
+mmap で開き、開始時刻の配列はコピーせずに二分探索するため、
+時間範囲を指定した読み込みでは該当するブロックだけを展開する。
+zstandard がなければ zlib で圧縮する（どちらで書いたかはヘッダーに記録）。
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional
+
+from utils.transcript import Transcript
+from utils.video_meta import PENDING_LIVE_STATUSES
+
+try:
+    import zstandard
+except ImportError:  # zstandard がなければ zlib を使う
+    zstandard = None
+
+MAGIC = b"YTT1"
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+FLAG_UNTIMED = 1  # 開始時刻を持たない字幕（フラグ導入前のファイルは 0 = 時刻ありとして読む）
+BLOCK_LINES = 256
+_HEADER = struct.Struct("<4sBB2xIII")
+_BLOCK = struct.Struct("<QII")
+
+
+def _compress(data: bytes, codec: int, level: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, min(level, 9))
+
+
+def _decompress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd で圧縮された字幕ファイルの読み込みには zstandard が必要です")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def write_transcript(path: Path, transcript: Transcript, title: str = "", level: int = 10,
+                     live_status: str = "") -> int:
+    """字幕を .ytt 形式で書き出し、ファイルサイズ（byte）を返す"""
+    codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+    lines = transcript.lines
+    flags = 0 if transcript.has_timestamps else FLAG_UNTIMED
+    starts = transcript.starts if transcript.has_timestamps else array("I", [0] * len(lines))
+    if sys.byteorder != "little":
+        starts = array("I", starts)
+        starts.byteswap()
+
+    blocks, offset = [], 0
+    table = bytearray()
+    for first in range(0, len(lines), BLOCK_LINES):
+        data = _compress("\n".join(lines[first:first + BLOCK_LINES]).encode("utf-8"), codec, level)
+        table += _BLOCK.pack(offset, len(data), first)
+        blocks.append(data)
+        offset += len(data)
+
+    meta = json.dumps({"title": title, "chapters": transcript.chapters, "live_status": live_status},
+                      ensure_ascii=False).encode("utf-8")
+    path = Path(path)
+    # 同じ動画を同時に保存しても互いの一時ファイルを壊さないよう、書き込みごとに別の一時ファイルを使う
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, codec, flags, len(lines), len(blocks), len(meta)))
+            f.write(meta)
+            f.write(starts.tobytes())
+            f.write(table)
+            for data in blocks:
+                f.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return path.stat().st_size
+
+
+class TranscriptFile:
+    """.ytt ファイルを mmap で開く（with 文で使う）"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = self.path.open("rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.codec, flags, self.n_lines, self.n_blocks, meta_len = _HEADER.unpack_from(self._mm, 0)
+        self.has_timestamps = not flags & FLAG_UNTIMED
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"字幕ファイルの形式が正しくありません: {path}")
+        pos = _HEADER.size
+        meta = json.loads(self._mm[pos:pos + meta_len].decode("utf-8"))
+        self.title: str = meta.get("title", "")
+        self.chapters: List[dict] = meta.get("chapters", [])
+        self.live_status: str = meta.get("live_status", "")
+        pos += meta_len
+        # 開始時刻はコピーせず mmap 上を直接参照する（ビッグエンディアン環境では読み込み時に変換）
+        self._view = memoryview(self._mm)[pos:pos + 4 * self.n_lines]
+        if sys.byteorder == "little":
+            self.starts = self._view.cast("I")
+        else:
+            self.starts = array("I", self._view.tobytes())
+            self.starts.byteswap()
+        self._table_pos = pos + 4 * self.n_lines
+        self._data_pos = self._table_pos + _BLOCK.size * self.n_blocks
+
+    def close(self):
+        # mmap を閉じる前に、開始時刻を参照している memoryview を解放する
+        for view in (getattr(self, "starts", None), getattr(self, "_view", None)):
+            if isinstance(view, memoryview):
+                view.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "TranscriptFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _block_lines(self, block_no: int) -> List[str]:
+        offset, length, _first = _BLOCK.unpack_from(self._mm, self._table_pos + _BLOCK.size * block_no)
+        start = self._data_pos + offset
+        return _decompress(self._mm[start:start + length], self.codec).decode("utf-8").split("\n")
+
+    def lines(self, lo: int = 0, hi: Optional[int] = None) -> Transcript:
+        """lo 行目から hi 行目の手前までを読み込む（必要なブロックだけ展開する）"""
+        hi = self.n_lines if hi is None else min(hi, self.n_lines)
+        lo = max(0, lo)
+        starts = array("I")
+        if hi <= lo:
+            return Transcript([], starts)
+        out: List[str] = []
+        for block_no in range(lo // BLOCK_LINES, (hi - 1) // BLOCK_LINES + 1):
+            block = self._block_lines(block_no)
+            base = block_no * BLOCK_LINES
+            out.extend(block[max(lo - base, 0):hi - base])
+        if self.has_timestamps:
+            starts.frombytes(self.starts[lo:hi].tobytes())
+        return Transcript(out, starts)
+
+    def time_range(self, start: float, end: float) -> Transcript:
+        """開始時刻が [start, end) 秒の行だけを読み込む"""
+        if not self.has_timestamps:
+            raise ValueError(f"時刻のない字幕は時間範囲で読み込めません: {self.path}")
+        lo = bisect_left(self.starts, int(start * 1000))
+        hi = bisect_left(self.starts, int(end * 1000))
+        return self.lines(lo, hi)
+
+    def load(self) -> Transcript:
+        transcript = self.lines()
+        transcript.chapters = self.chapters
+        return transcript
+
+
+class TranscriptArchive:
+    """動画IDごとに .ytt を保存するフォルダ"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, video_id: str) -> Path:
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in video_id)
+        return self.directory / f"{safe_id}.ytt"
+
+    def save(self, video_id: str, title: str, transcript: Transcript, live_status: str = "") -> Path:
+        path = self.path_for(video_id)
+        write_transcript(path, transcript, title, live_status=live_status)
+        return path
+
+    def load(self, video_id: str) -> Optional[tuple]:
+        """保存済みなら (タイトル, Transcript) を返す（配信中などに保存した未確定の字幕は保存なし扱い）"""
+        path = self.path_for(video_id)
+        if not path.exists():
+            return None
+        with TranscriptFile(path) as f:
+            if f.live_status in PENDING_LIVE_STATUSES:
+                return None
+            return f.title, f.load()
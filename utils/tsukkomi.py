@@ -0,0 +1,145 @@
+# utils/tsukkomi.py
+"""
+ツッコミ分析（面白い表現・ボケ・ツッコミの抽出）のプロンプト・モデル選択の方針・候補行の事前抽出
+
+ツッコミ分析アプリ（app_tsukkomi.py）と、要約アプリの複数ジャンル同時実行の両方から使う。
+長い動画は字幕全体を送らず、score_lines の手がかり（笑い・拍手タグ、ツッコミの言い回し、感嘆・疑問、
+その動画で1回しか出てこない語の密度、話者の交代）で候補行を選び、前後の文脈と一緒に抜粋して送る。
+笑いタグを手がかりに使うため、事前抽出は字幕の正規化（utils/text_normalize）の前の行に対して行う。
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from utils.live import format_offset
+from utils.model_router import estimate_tokens
+
+TSUKKOMI_GENRE = "tsukkomi"
+TSUKKOMI_LABEL = "ツッコミ分析"
+
+# 基本 flash-lite、長い動画だけ flash に上げる（TSUKKOMI_MODEL を設定すればそのモデルに固定）
+TSUKKOMI_ROUTING = {
+    "model": "lite",
+    "upgrade_min_tokens": int(os.environ.get("TSUKKOMI_UPGRADE_TOKENS", 40000)),
+    "output_tokens": 2500,
+    "max_cost_usd": 0.05,
+}
+
+# 候補行の事前抽出: MIN_LINES 行以上の字幕だけ、上位 TOP_K 箇所を前後 CONTEXT_LINES 行付きで送る
+TSUKKOMI_PREFILTER = os.environ.get("TSUKKOMI_PREFILTER", "1") == "1"
+TSUKKOMI_TOP_K = int(os.environ.get("TSUKKOMI_TOP_K", 40))
+TSUKKOMI_CONTEXT_LINES = int(os.environ.get("TSUKKOMI_CONTEXT_LINES", 3))
+TSUKKOMI_PREFILTER_MIN_LINES = int(os.environ.get("TSUKKOMI_PREFILTER_MIN_LINES", 300))
+
+EXCERPT_GAP = "……（中略）……"
+_LAUGH_RE = re.compile(r"[\[［(（]\s*(?:笑い?|爆笑|拍手|歓声|どよめき)\s*[\]］)）]|[wｗ]{3,}|草$")
+_CUE_RE = re.compile(
+    "なんでやねん|なんでだよ|ちょっと待って|何それ|なにそれ|どういうこと|意味わから|おかしい|嘘でしょ|うそでしょ|"
+    "マジで|まじで|いやいや|ヤバい|やばい|ウケる|天才か|こわい|怖い|ちゃうねん|違うやろ|言い方|ツッコ"
+)
+_EXCLAIM_RE = re.compile(r"[!！?？]")
+_TURN_RE = re.compile(r"^\s*(?:>>|＞＞|[-－]\s|[(（][^)）]{1,8}[)）])")
+_WORD_RE = re.compile(r"[\u30a1-\u30fa\u30fc]{3,}|[\u4e00-\u9fff]{2,}|[A-Za-z]{3,}")
+
+
+def build_tsukkomi_prompt(text: str, title: str, excerpt: bool = False) -> str:
+    note = (f"\n※文字起こしは、面白い発言の候補になりそうな箇所を前後の文脈ごと抜き出したものです"
+            f"（「{EXCERPT_GAP}」は省略箇所）。\n" if excerpt else "")
+    return f"""
+あなたはプロのお笑い評論家であり、言葉遊びの達人です。
+YouTube動画「{title}」の文字起こしから、独創的な表現やツッコミを抽出してください。
+{note}
+【抽出・分析基準】
+1. 独特な言語センス（造語、比喩、パワーワード）
+2. 狂気を感じるほどの妄想トークやボケ
+3. 鋭いツッコミや、斜め上の視点からの感想
+
+【出力フォーマット】
+Markdown形式で出力してください。
+特に「フレーズ」「分類」「なぜ面白いのか（背景・言葉遊びの解説）」を明確にしてください。
+テーブル形式を活用すると見やすいです。
+
+--- 文字起こし開始 ---
+{text}
+--- 文字起こし終了 ---
+"""
+
+
+def score_lines(lines: Sequence[str]) -> List[float]:
+    """各行の「面白い発言の候補らしさ」を手がかりの重み付き和で返す"""
+    words = [_WORD_RE.findall(line) for line in lines]
+    counts = Counter(w for ws in words for w in ws)
+    scores = [0.0] * len(lines)
+    for i, line in enumerate(lines):
+        if _LAUGH_RE.search(line):
+            # 笑い・拍手は直前の発言に対する反応なので、直前の行を重く見る
+            scores[i] += 1.5
+            if i >= 1:
+                scores[i - 1] += 3.0
+            if i >= 2:
+                scores[i - 2] += 1.5
+        scores[i] += 1.5 * len(_CUE_RE.findall(line))
+        scores[i] += 0.5 * min(len(_EXCLAIM_RE.findall(line)), 3)
+        if words[i]:
+            # その動画で1回しか出てこない語（造語・パワーワードの候補）の密度。長いカタカナ語は重くする
+            rare = sum(1.5 if len(w) >= 5 and "ァ" <= w[0] <= "ヺ" else 1.0 for w in words[i] if counts[w] == 1)
+            scores[i] += 2.0 * rare / len(words[i])
+        if _TURN_RE.match(line):
+            scores[i] += 1.0
+        elif len(line) <= 10 and 0 < i < len(lines) - 1 and len(lines[i - 1]) <= 10 and len(lines[i + 1]) <= 10:
+            scores[i] += 0.5  # 短い発言が続く掛け合い
+    return scores
+
+
+def select_windows(scores: Sequence[float], top_k: int, context: int) -> List[Tuple[int, int]]:
+    """スコアの高い行から順に前後 context 行の窓を top_k 個選び、重なる窓をまとめて [lo, hi) の昇順で返す"""
+    taken = [False] * len(scores)
+    windows = []
+    for i in sorted(range(len(scores)), key=lambda i: scores[i], reverse=True):
+        if len(windows) >= top_k or scores[i] <= 0:
+            break
+        if taken[i]:
+            continue
+        lo, hi = max(0, i - context), min(len(scores), i + context + 1)
+        for j in range(lo, hi):
+            taken[j] = True
+        windows.append((lo, hi))
+
+    merged = []
+    for lo, hi in sorted(windows):
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(hi, merged[-1][1]))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def prefilter_lines(lines: Sequence[str], starts: Optional[Sequence[int]] = None, top_k: int = TSUKKOMI_TOP_K,
+                    context: int = TSUKKOMI_CONTEXT_LINES,
+                    clean: Optional[Callable[[str], str]] = None) -> Tuple[str, dict]:
+    """
+    候補の窓だけを抜き出したテキストと報告を返す
+    starts（各行の開始ミリ秒）があれば窓の先頭に [t=H:MM:SS] を付ける。clean は抜き出した各行に適用する（正規化など）
+    """
+    windows = select_windows(score_lines(lines), top_k, context)
+    parts, sent = [], 0
+    for lo, hi in windows:
+        chunk = [clean(line) if clean else line for line in lines[lo:hi]]
+        chunk = [line for line in chunk if line.strip()]
+        if not chunk:
+            continue
+        if starts is not None:
+            chunk[0] = f"[t={format_offset(starts[lo] / 1000)}] {chunk[0]}"
+        parts.append("\n".join(chunk))
+        sent += hi - lo
+    text = f"\n{EXCERPT_GAP}\n".join(parts)
+    report = {
+        "lines_total": len(lines),
+        "lines_sent": sent,
+        "windows": len(parts),
+        "tokens_before": estimate_tokens("\n".join(lines)),
+        "tokens_after": estimate_tokens(text),
+    }
+    return text, report
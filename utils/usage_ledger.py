@@ -0,0 +1,170 @@
+# utils/usage_ledger.py
+"""
+Gemini / TTS の利用記録（トークン数・モデル・APIキー・応答時間・推定費用）
+
+API 呼び出しごとに1行を SQLite に追記し、日別・ジャンル別・チャンネル別・APIキー別などで集計する。
+ジャンル × 工程（summary / chapter / genre など）で集計すると、prompts.json のどのテンプレートが
+費用の大半を占めているかがわかる。
+費用は utils/model_router の単価による推定で、無料枠のキーでも同じ単価で計算する。
+コンテキストキャッシュから読んだ入力トークンは CACHED_INPUT_RATE 倍の単価で計算する（保存料金は含まない）。
+Batch API 経由の呼び出しは全体を BATCH_PRICE_RATE 倍で計算する。
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from utils.model_router import MODELS, tier_of
+
+# TTS の料金（100万文字あたりのUSD）。音声名に含まれる種類で決める
+TTS_PRICE_PER_M_CHARS = {"Standard": 4.0, "Wavenet": 16.0, "Neural2": 16.0, "Chirp": 30.0}
+CACHED_INPUT_RATE = 0.25
+BATCH_PRICE_RATE = 0.5
+GROUP_COLUMNS = ("day", "genre", "channel", "key_name", "model", "stage", "kind")
+
+
+def gemini_usage(response) -> Tuple[int, int]:
+    """応答の usage_metadata から (入力トークン数, 出力トークン数) を取り出す（思考トークンは出力に含める）"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    output = (getattr(usage, "candidates_token_count", 0) or 0) + (getattr(usage, "thoughts_token_count", 0) or 0)
+    return prompt, output
+
+
+def cached_token_count(response) -> int:
+    """入力トークンのうちコンテキストキャッシュから読んだ分"""
+    usage = getattr(response, "usage_metadata", None)
+    return (getattr(usage, "cached_content_token_count", 0) or 0) if usage is not None else 0
+
+
+def gemini_cost(model: str, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0,
+                batch: bool = False) -> Optional[float]:
+    """単価が登録されていないモデルは None（prompt_tokens はキャッシュ分を含む）"""
+    tier = tier_of(model)
+    if tier is None:
+        return None
+    spec = MODELS[tier]
+    fresh = prompt_tokens - cached_tokens
+    cost = (fresh * spec["input_per_m"] + cached_tokens * spec["input_per_m"] * CACHED_INPUT_RATE
+            + output_tokens * spec["output_per_m"]) / 1_000_000
+    return cost * BATCH_PRICE_RATE if batch else cost
+
+
+def tts_cost(voice_name: str, characters: int) -> Optional[float]:
+    for kind, price in TTS_PRICE_PER_M_CHARS.items():
+        if kind in voice_name:
+            return characters * price / 1_000_000
+    return None
+
+
+class UsageLedger:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS usage (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                day TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                model TEXT NOT NULL,
+                key_name TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL,
+                characters INTEGER NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                cost_usd REAL,
+                ok INTEGER NOT NULL,
+                error TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS usage_day ON usage (day);
+        """)
+        # キャッシュ分の列がない古いDBに列を追加する
+        columns = {row[1] for row in self._conn().execute("PRAGMA table_info(usage)")}
+        if "cached_tokens" not in columns:
+            self._conn().execute("ALTER TABLE usage ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, kind: str, model: str, key_name: str = "", stage: str = "", genre: str = "",
+               video_id: str = "", channel: str = "", job_id: str = "", prompt_tokens: int = 0,
+               cached_tokens: int = 0, output_tokens: int = 0, characters: int = 0, latency_ms: int = 0,
+               cost_usd: Optional[float] = None, ok: bool = True, error: str = ""):
+        """1回の API 呼び出しを記録する（kind は gemini / tts）"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO usage (ts, day, kind, model, key_name, stage, genre, video_id, channel, job_id, "
+                "prompt_tokens, cached_tokens, output_tokens, characters, latency_ms, cost_usd, ok, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, time.strftime("%Y-%m-%d", time.localtime(now)), kind, model, key_name, stage, genre,
+                 video_id, channel, job_id, prompt_tokens, cached_tokens, output_tokens, characters, int(latency_ms),
+                 cost_usd, int(ok), error[:500]),
+            )
+
+    def aggregate(self, group_by: List[str], since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        """
+        group_by の列（GROUP_COLUMNS のいずれか）ごとに件数・トークン数・費用を集計する
+        since / until は YYYY-MM-DD（両端を含む）。日別は日付順、それ以外は費用の大きい順
+        """
+        columns = [c for c in group_by if c in GROUP_COLUMNS] or ["day"]
+        where, params = [], []
+        if since:
+            where.append("day >= ?")
+            params.append(since)
+        if until:
+            where.append("day <= ?")
+            params.append(until)
+        cols = ", ".join(columns)
+        order = "day DESC" if columns == ["day"] else "cost_usd DESC"
+        rows = self._conn().execute(
+            f"SELECT {cols}, COUNT(*), SUM(1 - ok), SUM(prompt_tokens), SUM(cached_tokens), SUM(output_tokens), "
+            f"SUM(characters), SUM(cost_usd) AS cost_usd, AVG(latency_ms) FROM usage "
+            f"{'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY {cols} ORDER BY {order}",
+            params,
+        ).fetchall()
+        results = []
+        for row in rows:
+            item = dict(zip(columns, row[:len(columns)]))
+            calls, errors, prompt_tokens, cached_tokens, output_tokens, characters, cost, latency = row[len(columns):]
+            item.update({
+                "calls": calls,
+                "errors": errors,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "output_tokens": output_tokens,
+                "characters": characters,
+                "cost_usd": round(cost or 0.0, 4),
+                "avg_latency_ms": int(latency or 0),
+            })
+            results.append(item)
+        return results
+
+    def totals(self, since: Optional[str] = None, until: Optional[str] = None) -> dict:
+        """期間全体の合計（aggregate と同じ項目）"""
+        rows = self.aggregate(["kind"], since, until)
+        total = {"calls": 0, "errors": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "characters": 0,
+                 "cost_usd": 0.0}
+        for row in rows:
+            for key in total:
+                total[key] += row[key]
+        total["cost_usd"] = round(total["cost_usd"], 4)
+        return total
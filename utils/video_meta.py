@@ -0,0 +1,113 @@
+# utils/video_meta.py
+"""
+動画メタデータ（yt-dlp の info JSON）の取得と要約
+
+yt-dlp -J の出力は数百KBあるため、後段の判断に使う項目だけを小さな dict にしてキャッシュする:
+タイトル・チャンネル・投稿日・長さ・チャプター・配信状態・手動/自動字幕の言語一覧。
+取得したジョブでは生の info JSON も作業フォルダに残し、字幕ダウンロード時に
+--load-info-json で渡すことで yt-dlp の動画解析（extraction）を1回で済ませる。
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+INFO_JSON_NAME = "info.json"
+# 字幕の言語の優先順位（カンマ区切り）
+CAPTION_LANGS = [lang.strip() for lang in os.getenv("CAPTION_LANGS", "ja,en").split(",") if lang.strip()]
+# 1 なら言語の優先順位より手動字幕を優先する（手動 ja > 手動 en > 自動 ja > 自動 en）
+CAPTION_PREFER_MANUAL = os.getenv("CAPTION_PREFER_MANUAL", "1") == "1"
+# 字幕がまだ確定していない配信状態（配信前・配信中・配信直後のアーカイブ処理中）
+PENDING_LIVE_STATUSES = ("is_live", "is_upcoming", "post_live")
+
+
+def build_metadata_cmd(clean_url: str) -> List[str]:
+    """メタデータ取得用の yt-dlp コマンド（標準出力に info JSON を出す）"""
+    cmd = [
+        "yt-dlp",
+        "--extractor-args", "youtube:player_client=web_creator,ios,android",
+        "--dump-single-json",
+        "--skip-download",
+        "--no-warnings",
+        clean_url,
+    ]
+    if os.path.exists("cookies.txt"):
+        cmd[1:1] = ["--cookies", "cookies.txt"]
+    return cmd
+
+
+def _caption_langs(tracks: dict) -> List[str]:
+    """vtt で取得できる字幕の言語一覧"""
+    return sorted(lang for lang, formats in (tracks or {}).items()
+                  if any(f.get("ext") == "vtt" for f in formats or []))
+
+
+def summarize_info(info: dict) -> dict:
+    """info JSON から後段で使う項目だけを取り出す"""
+    return {
+        "video_id": info.get("id"),
+        "title": info.get("title") or info.get("id") or "",
+        "channel": info.get("channel") or info.get("uploader") or "",
+        "channel_id": info.get("channel_id") or "",
+        "upload_date": info.get("upload_date") or "",  # YYYYMMDD
+        "duration": info.get("duration") or 0,  # 秒（配信中は 0）
+        "live_status": info.get("live_status") or "",
+        "language": info.get("language") or "",
+        "chapters": [
+            {"title": c.get("title") or f"チャプター{i + 1}", "start": float(c["start_time"]), "end": float(c["end_time"])}
+            for i, c in enumerate(info.get("chapters") or [])
+        ],
+        "manual_captions": _caption_langs(info.get("subtitles")),
+        "auto_captions": _caption_langs(info.get("automatic_captions")),
+    }
+
+
+def format_upload_date(upload_date: str) -> str:
+    """YYYYMMDD → YYYY-MM-DD"""
+    if len(upload_date) != 8:
+        return upload_date
+    return f"{upload_date[:4]}-{upload_date[4:6]}-{upload_date[6:]}"
+
+
+def info_json_path(workspace: Path) -> Path:
+    return Path(workspace) / INFO_JSON_NAME
+
+
+def choose_caption_track(metadata: dict, langs: Optional[List[str]] = None,
+                         prefer_manual: bool = CAPTION_PREFER_MANUAL) -> Optional[Tuple[str, bool]]:
+    """
+    メタデータの字幕一覧から取得する1トラックを選び、(言語コード, 自動字幕か) を返す
+    自動字幕は翻訳ではない元言語のトラック（yt-dlp の "xx-orig"）があればそれを使う
+    """
+    langs = langs or CAPTION_LANGS
+    manual = metadata.get("manual_captions") or []
+    auto = metadata.get("auto_captions") or []
+
+    def find(lang: str, is_auto: bool) -> Optional[str]:
+        if not is_auto:
+            return lang if lang in manual else None
+        for code in (f"{lang}-orig", lang):
+            if code in auto:
+                return code
+        return None
+
+    if prefer_manual:
+        order = [(lang, False) for lang in langs] + [(lang, True) for lang in langs]
+    else:
+        order = [(lang, is_auto) for lang in langs for is_auto in (False, True)]
+    for lang, is_auto in order:
+        code = find(lang, is_auto)
+        if code:
+            return code, is_auto
+    return None
+
+
+def caption_track_args(track: Optional[Tuple[str, bool]]) -> List[str]:
+    """
+    yt-dlp の字幕指定オプション
+    track が決まっていればその1トラックだけ、未定（メタデータなし）なら優先言語の自動字幕をまとめて取得する
+    """
+    if track is None:
+        return ["--write-auto-sub", "--sub-lang", ",".join(CAPTION_LANGS)]
+    lang, is_auto = track
+    return ["--write-auto-sub" if is_auto else "--write-sub", "--sub-lang", lang]
@@ -0,0 +1,61 @@
+"""
+登録チャンネルの新着動画を RSS で監視し、共有キューに要約ジョブを登録するデーモン
+
+監視対象は prompts.json の各ジャンルの "channels"（チャンネルID）で、そのジャンルで要約する。
+キューの処理は worker.py（または EMBEDDED_WORKERS 付きの app.py）が行う。
+
+起動: python watcher.py [--interval 900] [--concurrency 8]
+テスト: python scripts/fake_feed_server.py を起動し --feed-base http://127.0.0.1:8765/feeds/videos.xml を指定
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+from utils.backend import get_backend
+from utils.feed_watch import FEED_BASE, FeedStateStore, FeedWatcher, channels_from_prompts
+
+DEFAULT_STATE_DB = Path.home() / "YouTubeInsightGen_venv" / "watcher.db"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャンネル新着動画の監視デーモン")
+    parser.add_argument("--prompts", default="prompts.json", help="チャンネルとジャンルの対応を読むファイル")
+    parser.add_argument("--interval", type=float, default=900, help="巡回間隔（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に取得するフィード数")
+    parser.add_argument("--feed-base", default=os.getenv("FEED_BASE", FEED_BASE), help="フィードのURL（テスト用に差し替え可）")
+    parser.add_argument("--state-db", default=os.getenv("WATCHER_DB", str(DEFAULT_STATE_DB)), help="既読・ETagの保存先")
+    parser.add_argument("--max-queue-depth", type=int, default=int(os.getenv("MAX_SHARED_QUEUE_DEPTH", 500)),
+                        help="キューがこの件数以上なら登録を見送る")
+    parser.add_argument("--backfill", action="store_true", help="初回にフィード上の既存動画もキューに登録する")
+    parser.add_argument("--once", action="store_true", help="1巡だけ確認して終了する")
+    args = parser.parse_args()
+
+    with open(args.prompts, "r", encoding="utf-8") as f:
+        channels = channels_from_prompts(json.load(f))
+    if not channels:
+        print(f"⚠️ {args.prompts} に監視対象のチャンネル（\"channels\"）がありません")
+        return
+    print(f"📡 {len(channels)} チャンネルを監視します（間隔 {args.interval}秒, 並列 {args.concurrency}）")
+
+    watcher = FeedWatcher(
+        get_backend(),
+        FeedStateStore(Path(args.state_db)),
+        channels,
+        feed_base=args.feed_base,
+        concurrency=args.concurrency,
+        max_queue_depth=args.max_queue_depth,
+        backfill=args.backfill,
+    )
+    if args.once:
+        watcher.run_once()
+        return
+    try:
+        watcher.run_forever(args.interval)
+    except KeyboardInterrupt:
+        print("👋 監視を停止しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+共有キューから要約ジョブを取り出して処理するワーカー
+
+SUMMARY_BACKEND を揃えれば複数ノードで同時に起動でき、
+字幕・要約のキャッシュと配信ロックにより同じ動画の Gemini 呼び出しやメールは重複しない。
+Webサーバーと同じプロセスで動かす場合は app.py を EMBEDDED_WORKERS=n で起動する。
+
+起動: python worker.py [--concurrency 2]
+"""
+
+import argparse
+import threading
+
+from app import queue_worker_loop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共有キューの要約ワーカー")
+    parser.add_argument("--concurrency", type=int, default=2, help="このノードで同時に処理するジョブ数")
+    args = parser.parse_args()
+
+    threads = [threading.Thread(target=queue_worker_loop, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        print("👋 ワーカーを停止しました")
+
+
+if __name__ == "__main__":
+    main()